@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+SSE 廣播效能測試
+
+建立大量訂閱者後量測單次廣播、訂閱者加入／離開、廣播期間成員持續
+變動，以及訂閱者依 session_id 篩選時的耗時。
+
+    python examples/benchmark_broadcast.py --subscribers 10000
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+# 添加專案根目錄到路徑
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from src.events import build_filters
+from src.functions.server import EventManager
+
+
+def report(name: str, seconds: float, count: int) -> None:
+    print(f"{name:<24} {seconds / count * 1e6:10.1f} µs/次  （共 {count} 次）")
+
+
+async def run(subscribers: int, broadcasts: int, sessions: int) -> None:
+    manager = EventManager(queue_size=broadcasts + 1)
+    event = {
+        "type": "new_conversation",
+        "data": {"id": 1, "role": "user", "content": "x" * 200},
+    }
+
+    started = time.perf_counter()
+    clients = [await manager.register() for _ in range(subscribers)]
+    report("register", time.perf_counter() - started, subscribers)
+
+    started = time.perf_counter()
+    for _ in range(broadcasts):
+        await manager.broadcast(event)
+    elapsed = time.perf_counter() - started
+    report(f"broadcast × {subscribers}", elapsed, broadcasts)
+    print(f"{'':<24} {elapsed / broadcasts / subscribers * 1e9:10.1f} ns/訂閱者")
+
+    # 每次廣播之間都有一個客戶端離開、一個客戶端加入
+    started = time.perf_counter()
+    for i in range(broadcasts):
+        await manager.unregister(clients[i])
+        clients.append(await manager.register())
+        await manager.broadcast(event)
+    report("broadcast + churn", time.perf_counter() - started, broadcasts)
+
+    started = time.perf_counter()
+    for client in clients:
+        await manager.unregister(client)
+    report("unregister", time.perf_counter() - started, len(clients))
+
+    # 訂閱者平均分散在各個 session，每則事件只屬於其中一個 session
+    manager = EventManager(queue_size=broadcasts + 1)
+    for i in range(subscribers):
+        await manager.register(filters=build_filters(session_id=f"s{i % sessions}"))
+    started = time.perf_counter()
+    for i in range(broadcasts):
+        await manager.broadcast(
+            {
+                "type": "new_conversation",
+                "data": {
+                    **event["data"],
+                    "extra_metadata": {"session_id": f"s{i % sessions}"},
+                },
+            }
+        )
+    report(f"filtered × {sessions} sessions", time.perf_counter() - started, broadcasts)
+    print(f"{'':<24} {manager.stats()['deliveries'] / broadcasts:10.1f} 個訂閱者/次")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="SSE 廣播效能測試")
+    parser.add_argument("--subscribers", type=int, default=10000, help="訂閱者數量")
+    parser.add_argument("--broadcasts", type=int, default=200, help="廣播次數")
+    parser.add_argument(
+        "--sessions", type=int, default=1000, help="篩選測試中的 session 數量"
+    )
+    args = parser.parse_args()
+    asyncio.run(run(args.subscribers, args.broadcasts, max(1, args.sessions)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+群組提交寫入效能測試
+
+以多個並發寫入者寫入對話記錄，比較每筆各自提交（GroupCommitWriter 之前的
+做法）與 GroupCommitWriter 合併提交的每秒寫入筆數。
+
+預設使用 PRAGMA synchronous=FULL，每次提交都等待 fsync，最能反映群組提交
+省下的成本。開發機上 64 個寫入者、4000 筆的結果：
+
+- synchronous=FULL：約 15–19 倍
+- synchronous=NORMAL（伺服器預設，WAL 模式提交時不 fsync）：約 6 倍
+
+    python examples/benchmark_group_commit.py --writers 64 --rows 4000
+    python examples/benchmark_group_commit.py --synchronous NORMAL
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+# 添加專案根目錄到路徑
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from src.storage import DEFAULT_PRAGMAS, DatabaseExecutor, GroupCommitWriter, SQLitePool
+from src.storage.migrations import CONVERSATIONS_SCHEMA
+from src.storage.writer import INSERT_CONVERSATION_SQL
+
+
+def open_database(path: str, synchronous: str, pool_size: int):
+    """建立空的 conversations 資料表，返回連接池與執行層"""
+    pool = SQLitePool(
+        path,
+        pool_size=pool_size,
+        pragmas={**DEFAULT_PRAGMAS, "synchronous": synchronous},
+    )
+    with pool.connection() as conn:
+        conn.execute(CONVERSATIONS_SCHEMA)
+        conn.commit()
+    return pool, DatabaseExecutor(pool.connection, max_workers=pool_size)
+
+
+async def write_concurrently(insert, writers: int, rows: int) -> float:
+    """以 writers 個並發寫入者共寫入 rows 筆，返回耗時（秒）"""
+
+    async def writer(index: int) -> None:
+        for i in range(index, rows, writers):
+            await insert("user", f"message {i} " + "x" * 200, None)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(writer(index) for index in range(writers)))
+    return time.perf_counter() - started
+
+
+async def per_row_commits(
+    path: str, writers: int, rows: int, synchronous: str, pool_size: int
+) -> float:
+    """每筆記錄各自以一個交易寫入並提交，返回每秒寫入筆數"""
+    pool, executor = open_database(path, synchronous, pool_size)
+
+    async def insert(role, content, metadata):
+        def write(conn):
+            cursor = conn.execute(INSERT_CONVERSATION_SQL, (role, content, metadata))
+            conn.commit()
+            return cursor.lastrowid
+
+        return await executor.run(write)
+
+    try:
+        return rows / await write_concurrently(insert, writers, rows)
+    finally:
+        executor.shutdown()
+        pool.close()
+
+
+async def group_commits(
+    path: str, writers: int, rows: int, synchronous: str, pool_size: int
+) -> float:
+    """經由 GroupCommitWriter 寫入，返回每秒寫入筆數"""
+    pool, executor = open_database(path, synchronous, pool_size)
+    writer = GroupCommitWriter(executor.run)
+    try:
+        return rows / await write_concurrently(writer.insert, writers, rows)
+    finally:
+        await writer.stop()
+        executor.shutdown()
+        pool.close()
+
+
+async def compare(
+    writers: int, rows: int, synchronous: str = "FULL", pool_size: int = 4
+):
+    """在暫存目錄中依序執行兩種寫入方式，返回 (每筆提交, 群組提交) 的每秒寫入筆數"""
+    with tempfile.TemporaryDirectory() as directory:
+        baseline = await per_row_commits(
+            os.path.join(directory, "per_row.db"), writers, rows, synchronous, pool_size
+        )
+        grouped = await group_commits(
+            os.path.join(directory, "grouped.db"), writers, rows, synchronous, pool_size
+        )
+    return baseline, grouped
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="群組提交寫入效能測試")
+    parser.add_argument("--writers", type=int, default=64, help="並發寫入者數量")
+    parser.add_argument("--rows", type=int, default=4000, help="寫入的記錄數")
+    parser.add_argument(
+        "--synchronous",
+        default="FULL",
+        help="PRAGMA synchronous（FULL 或 NORMAL，預設 FULL）",
+    )
+    parser.add_argument("--pool-size", type=int, default=4, help="連接池與執行緒數量")
+    args = parser.parse_args()
+
+    baseline, grouped = asyncio.run(
+        compare(
+            max(1, args.writers),
+            max(1, args.rows),
+            args.synchronous,
+            max(1, args.pool_size),
+        )
+    )
+    print(f"{'每筆各自提交':<12} {baseline:10.0f} 筆/秒")
+    print(f"{'群組提交':<12} {grouped:10.0f} 筆/秒")
+    print(f"{'倍數':<12} {grouped / baseline:10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
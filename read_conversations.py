@@ -59,8 +59,16 @@ async def search_conversations(query, limit=10):
     print(f"\n🔍 搜尋關鍵字「{query}」的對話記錄")
     print("=" * 50)
 
+    # 由伺服器依索引中的命中位置返回已標示的片段，不必傳回完整內容
     result = await handle_call_tool(
-        "search_conversations", {"query": query, "limit": limit}
+        "search_conversations",
+        {
+            "query": query,
+            "limit": limit,
+            "snippets": True,
+            "highlight_start": "**",
+            "highlight_end": "**",
+        },
     )
 
     data = json.loads(result[0].text)
@@ -72,14 +80,9 @@ async def search_conversations(query, limit=10):
             print(
                 f"\n{i}. ID: {conv['id']} | 角色: {conv['role']} | 時間: {conv['timestamp']}"
             )
-            # 高亮顯示搜尋關鍵字
-            content = conv["content"]
-            if query.lower() in content.lower():
-                # 簡單的高亮顯示
-                highlighted = content.replace(query, f"**{query}**")
-                print(f"   內容: {highlighted}")
-            else:
-                print(f"   內容: {content}")
+            print(f"   內容（共 {conv['content_length']} 字）:")
+            for snippet in conv["snippets"]:
+                print(f"     {snippet['text']}")
 
             if conv.get("metadata"):
                 print(f"   元數據: {conv['metadata']}")
@@ -1,22 +1,187 @@
-from sqlalchemy import text
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
 
 # 從 sqlalchemy.ext.declarative 導入 declarative_base 已棄用，改用新的 2.0 API
-from sqlalchemy.orm import declarative_base
+from sqlalchemy.orm import Session, declarative_base
 
 # from sqlalchemy.orm import sessionmaker # 移除同步的 sessionmaker
 from sqlalchemy.ext.asyncio import (
+    AsyncSession,
     create_async_engine,
     async_sessionmaker,
 )  # 導入異步的引擎和 sessionmaker
 import os
+import threading
+import time
+from typing import Any, Dict, Optional
 
 # 從環境變數讀取資料庫URL，預設使用SQLite
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///:memory:")
 
-# 創建異步引擎
-engine = create_async_engine(DATABASE_URL)
+# 連接池設定（內存 SQLite 使用單一連接，不適用以下大小設定）
+DATABASE_POOL_SIZE = int(os.getenv("DATABASE_POOL_SIZE", "5"))
+DATABASE_MAX_OVERFLOW = int(os.getenv("DATABASE_MAX_OVERFLOW", "10"))
+DATABASE_POOL_TIMEOUT = float(os.getenv("DATABASE_POOL_TIMEOUT", "30"))
+DATABASE_POOL_PRE_PING = os.getenv("DATABASE_POOL_PRE_PING", "true").lower() in (
+    "1",
+    "true",
+    "yes",
+)
 
-# 創建異步 SessionLocal
-SessionLocal = async_sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def sqlite_file_path(database_url: str) -> Optional[str]:
+    """SQLite 檔案資料庫的路徑；其他資料庫或內存資料庫返回 None"""
+    url = make_url(database_url)
+    if url.get_backend_name() != "sqlite" or url.database in (None, "", ":memory:"):
+        return None
+    return url.database
+
+
+def engine_options(database_url: str) -> Dict[str, Any]:
+    """根據資料庫URL返回建立引擎所需的連接池參數"""
+    options: Dict[str, Any] = {"pool_pre_ping": DATABASE_POOL_PRE_PING}
+
+    url = make_url(database_url)
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        return options
+
+    options.update(
+        pool_size=DATABASE_POOL_SIZE,
+        max_overflow=DATABASE_MAX_OVERFLOW,
+        pool_timeout=DATABASE_POOL_TIMEOUT,
+    )
+    return options
+
+
+class PoolMetrics:
+    """記錄連接池的借出、歸還與等待時間"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.acquires = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def attach(self, sync_engine) -> None:
+        """在同步引擎的連接池上掛載事件監聽"""
+
+        @event.listens_for(sync_engine, "connect")
+        def on_connect(dbapi_connection, connection_record):
+            with self._lock:
+                self.connects += 1
+
+        @event.listens_for(sync_engine, "checkout")
+        def on_checkout(dbapi_connection, connection_record, connection_proxy):
+            with self._lock:
+                self.checkouts += 1
+
+        @event.listens_for(sync_engine, "checkin")
+        def on_checkin(dbapi_connection, connection_record):
+            with self._lock:
+                self.checkins += 1
+
+    def record_wait(self, seconds: float) -> None:
+        with self._lock:
+            self.acquires += 1
+            self.wait_time += seconds
+            self.max_wait_time = max(self.max_wait_time, seconds)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "connects": self.connects,
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "avg_wait_ms": (
+                    (self.wait_time / self.acquires * 1000) if self.acquires else 0.0
+                ),
+                "max_wait_ms": self.max_wait_time * 1000,
+            }
+
+
+# 創建整個程序共用的異步引擎
+engine = create_async_engine(DATABASE_URL, **engine_options(DATABASE_URL))
+pool_metrics = PoolMetrics()
+pool_metrics.attach(engine.sync_engine)
+
+# 創建異步 SessionLocal（HTTP 端點與工具調用共用）
+SessionLocal = async_sessionmaker(
+    autocommit=False, autoflush=False, expire_on_commit=False, bind=engine
+)
 
 Base = declarative_base()
+
+
+async def open_session(session_factory: async_sessionmaker = None) -> AsyncSession:
+    """建立會話並立即借出連接，同時記錄等待連接的時間"""
+    session = (session_factory or SessionLocal)()
+    started = time.perf_counter()
+    try:
+        await session.connection()
+    except Exception:
+        await session.close()
+        raise
+    pool_metrics.record_wait(time.perf_counter() - started)
+    return session
+
+
+def get_pool_stats() -> Dict[str, Any]:
+    """返回共用引擎的連接池狀態與統計"""
+    pool = engine.pool
+    stats = {"pool": type(pool).__name__, **pool_metrics.snapshot()}
+    if hasattr(pool, "size"):
+        stats.update(
+            size=pool.size(),
+            checked_in=pool.checkedin(),
+            checked_out=pool.checkedout(),
+            overflow=pool.overflow(),
+        )
+    return stats
+
+
+# session.info 中標記本次交易有寫入的鍵
+WRITES_KEY = "has_writes"
+
+
+def mark_written(session: Session) -> None:
+    """標記 session 的交易有寫入（用於不經過 ORM 的驅動層寫入）"""
+    session.info[WRITES_KEY] = True
+
+
+def install_invalidation_hooks(cache, session_class=Session) -> None:
+    """
+    交易有寫入並提交後呼叫 cache.invalidate()
+
+    ORM 的 flush 與 INSERT / UPDATE / DELETE 語句會自動標記，驅動層寫入需
+    呼叫 mark_written()。回滾時清除標記。
+    """
+
+    @event.listens_for(session_class, "after_flush")
+    def mark_flush(session, flush_context):
+        mark_written(session)
+
+    @event.listens_for(session_class, "do_orm_execute")
+    def mark_statement(orm_execute_state):
+        if (
+            orm_execute_state.is_insert
+            or orm_execute_state.is_update
+            or orm_execute_state.is_delete
+        ):
+            mark_written(orm_execute_state.session)
+
+    @event.listens_for(session_class, "after_commit")
+    def invalidate_after_commit(session):
+        if session.info.pop(WRITES_KEY, False):
+            cache.invalidate()
+
+    @event.listens_for(session_class, "after_rollback")
+    def clear_after_rollback(session):
+        session.info.pop(WRITES_KEY, None)
+
+
+async def dispose_engine() -> None:
+    """關閉共用引擎的所有連接（應用程式關閉時呼叫）"""
+    await engine.dispose()
@@ -0,0 +1,25 @@
+# 即時事件推送（供 SSE 與 WebSocket 端點使用）
+from src.events.bus import (
+    EVENT_BUS_BACKENDS,
+    LocalEventBus,
+    SQLiteEventBus,
+    create_event_bus,
+)
+from src.events.codec import (
+    WS_ENCODINGS,
+    decode_message,
+    encode_frame_for,
+    encode_message,
+    msgpack_available,
+)
+from src.events.dispatcher import EventDispatcher, defer_event, install_commit_hooks
+from src.events.registry import SubscriberRegistry, build_filters, event_keys
+from src.events.replay import ReplayBuffer
+from src.events.subscriber import (
+    OVERFLOW_POLICIES,
+    Subscriber,
+    encode_frame,
+    frame_event_id,
+    merge_frames,
+    pack_frames,
+)
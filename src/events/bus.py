@@ -0,0 +1,258 @@
+"""
+跨工作程序的事件匯流排
+
+以多個 uvicorn 工作程序執行時，每個程序各有自己的 EventManager，某個程序
+寫入的對話必須也送到連線在其他程序上的客戶端。派送器把事件交給匯流排的
+publish()，由匯流排決定如何送到各程序的廣播函數：
+
+- local：單一程序，直接呼叫本程序的廣播函數（預設）
+- sqlite：不需要外部服務的變更記錄。事件先送給本程序的客戶端，再以批次
+  附加到共用 SQLite 檔案的 event_log 表；每個程序定期讀取其他程序附加的
+  新記錄並廣播，舊記錄定期刪除
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from src.storage.pool import pragmas_from_env
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[Dict[str, Any]], Awaitable[None]]
+
+EVENT_BUS_BACKENDS = ("local", "sqlite")
+
+EVENT_LOG_SCHEMA = """
+CREATE TABLE IF NOT EXISTS event_log (
+    id INTEGER PRIMARY KEY,
+    origin TEXT NOT NULL,
+    event TEXT NOT NULL,
+    created_at REAL NOT NULL
+)
+"""
+
+
+class LocalEventBus:
+    """單一程序的匯流排，直接交給本程序的廣播函數"""
+
+    backend = "local"
+
+    def __init__(self, handler: Handler):
+        self.handler = handler
+        self._published = 0
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    async def publish(self, event: Dict[str, Any]) -> None:
+        self._published += 1
+        await self.handler(event)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.backend, "published": self._published}
+
+
+class SQLiteEventBus:
+    """以共用 SQLite 檔案作為變更記錄的匯流排，每個工作程序各建立一個實例"""
+
+    backend = "sqlite"
+
+    def __init__(
+        self,
+        handler: Handler,
+        path: str,
+        poll_interval: float = 0.05,
+        batch_size: int = 500,
+        retain: int = 10000,
+    ):
+        """
+        參數:
+        - handler: 本程序的廣播函數（例如 EventManager.broadcast）
+        - path: 所有工作程序共用的 SQLite 檔案
+        - poll_interval: 讀取其他程序新記錄的間隔（秒）
+        - batch_size: 每次寫入或讀取最多處理的記錄數
+        - retain: event_log 保留的最近記錄數
+        """
+        self.handler = handler
+        self.path = path
+        self.poll_interval = max(0.001, poll_interval)
+        self.batch_size = max(1, batch_size)
+        self.retain = max(self.batch_size, retain)
+        # 同一檔案中各程序的識別，讀取時略過自己附加的記錄
+        self.origin = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+        # 寫入與讀取各用一個連接，分別只在寫入任務與讀取任務的執行緒呼叫中使用
+        self._writer: Optional[sqlite3.Connection] = None
+        self._reader: Optional[sqlite3.Connection] = None
+        self._pending: List[Tuple[str, str, float]] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        self._tail_task: Optional[asyncio.Task] = None
+        # 執行緒中進行的讀取；取消 _tail 不會中止執行緒，關閉連接前須等它結束
+        self._reading: Optional[asyncio.Future] = None
+        self._last_id = 0
+
+        # 統計資訊
+        self._published = 0
+        self._written = 0
+        self._flushes = 0
+        self._received = 0
+        self._missed = 0
+        self._failed = 0
+        self._max_lag = 0.0
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        for name, value in pragmas_from_env().items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def _open(self) -> int:
+        """建立 event_log 表並返回目前最新的記錄 ID，只轉送啟動後附加的事件"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._writer = self._connect()
+        self._writer.execute(EVENT_LOG_SCHEMA)
+        self._writer.commit()
+        self._reader = self._connect()
+        return self._reader.execute(
+            "SELECT COALESCE(MAX(id), 0) FROM event_log"
+        ).fetchone()[0]
+
+    async def start(self) -> None:
+        """開啟共用檔案並開始讀取其他程序附加的事件"""
+        if self._tail_task is not None and not self._tail_task.done():
+            return
+        if self._writer is None:
+            self._last_id = await asyncio.to_thread(self._open)
+        self._tail_task = asyncio.get_running_loop().create_task(self._tail())
+
+    async def stop(self) -> None:
+        """寫出尚未附加的事件後停止讀取並關閉連接"""
+        if self._flush_task is not None and not self._flush_task.done():
+            await self._flush_task
+        if self._tail_task is not None:
+            self._tail_task.cancel()
+            try:
+                await self._tail_task
+            except asyncio.CancelledError:
+                pass
+            self._tail_task = None
+        if self._reading is not None:
+            await asyncio.wait([self._reading])
+            self._reading = None
+        for conn in (self._writer, self._reader):
+            if conn is not None:
+                conn.close()
+        self._writer = self._reader = None
+
+    async def publish(self, event: Dict[str, Any]) -> None:
+        """先送給本程序的客戶端，再排入批次附加到變更記錄"""
+        self._published += 1
+        await self.handler(event)
+        self._pending.append((self.origin, json.dumps(event), time.time()))
+        if self._flush_task is None or self._flush_task.done():
+            if self._writer is None:
+                await self.start()
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush())
+
+    def _write(self, rows: List[Tuple[str, str, float]]) -> None:
+        conn = self._writer
+        with conn:
+            conn.executemany(
+                "INSERT INTO event_log (origin, event, created_at) VALUES (?, ?, ?)",
+                rows,
+            )
+            # 每寫入約 batch_size 筆清除一次舊記錄
+            last_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+            if last_id // self.batch_size != (last_id - len(rows)) // self.batch_size:
+                conn.execute(
+                    "DELETE FROM event_log WHERE id <= ?", (last_id - self.retain,)
+                )
+
+    async def _flush(self) -> None:
+        """以單一交易附加累積的事件，寫入期間新到的事件留待下一批"""
+        while self._pending:
+            rows = self._pending[: self.batch_size]
+            del self._pending[: self.batch_size]
+            try:
+                await asyncio.to_thread(self._write, rows)
+            except Exception:
+                self._failed += len(rows)
+                logger.exception("寫入事件變更記錄失敗")
+            else:
+                self._written += len(rows)
+                self._flushes += 1
+
+    def _read(self, after: int) -> List[Tuple[int, str, str, float]]:
+        return self._reader.execute(
+            "SELECT id, origin, event, created_at FROM event_log WHERE id > ? ORDER BY id LIMIT ?",
+            (after, self.batch_size),
+        ).fetchall()
+
+    async def _tail(self) -> None:
+        """定期讀取新記錄，將其他程序附加的事件交給本程序的廣播函數"""
+        while True:
+            self._reading = asyncio.ensure_future(
+                asyncio.to_thread(self._read, self._last_id)
+            )
+            try:
+                rows = await asyncio.shield(self._reading)
+            except Exception:
+                logger.exception("讀取事件變更記錄失敗")
+                rows = []
+            if rows and rows[0][0] > self._last_id + 1:
+                # 落後超過 retain 筆，中間的記錄已被清除
+                self._missed += rows[0][0] - self._last_id - 1
+            for row_id, origin, payload, created_at in rows:
+                self._last_id = row_id
+                if origin == self.origin:
+                    continue
+                self._received += 1
+                self._max_lag = max(self._max_lag, time.time() - created_at)
+                try:
+                    await self.handler(json.loads(payload))
+                except Exception:
+                    self._failed += 1
+                    logger.exception("轉送事件失敗")
+            if len(rows) < self.batch_size:
+                await asyncio.sleep(self.poll_interval)
+
+    def stats(self) -> Dict[str, Any]:
+        """返回附加、轉送與延遲統計"""
+        return {
+            "backend": self.backend,
+            "path": self.path,
+            "origin": self.origin,
+            "published": self._published,
+            "pending": len(self._pending),
+            "written": self._written,
+            "flushes": self._flushes,
+            "received": self._received,
+            "missed": self._missed,
+            "failed": self._failed,
+            "last_id": self._last_id,
+            "max_lag_ms": self._max_lag * 1000,
+        }
+
+
+def create_event_bus(
+    backend: str, handler: Handler, path: str = "data/events.db", **options: Any
+):
+    """依名稱建立匯流排；未知的名稱拋出 ValueError"""
+    if backend == "local":
+        return LocalEventBus(handler)
+    if backend == "sqlite":
+        return SQLiteEventBus(handler, path, **options)
+    raise ValueError(
+        f"未知的事件匯流排: {backend}（可用: {', '.join(EVENT_BUS_BACKENDS)}）"
+    )
@@ -0,0 +1,78 @@
+"""
+WebSocket 訊息編碼
+
+訂閱者緩衝區中放的是 SSE 位元組（見 src.events.subscriber），WebSocket 連線
+從中取出 JSON 部分以文字訊息送出，或轉為 MessagePack 以二進位訊息送出。
+同一則廣播由所有客戶端共用同一個位元組物件，轉換結果以 LRU 快取，每則事件
+只轉換一次。MessagePack 為選用相依套件（pip install msgpack）。
+"""
+
+import json
+from functools import lru_cache
+from typing import Any, Dict, Union
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+WS_ENCODINGS = ("json", "msgpack")
+
+# 快取最近轉換過的訊息數
+_CACHE_SIZE = 4096
+
+
+def msgpack_available() -> bool:
+    return msgpack is not None
+
+
+def frame_payload(message: bytes) -> bytes:
+    """取出 SSE 訊息中的 JSON 部分"""
+    return message[message.index(b"data: ") + 6 : -2]
+
+
+@lru_cache(maxsize=_CACHE_SIZE)
+def frame_to_text(message: bytes) -> str:
+    """SSE 訊息轉為 WebSocket 文字訊息"""
+    return frame_payload(message).decode("utf-8")
+
+
+@lru_cache(maxsize=_CACHE_SIZE)
+def frame_to_msgpack(message: bytes) -> bytes:
+    """SSE 訊息轉為 MessagePack"""
+    return msgpack.packb(json.loads(frame_payload(message)))
+
+
+def encode_frame_for(message: bytes, encoding: str) -> Union[str, bytes]:
+    """將訂閱者緩衝區中的訊息轉為指定編碼的 WebSocket 訊息"""
+    if encoding == "msgpack":
+        return frame_to_msgpack(message)
+    return frame_to_text(message)
+
+
+def encode_message(message: Dict[str, Any], encoding: str) -> Union[str, bytes]:
+    """編碼伺服器送出的控制訊息（subscribed、error 等）"""
+    if encoding == "msgpack":
+        return msgpack.packb(message)
+    return json.dumps(message)
+
+
+def decode_message(data: Union[str, bytes]) -> Dict[str, Any]:
+    """
+    解碼客戶端送來的控制訊息：文字訊息為 JSON，二進位訊息為 MessagePack（未安裝時視為 JSON）
+
+    內容不是物件時拋出 ValueError。
+    """
+    if isinstance(data, bytes) and msgpack is not None:
+        try:
+            message = msgpack.unpackb(data)
+        except Exception as e:
+            raise ValueError(f"無法解碼的訊息: {e}")
+    else:
+        try:
+            message = json.loads(data)
+        except ValueError as e:
+            raise ValueError(f"無法解碼的訊息: {e}")
+    if not isinstance(message, dict):
+        raise ValueError("訊息必須是物件")
+    return message
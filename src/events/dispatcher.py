@@ -0,0 +1,142 @@
+"""
+背景事件派送器
+
+寫入路徑只需將事件放入佇列即返回，由單一背景任務依序交給廣播函數，
+寫入延遲不受訂閱者數量影響。配合 SQLAlchemy 的 after_commit 掛鉤，事件
+在交易提交後才送出，回滾的寫入不會產生事件。
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+from sqlalchemy import event as sa_event
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# 等待交易提交的事件存放在 Session.info 的此鍵下
+PENDING_EVENTS_KEY = "pending_events"
+
+
+class EventDispatcher:
+    """以單一背景任務依序派送事件"""
+
+    def __init__(
+        self,
+        handler: Callable[[Dict[str, Any]], Awaitable[None]],
+        max_backlog: int = 10000,
+    ):
+        """
+        參數:
+        - handler: 派送單一事件的協程函數（例如 EventManager.broadcast）
+        - max_backlog: 佇列上限，超過時丟棄最舊的事件
+        """
+        self.handler = handler
+        self.max_backlog = max(1, max_backlog)
+
+        # 待派送的事件：(放入時間, 事件)
+        self._queue: Deque[Tuple[float, Dict[str, Any]]] = deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stopping = False
+
+        # 統計資訊
+        self._submitted = 0
+        self._dispatched = 0
+        self._failed = 0
+        self._dropped = 0
+        self._max_backlog_seen = 0
+        self._dispatch_time = 0.0
+        self._max_lag = 0.0
+
+    def _ensure_started(self) -> asyncio.Event:
+        """在目前的事件迴圈中啟動派送任務"""
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._loop is not loop:
+            self._loop = loop
+            self._stopping = False
+            self._wakeup = asyncio.Event()
+            self._task = loop.create_task(self._run(self._wakeup))
+        return self._wakeup
+
+    def submit(self, event: Dict[str, Any]) -> None:
+        """將事件放入佇列後立即返回（需在事件迴圈執行緒中呼叫）"""
+        wakeup = self._ensure_started()
+        if len(self._queue) >= self.max_backlog:
+            self._queue.popleft()
+            self._dropped += 1
+        self._queue.append((time.monotonic(), event))
+        self._submitted += 1
+        self._max_backlog_seen = max(self._max_backlog_seen, len(self._queue))
+        wakeup.set()
+
+    async def _run(self, wakeup: asyncio.Event) -> None:
+        """派送任務主迴圈"""
+        while True:
+            while not self._queue:
+                if self._stopping:
+                    return
+                wakeup.clear()
+                await wakeup.wait()
+            queued_at, event = self._queue.popleft()
+            started = time.monotonic()
+            self._max_lag = max(self._max_lag, started - queued_at)
+            try:
+                await self.handler(event)
+            except Exception:
+                self._failed += 1
+                logger.exception("派送事件失敗")
+            else:
+                self._dispatched += 1
+            self._dispatch_time += time.monotonic() - started
+
+    async def stop(self) -> None:
+        """派送完佇列中剩餘的事件後停止"""
+        task = self._task
+        if task is None or task.done() or self._loop is not asyncio.get_running_loop():
+            return
+        self._stopping = True
+        self._wakeup.set()
+        await task
+
+    def stats(self) -> Dict[str, Any]:
+        """返回派送佇列的積壓與延遲統計"""
+        completed = self._dispatched + self._failed
+        return {
+            "backlog": len(self._queue),
+            "max_backlog": self.max_backlog,
+            "max_backlog_seen": self._max_backlog_seen,
+            "oldest_ms": (
+                (time.monotonic() - self._queue[0][0]) * 1000 if self._queue else 0.0
+            ),
+            "submitted": self._submitted,
+            "dispatched": self._dispatched,
+            "failed": self._failed,
+            "dropped": self._dropped,
+            "avg_dispatch_ms": (
+                (self._dispatch_time / completed * 1000) if completed else 0.0
+            ),
+            "max_lag_ms": self._max_lag * 1000,
+        }
+
+
+def defer_event(session: Session, event: Dict[str, Any]) -> None:
+    """登記一個在 session 交易提交後才派送的事件"""
+    session.info.setdefault(PENDING_EVENTS_KEY, []).append(event)
+
+
+def install_commit_hooks(dispatcher: EventDispatcher, session_class=Session) -> None:
+    """在 session 提交後將登記的事件交給派送器，回滾時丟棄"""
+
+    @sa_event.listens_for(session_class, "after_commit")
+    def publish_pending_events(session):
+        for event in session.info.pop(PENDING_EVENTS_KEY, ()):
+            dispatcher.submit(event)
+
+    @sa_event.listens_for(session_class, "after_rollback")
+    def discard_pending_events(session):
+        session.info.pop(PENDING_EVENTS_KEY, None)
@@ -0,0 +1,177 @@
+"""
+訂閱者登記表與篩選索引
+
+訂閱時可指定篩選條件（role、metadata 的鍵值，session_id 即 metadata 的
+session_id），多個條件須同時符合。每個有篩選條件的訂閱者只登記在其中最
+具選擇性的一個 (欄位, 值) 索引鍵下，廣播時依事件本身的鍵值取出對應的
+訂閱者集合再逐一確認其餘條件，成本與有興趣的訂閱者數量成正比，而不是
+全部訂閱者。
+
+每個集合都保留不可變的快照，成員變動時只將快照作廢，下一次廣播才重建。
+"""
+
+import json
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from src.events.subscriber import Subscriber
+
+# 篩選鍵：(欄位, 值)，欄位為 "role" 或 "metadata.<key>"
+FilterKey = Tuple[str, str]
+Filters = FrozenSet[FilterKey]
+
+
+def filter_value(value: Any) -> Optional[str]:
+    """將 metadata 的值轉為可與查詢參數比較的字串，非純量值不參與篩選"""
+    if isinstance(value, str):
+        return value
+    if value is None or isinstance(value, (bool, int, float)):
+        return json.dumps(value)
+    return None
+
+
+def build_filters(
+    session_id: Optional[str] = None,
+    role: Optional[str] = None,
+    metadata: Iterable[str] = (),
+) -> Filters:
+    """
+    由訂閱參數建立篩選條件
+
+    metadata 的每個項目為 "key:value"；格式錯誤時拋出 ValueError。
+    """
+    keys = set()
+    if session_id is not None:
+        keys.add(("metadata.session_id", session_id))
+    if role is not None:
+        keys.add(("role", role))
+    for item in metadata:
+        key, sep, value = item.partition(":")
+        if not sep or not key:
+            raise ValueError(f"metadata 篩選格式應為 key:value: {item}")
+        keys.add((f"metadata.{key}", value))
+    return frozenset(keys)
+
+
+def event_keys(event: Dict[str, Any]) -> Optional[Filters]:
+    """
+    返回事件可被篩選的鍵值；不含對話資料的事件（例如系統通知）返回 None，
+    代表送給所有訂閱者
+    """
+    data = event.get("data")
+    if not isinstance(data, dict):
+        return None
+    keys = set()
+    role = data.get("role")
+    if isinstance(role, str):
+        keys.add(("role", role))
+    metadata = data.get("extra_metadata", data.get("metadata"))
+    if isinstance(metadata, dict):
+        for key, value in metadata.items():
+            value = filter_value(value)
+            if value is not None:
+                keys.add((f"metadata.{key}", value))
+    return frozenset(keys)
+
+
+def _index_key(filters: Filters) -> FilterKey:
+    """選擇最具選擇性的索引鍵：session_id 優先，其次其他 metadata，最後 role"""
+
+    def rank(key: FilterKey) -> Tuple[int, FilterKey]:
+        field = key[0]
+        if field == "metadata.session_id":
+            return 0, key
+        return (1 if field.startswith("metadata.") else 2), key
+
+    return min(filters, key=rank)
+
+
+class SubscriberRegistry:
+    """以 ID 為鍵的訂閱者登記表，新增與移除都是 O(1)"""
+
+    def __init__(self):
+        self._all: Dict[int, Subscriber] = {}
+        # 沒有篩選條件的訂閱者
+        self._unfiltered: Dict[int, Subscriber] = {}
+        # 索引鍵 -> 登記在該鍵下的訂閱者
+        self._buckets: Dict[FilterKey, Dict[int, Subscriber]] = {}
+        # 快照：None 代表全部，"" 代表未篩選，其餘為索引鍵；
+        # 值為 (訂閱者, 是否有訂閱者需要再確認其餘條件)
+        self._snapshots: Dict[Any, Tuple[Tuple[Subscriber, ...], bool]] = {}
+        self.snapshot_rebuilds = 0
+
+    def __len__(self) -> int:
+        return len(self._all)
+
+    def _snapshot(
+        self, key: Any, members: Dict[int, Subscriber]
+    ) -> Tuple[Tuple[Subscriber, ...], bool]:
+        snapshot = self._snapshots.get(key)
+        if snapshot is None:
+            subscribers = tuple(members.values())
+            compound = any(len(subscriber.filters) > 1 for subscriber in subscribers)
+            snapshot = self._snapshots[key] = (subscribers, compound)
+            self.snapshot_rebuilds += 1
+        return snapshot
+
+    def add(self, subscriber: Subscriber) -> None:
+        """登記訂閱者，依 subscriber.filters 放入對應的索引"""
+        self._all[subscriber.id] = subscriber
+        self._snapshots.pop(None, None)
+        if subscriber.filters:
+            key = _index_key(subscriber.filters)
+            self._buckets.setdefault(key, {})[subscriber.id] = subscriber
+            self._snapshots.pop(key, None)
+        else:
+            self._unfiltered[subscriber.id] = subscriber
+            self._snapshots.pop("", None)
+
+    def remove(self, subscriber: Subscriber) -> bool:
+        """移除訂閱者，返回是否原本已登記"""
+        if self._all.pop(subscriber.id, None) is None:
+            return False
+        self._snapshots.pop(None, None)
+        if subscriber.filters:
+            key = _index_key(subscriber.filters)
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.pop(subscriber.id, None)
+                if not bucket:
+                    del self._buckets[key]
+            self._snapshots.pop(key, None)
+        else:
+            self._unfiltered.pop(subscriber.id, None)
+            self._snapshots.pop("", None)
+        return True
+
+    def all(self) -> Tuple[Subscriber, ...]:
+        """所有訂閱者的快照"""
+        return self._snapshot(None, self._all)[0]
+
+    def match(self, keys: Optional[Filters]) -> List[Tuple[Subscriber, ...]]:
+        """
+        返回應收到鍵值為 keys 的事件（由 event_keys() 取得）的訂閱者，以快照列表表示
+
+        只取出事件鍵值對應的索引集合，再排除其餘條件不符合的訂閱者。
+        """
+        if keys is None:
+            return [self.all()]
+        groups = [self._snapshot("", self._unfiltered)[0]]
+        for key in keys:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                continue
+            members, compound = self._snapshot(key, bucket)
+            if compound:
+                members = tuple(
+                    subscriber for subscriber in members if subscriber.filters <= keys
+                )
+            groups.append(members)
+        return groups
+
+    @property
+    def index_keys(self) -> int:
+        return len(self._buckets)
+
+    @property
+    def filtered(self) -> int:
+        return len(self._all) - len(self._unfiltered)
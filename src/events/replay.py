@@ -0,0 +1,142 @@
+"""
+最近事件的環形緩衝區，供 SSE 斷線重連時依 Last-Event-ID 重播
+
+帶有 ID 的事件（新對話事件的 ID 即對話 ID）廣播時一併保留已編碼的訊息與
+篩選鍵值，重新連線的客戶端只需補上斷線期間的少量事件；ID 早於緩衝區範圍
+時由呼叫端改從資料庫補齊。
+
+多個工作程序時，其他程序轉送的事件可能在本程序已廣播較大的 ID 之後才到達，
+因此緩衝區依到達順序（即客戶端收到的順序）保存，不要求 ID 遞增：
+
+- Last-Event-ID 仍在緩衝區中：補送在它之後到達的事件，晚到的較小 ID 也會補上
+- 不在緩衝區中：補送 ID 較大的事件；floor 以下的 ID 可能已移出緩衝區，
+  由呼叫端從資料庫補齊
+"""
+
+from collections import deque
+from itertools import islice
+from typing import Deque, Dict, List, Optional, Tuple
+
+from src.events.registry import Filters
+
+
+class ReplayBuffer:
+    """固定容量、依到達順序保存的 (事件 ID, SSE 訊息, 篩選鍵值) 環形緩衝區（只在事件迴圈執行緒中使用）"""
+
+    def __init__(self, size: int = 1024):
+        self.size = max(0, size)
+        self._entries: Deque[Tuple[int, bytes, Optional[Filters]]] = deque()
+        # 事件 ID -> 到達序號；由舊到新第 i 筆的序號為 appended - len(self) + i
+        self._positions: Dict[int, int] = {}
+        # 緩衝區不保證保有 ID 不大於 floor 的事件（第一筆之前或已移出的最大 ID）
+        self._floor: Optional[int] = None
+        self._max_id: Optional[int] = None
+        # 最後一筆亂序事件的到達序號；仍在緩衝區時依 ID 補送須掃描整個緩衝區
+        self._last_disorder = -1
+        # 統計資訊
+        self.appended = 0
+        self.out_of_order = 0
+        self.duplicates = 0
+        self.hits = 0
+        self.misses = 0
+        self.replayed = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def oldest(self) -> Optional[int]:
+        """最早到達的事件 ID"""
+        return self._entries[0][0] if self._entries else None
+
+    @property
+    def latest(self) -> Optional[int]:
+        """最後到達的事件 ID"""
+        return self._entries[-1][0] if self._entries else None
+
+    @property
+    def floor(self) -> Optional[int]:
+        """ID 不大於此值的事件不保證在緩衝區中，需從資料庫補齊"""
+        return self._floor
+
+    def append(self, event_id: int, message: bytes, keys: Optional[Filters]) -> bool:
+        """保留一則已廣播的事件，返回是否保留；ID 已在緩衝區中時不重複保留"""
+        if event_id in self._positions:
+            self.duplicates += 1
+            return False
+        if self._floor is None:
+            self._floor = event_id - 1
+        if self._max_id is not None and event_id < self._max_id:
+            # 其他程序轉送的事件晚於較大的 ID 到達
+            self.out_of_order += 1
+            self._last_disorder = self.appended
+        else:
+            self._max_id = event_id
+        self._entries.append((event_id, message, keys))
+        self._positions[event_id] = self.appended
+        self.appended += 1
+        while len(self._entries) > self.size:
+            evicted = self._entries.popleft()[0]
+            del self._positions[evicted]
+            self._floor = max(self._floor, evicted)
+        return True
+
+    def covers(self, last_event_id: int) -> bool:
+        """緩衝區是否保有客戶端在 last_event_id 之後尚未收到的全部事件"""
+        if not self._entries:
+            return False
+        return last_event_id in self._positions or last_event_id >= self._floor
+
+    def since(self, last_event_id: int, filters: Filters = frozenset()) -> List[bytes]:
+        """
+        返回客戶端在 last_event_id 之後應補送且符合篩選條件的訊息，依到達順序排列
+
+        未涵蓋時只返回 ID 大於 floor 的部分，其餘由呼叫端從資料庫補齊。
+        """
+        if self.covers(last_event_id):
+            self.hits += 1
+        else:
+            self.misses += 1
+        position = self._positions.get(last_event_id)
+        if position is not None:
+            # 在 last_event_id 之後到達的事件，成本與補送的事件數成正比
+            selected = list(
+                islice(reversed(self._entries), self.appended - 1 - position)
+            )
+        else:
+            threshold = (
+                last_event_id
+                if self._floor is None
+                else max(last_event_id, self._floor)
+            )
+            # 緩衝區中沒有亂序事件時 ID 遞增，遇到不大於 threshold 的 ID 即可停止
+            ordered = self._last_disorder < self.appended - len(self._entries)
+            selected = []
+            for entry in reversed(self._entries):
+                if entry[0] > threshold:
+                    selected.append(entry)
+                elif ordered:
+                    break
+        messages = [
+            message
+            for _, message, keys in reversed(selected)
+            if keys is None or filters <= keys
+        ]
+        self.replayed += len(messages)
+        return messages
+
+    def stats(self) -> Dict[str, object]:
+        """返回緩衝區範圍與重播統計"""
+        return {
+            "size": self.size,
+            "buffered": len(self._entries),
+            "oldest_id": self.oldest,
+            "latest_id": self.latest,
+            "floor_id": self._floor,
+            "appended": self.appended,
+            "out_of_order": self.out_of_order,
+            "duplicates": self.duplicates,
+            "hits": self.hits,
+            "misses": self.misses,
+            "replayed": self.replayed,
+        }
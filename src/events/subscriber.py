@@ -0,0 +1,267 @@
+"""
+有界的訂閱者緩衝區
+
+每個 SSE 客戶端有固定容量的待送訊息緩衝區，廣播時以不需等待的 offer()
+放入訊息，緩衝區已滿時依溢位策略處理，不會因為某個客戶端讀取緩慢而讓
+記憶體無限制成長或拖慢廣播：
+
+- drop_oldest：丟棄最舊的訊息
+- disconnect：中斷該客戶端，由瀏覽器的 EventSource 自動重新連線
+- coalesce：將積壓的訊息合併成一則 events_coalesced 通知（含略過的筆數），
+  客戶端收到後可透過 API 重新同步
+
+訊息為已編碼的 SSE 位元組，同一則廣播由所有客戶端共用同一個物件。
+帶有 ID 的事件會加上 SSE 的 id 欄位，見 src.events.replay。
+"""
+
+import asyncio
+import itertools
+import json
+import time
+from collections import deque
+from typing import Any, Deque, Dict, FrozenSet, List, Optional, Tuple
+
+OVERFLOW_POLICIES = ("drop_oldest", "disconnect", "coalesce")
+
+_ids = itertools.count(1)
+
+
+def encode_frame(event: Dict[str, Any], event_id: Optional[int] = None) -> bytes:
+    """將事件編碼為 SSE 訊息；指定 event_id 時加上 id 欄位，供瀏覽器重新連線時以 Last-Event-ID 帶回"""
+    data = b"data: " + json.dumps(event).encode("utf-8") + b"\n\n"
+    if event_id is None:
+        return data
+    return b"id: %d\n" % event_id + data
+
+
+def frame_event_id(message: bytes) -> Optional[int]:
+    """取出 encode_frame() 編碼的訊息中的事件 ID，沒有 id 欄位時返回 None"""
+    if not message.startswith(b"id: "):
+        return None
+    return int(message[4 : message.index(b"\n")])
+
+
+_BATCH_PREFIX = b'data: {"type": "new_conversations", "events": ['
+
+
+def merge_frames(messages: List[bytes]) -> List[bytes]:
+    """
+    將連續的帶 ID 訊息合併成一則 new_conversations 批次訊息
+
+    直接拼接各訊息中已編碼的 JSON，不重新編碼；批次訊息的 ID 為其中最後一則的 ID，
+    不帶 ID 的訊息（例如通知）與只有一則的群組維持原樣，順序不變。
+    """
+    output: List[bytes] = []
+    group: List[bytes] = []
+
+    def flush() -> None:
+        if len(group) == 1:
+            output.append(group[0])
+        elif group:
+            payloads = [message[message.index(b"data: ") + 6 : -2] for message in group]
+            output.append(
+                b"id: %d\n" % frame_event_id(group[-1])
+                + _BATCH_PREFIX
+                + b", ".join(payloads)
+                + b"]}\n\n"
+            )
+        group.clear()
+
+    for message in messages:
+        if frame_event_id(message) is None:
+            flush()
+            output.append(message)
+        else:
+            group.append(message)
+    flush()
+    return output
+
+
+def pack_frames(messages: List[bytes]) -> Tuple[bytes, int]:
+    """合併訊息（見 merge_frames）並串接成一次寫入，返回 (位元組, 合併後的訊息數)"""
+    frames = merge_frames(messages)
+    return b"".join(frames), len(frames)
+
+
+# 待送訊息：(放入時間, SSE 訊息)；廣播時所有客戶端共用同一個 tuple
+Entry = Tuple[float, bytes]
+
+
+class Subscriber:
+    """單一客戶端的有界訊息緩衝區（只在事件迴圈執行緒中使用）"""
+
+    __slots__ = (
+        "id",
+        "maxsize",
+        "policy",
+        "filters",
+        "closed",
+        "_buffer",
+        "_ready",
+        "_waiting",
+        "_skipped",
+        "connected_at",
+        "sending_since",
+        "delivered",
+        "dropped",
+        "coalesced",
+        "max_depth",
+    )
+
+    def __init__(
+        self,
+        maxsize: int = 256,
+        policy: str = "drop_oldest",
+        filters: FrozenSet = frozenset(),
+    ):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"未知的溢位策略: {policy}")
+        self.id = next(_ids)
+        self.maxsize = max(1, maxsize)
+        self.policy = policy
+        # 篩選條件：(欄位, 值) 的集合，見 src.events.registry
+        self.filters = filters
+        self.closed = False
+
+        self._buffer: Deque[Entry] = deque()
+        self._ready = asyncio.Event()
+        # get() 正在等待時才需要喚醒，廣播時不必每個客戶端都呼叫 Event.set()
+        self._waiting = False
+        self._skipped = 0
+
+        # 統計資訊
+        self.connected_at = time.monotonic()
+        # 最近一則訊息交給連線送出的時間，回到 get() 時清除；一直未清除代表送出被卡住
+        self.sending_since: Optional[float] = None
+        self.delivered = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.max_depth = 0
+
+    def offer(self, message: bytes) -> bool:
+        """放入一則訊息，不會等待；客戶端已被中斷時返回 False"""
+        return self.push((time.monotonic(), message))
+
+    def push(self, entry: Entry) -> bool:
+        """放入已附上時間的訊息，廣播時由呼叫端建立一次供所有客戶端共用"""
+        if self.closed:
+            return False
+        buffer = self._buffer
+        depth = len(buffer)
+        if depth >= self.maxsize:
+            if self.policy == "disconnect":
+                self.dropped += depth + 1
+                self.close()
+                return False
+            if self.policy == "coalesce":
+                self._skipped += depth
+                self.coalesced += depth
+                buffer.clear()
+            else:
+                buffer.popleft()
+                self.dropped += 1
+            depth = len(buffer)
+        buffer.append(entry)
+        if depth >= self.max_depth:
+            self.max_depth = depth + 1
+        if self._waiting:
+            self._waiting = False
+            self._ready.set()
+        return True
+
+    def close(self) -> None:
+        """中斷客戶端，丟棄尚未送出的訊息並喚醒等待中的 get()"""
+        self.closed = True
+        self._buffer.clear()
+        self._ready.set()
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[bytes]:
+        """
+        取出下一則訊息，客戶端被中斷時返回 None
+
+        指定 timeout 時最多等待這麼多秒，逾時拋出 asyncio.TimeoutError（供呼叫端送出心跳）。
+        """
+        self.sending_since = None
+        while not self._buffer and not self._skipped:
+            if self.closed:
+                return None
+            self._ready.clear()
+            self._waiting = True
+            if timeout is None:
+                await self._ready.wait()
+            else:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+        if self.closed:
+            return None
+        self.sending_since = time.monotonic()
+        return self._take()
+
+    async def get_more(self, limit: int, timeout: float) -> List[bytes]:
+        """
+        在 timeout 秒內再取出最多 limit 則訊息，用於將短時間內的多則事件合併送出
+
+        已在緩衝區中的訊息立即取出，不足時才等待；客戶端被中斷時返回已取出的部分。
+        """
+        messages: List[bytes] = []
+        deadline = time.monotonic() + timeout
+        while len(messages) < limit and not self.closed:
+            if self._buffer or self._skipped:
+                messages.append(self._take())
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self._ready.clear()
+            self._waiting = True
+            try:
+                await asyncio.wait_for(self._ready.wait(), remaining)
+            except asyncio.TimeoutError:
+                break
+        self.sending_since = time.monotonic()
+        return messages
+
+    def _take(self) -> bytes:
+        """取出緩衝區中的下一則訊息（呼叫端已確認有訊息）"""
+        if self._skipped:
+            message = encode_frame(
+                {"type": "events_coalesced", "skipped": self._skipped}
+            )
+            self._skipped = 0
+        else:
+            _, message = self._buffer.popleft()
+        self.delivered += 1
+        return message
+
+    @property
+    def depth(self) -> int:
+        return len(self._buffer)
+
+    @property
+    def lag(self) -> float:
+        """最舊的待送訊息已等待的秒數"""
+        return time.monotonic() - self._buffer[0][0] if self._buffer else 0.0
+
+    @property
+    def stalled(self) -> float:
+        """目前這則訊息已送出多久仍未完成的秒數，沒有在送出時為 0"""
+        return (
+            time.monotonic() - self.sending_since
+            if self.sending_since is not None
+            else 0.0
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        """返回此客戶端的延遲與丟棄統計"""
+        return {
+            "id": self.id,
+            "policy": self.policy,
+            "filters": {field: value for field, value in sorted(self.filters)},
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "lag_ms": self.lag * 1000,
+            "stalled_ms": self.stalled * 1000,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "connected_s": time.monotonic() - self.connected_at,
+        }
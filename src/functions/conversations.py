@@ -1,29 +1,58 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, Body
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
-from sqlalchemy import select, or_
-from typing import List, Dict, Any, Optional, Union
-from pydantic import BaseModel, ConfigDict, Field
-from datetime import datetime, timezone
+import json
 import os
 
+from fastapi import APIRouter, Depends, HTTPException, Query, Body, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import insert, select, and_, or_, text
+from typing import List, Dict, Any, Optional, Tuple, Union
+from pydantic import BaseModel, ConfigDict, Field, computed_field
+from datetime import datetime, timezone
 
-# 創建獨立的數據庫會話（用於工具調用）
+from src.database import SessionLocal, mark_written, open_session
+from src.models import Conversation, ConversationTerm
+from src.storage.bulk import (
+    DEFAULT_CHUNK_SIZE,
+    chunk_errors,
+    id_ranges,
+    insert_chunk,
+    parse_ndjson,
+    validate_conversations,
+)
+from src.storage.cjk_index import index_conversations, posting_rows, search_cjk_index
+from src.storage.export import (
+    EXPORT_CHUNK_SIZE,
+    agzip_chunks,
+    build_export_sql,
+    join_lines,
+)
+from src.storage.fts import (
+    FTS_EXISTS_SQL,
+    build_match_query,
+    build_search_sql,
+    contains_cjk,
+    search_params,
+)
+from src.storage.pagination import (
+    decode_cursor,
+    encode_cursor,
+    format_timestamp,
+    normalize_timestamp,
+    page_ids_by_time,
+)
+
+
+# 創建獨立的數據庫會話（用於工具調用），與 HTTP 端點共用同一個引擎
 async def get_db_session():
-    DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///data/app.db")
-    engine = create_async_engine(DATABASE_URL)
-    from sqlalchemy.orm import sessionmaker
+    return await open_session(SessionLocal)
 
-    AsyncSessionLocal = sessionmaker(
-        bind=engine, class_=AsyncSession, expire_on_commit=False
-    )
-    return AsyncSessionLocal()
 
+# 批次寫入時每個交易的記錄數
+BULK_CHUNK_SIZE = int(os.getenv("DB_BULK_CHUNK_SIZE", str(DEFAULT_CHUNK_SIZE)))
 
-from src.database import SessionLocal
-from src.models import Conversation
-
-# 導入事件管理器
-from src.functions.server import event_manager
+# 導入事件派送
+from src.events import defer_event
+from src.functions.server import conversation_data, conversation_event, query_cache
 
 router = APIRouter()
 
@@ -45,16 +74,56 @@ class ConversationResponse(BaseModel):
     # 使用ConfigDict代替Config類
     model_config = ConfigDict(from_attributes=True)
 
+    @computed_field
+    @property
+    def cursor(self) -> str:
+        """從此記錄之後繼續分頁的游標"""
+        return encode_cursor(self.timestamp, self.id)
+
 
 # 依賴注入：獲取資料庫會話
 async def get_db():
-    db = SessionLocal()
+    db = await open_session(SessionLocal)
     try:
         yield db
     finally:
         await db.close()
 
 
+# 解析分頁游標，並將時間統一為 SQLite 的儲存格式
+def _parse_cursor(cursor: Optional[str]) -> Optional[Tuple[str, int]]:
+    if not cursor:
+        return None
+    try:
+        timestamp, conversation_id = decode_cursor(cursor)
+        return format_timestamp(datetime.fromisoformat(timestamp)), conversation_id
+    except ValueError:
+        raise HTTPException(status_code=400, detail="無效的分頁游標")
+
+
+# 依 (timestamp, id) 排序時，位於游標之後的記錄
+def _after_cursor(cursor: Tuple[str, int], descending: bool = False):
+    timestamp, conversation_id = datetime.fromisoformat(cursor[0]), cursor[1]
+    if descending:
+        return or_(
+            Conversation.timestamp < timestamp,
+            and_(
+                Conversation.timestamp == timestamp, Conversation.id < conversation_id
+            ),
+        )
+    return or_(
+        Conversation.timestamp > timestamp,
+        and_(Conversation.timestamp == timestamp, Conversation.id > conversation_id),
+    )
+
+
+# 取滿一頁時，以最後一筆記錄的游標設定 X-Next-Cursor 標頭
+def _set_next_cursor(response: Response, conversations, limit: int) -> None:
+    if limit > 0 and len(conversations) == limit:
+        last = conversations[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor(last.timestamp, last.id)
+
+
 # 紀錄對話的API端點
 @router.post("/conversations/", response_model=ConversationResponse)
 async def create_conversation_endpoint(
@@ -77,29 +146,25 @@ async def create_conversation(
         if isinstance(conversation, dict):
             conversation = ConversationCreate(**conversation)
 
-        # 創建新的對話記錄
-        db_conversation = Conversation(
-            role=conversation.role,
-            content=conversation.content,
-            extra_metadata=conversation.extra_metadata,
+        # 以 INSERT ... RETURNING 一次取回 ID 與預設值，提交後不必再 refresh
+        result = await db.execute(
+            insert(Conversation)
+            .values(
+                role=conversation.role,
+                content=conversation.content,
+                extra_metadata=conversation.extra_metadata,
+            )
+            .returning(Conversation)
         )
+        db_conversation = result.scalar_one()
+        # INSERT 語句不觸發 after_insert 事件，需另外建立 n-gram 索引
+        await _index_terms(db, [(db_conversation.id, db_conversation.content)])
 
-        # 添加到資料庫
-        db.add(db_conversation)
+        # 交易提交後由背景派送器廣播給所有連接的客戶端
+        defer_event(
+            db.sync_session, conversation_event(conversation_data(db_conversation))
+        )
         await db.commit()
-        await db.refresh(db_conversation)
-
-        # 將新對話記錄轉換為字典並廣播給所有連接的客戶端
-        conversation_dict = {
-            "id": db_conversation.id,
-            "timestamp": db_conversation.timestamp.isoformat(),
-            "role": db_conversation.role,
-            "content": db_conversation.content,
-            "extra_metadata": db_conversation.extra_metadata,
-        }
-
-        # 異步廣播新對話記錄
-        await event_manager.broadcast_conversation(conversation_dict)
 
         return db_conversation
     except Exception as e:
@@ -112,39 +177,304 @@ async def create_conversation(
             await db.close()
 
 
+# 批次創建對話的API端點：接受 JSON 陣列或 NDJSON（Content-Type: application/x-ndjson）
+@router.post("/conversations/bulk")
+async def bulk_create_conversations_endpoint(
+    request: Request, db: AsyncSession = Depends(get_db)
+) -> Dict[str, Any]:
+    body = (await request.body()).decode("utf-8")
+    content_type = request.headers.get("content-type", "")
+    if "ndjson" in content_type or "jsonl" in content_type:
+        return await bulk_create_conversations(body, db)
+
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="請求內容必須是 JSON 陣列或 NDJSON")
+    if isinstance(payload, dict):
+        payload = payload.get("conversations")
+    if not isinstance(payload, list):
+        raise HTTPException(status_code=400, detail="請求內容必須是 JSON 陣列或 NDJSON")
+    return await bulk_create_conversations(payload, db)
+
+
+# 在目前的交易中寫入一段記錄，返回依序分配的 ID
+async def _insert_chunk(db: AsyncSession, chunk) -> List[int]:
+    if db.bind.dialect.name == "sqlite":
+        # SQLite 直接以驅動層連接的單一語句寫入，並在同一個交易中建立 n-gram 索引
+        timestamp = format_timestamp(datetime.now())
+
+        def write(session):
+            # 驅動層寫入不觸發 ORM 事件，需自行標記以便提交後使查詢快取失效
+            mark_written(session)
+            return insert_chunk(
+                session.connection().connection,
+                chunk,
+                index_conversations,
+                metadata_column="extra_metadata",
+                timestamp=timestamp,
+            )
+
+        return await db.run_sync(write)
+
+    now = datetime.now()
+    result = await db.execute(
+        insert(Conversation).returning(Conversation.id, sort_by_parameter_order=True),
+        [
+            {
+                "role": role,
+                "content": content,
+                "extra_metadata": metadata,
+                "timestamp": datetime.fromisoformat(timestamp) if timestamp else now,
+            }
+            for _, role, content, metadata, timestamp in chunk
+        ],
+    )
+    chunk_ids = list(result.scalars())
+    # 批次寫入不觸發 after_insert 事件，需另外建立 n-gram 索引
+    await _index_terms(
+        db,
+        [(conversation_id, row[2]) for conversation_id, row in zip(chunk_ids, chunk)],
+    )
+    return chunk_ids
+
+
+# 在目前的交易中為新寫入的記錄建立 n-gram 索引
+async def _index_terms(db: AsyncSession, conversations: List[Tuple[int, str]]) -> None:
+    postings = posting_rows(conversations)
+    if postings:
+        await db.execute(
+            insert(ConversationTerm),
+            [
+                {
+                    "term": term,
+                    "conversation_id": conversation_id,
+                    "positions": positions,
+                }
+                for term, conversation_id, positions in postings
+            ],
+        )
+
+
+# 批次創建對話的工具函數：conversations 為記錄列表或 NDJSON 字串
+async def bulk_create_conversations(
+    conversations: Union[List[Any], str], db: Optional[AsyncSession] = None
+) -> Dict[str, Any]:
+    if isinstance(conversations, str):
+        items, errors = parse_ndjson(conversations)
+    else:
+        items, errors = conversations, []
+    rows, invalid = validate_conversations(
+        items, skip=[error["index"] for error in errors]
+    )
+    errors.extend(invalid)
+
+    close_db = False
+    if db is None:
+        db = await get_db_session()
+        close_db = True
+
+    try:
+        ids: List[int] = []
+        for start in range(0, len(rows), BULK_CHUNK_SIZE):
+            chunk = rows[start : start + BULK_CHUNK_SIZE]
+            try:
+                chunk_ids = await _insert_chunk(db, chunk)
+                await db.commit()
+            except Exception as e:
+                await db.rollback()
+                errors.extend(chunk_errors(chunk, e))
+                continue
+            ids.extend(chunk_ids)
+
+        errors.sort(key=lambda error: error["index"])
+        return {
+            "total": len(items),
+            "inserted": len(ids),
+            "id_ranges": id_ranges(ids),
+            "errors": errors,
+        }
+    finally:
+        if close_db and "db" in locals() and db is not None:
+            await db.close()
+
+
 # 搜尋對話的API端點
 @router.get("/search/", response_model=List[ConversationResponse])
 async def search_conversations_endpoint(
+    response: Response,
     query: str = Query(..., description="搜尋關鍵字"),
     skip: int = Query(0, description="跳過的記錄數"),
     limit: int = Query(10, description="返回的最大記錄數"),
+    recency_boost: float = Query(0.0, description="新近度加權，0 表示僅依相關度排序"),
+    cursor: Optional[str] = Query(
+        None, description="分頁游標，提供時忽略 skip 並依時間由新到舊排列"
+    ),
+    sort: str = Query(
+        "relevance", description="排序方式：relevance（相關度）或 recent（由新到舊）"
+    ),
     db: AsyncSession = Depends(get_db),
 ):
-    return await search_conversations(query, skip, limit, db)
+    conversations = await search_conversations(
+        query, skip, limit, db, recency_boost=recency_boost, cursor=cursor, sort=sort
+    )
+    if cursor or sort == "recent":
+        _set_next_cursor(response, conversations, limit)
+    return conversations
+
+
+# 使用 FTS5 全文索引搜尋，依 BM25 排序；無法使用索引時返回 None
+async def _search_with_fts(
+    db: AsyncSession,
+    query: str,
+    skip: int,
+    limit: int,
+    recency_boost: float,
+    by_time: bool = False,
+    cursor: Optional[Tuple[str, int]] = None,
+) -> Optional[List[Conversation]]:
+    if db.bind.dialect.name != "sqlite" or contains_cjk(query):
+        return None
+    match_query = build_match_query(query)
+    if match_query is None:
+        return None
+    if (await db.execute(text(FTS_EXISTS_SQL))).first() is None:
+        return None
+
+    conn = await db.connection()
+    result = await conn.exec_driver_sql(
+        build_search_sql(
+            ["id"],
+            recency_boost=bool(recency_boost),
+            paginate=True,
+            order_by_time=by_time,
+            after_cursor=cursor is not None,
+        ),
+        tuple(
+            search_params(match_query, limit, recency_boost, offset=skip, cursor=cursor)
+        ),
+    )
+    ids = [row[0] for row in result.fetchall()]
+    if not ids:
+        return []
+
+    result = await db.execute(select(Conversation).filter(Conversation.id.in_(ids)))
+    by_id = {conversation.id: conversation for conversation in result.scalars().all()}
+    return [
+        by_id[conversation_id] for conversation_id in ids if conversation_id in by_id
+    ]
+
+
+# 使用 n-gram 倒排索引搜尋中日韓文字，結果由新到舊排列；無法使用索引時返回 None
+async def _search_with_cjk_index(
+    db: AsyncSession,
+    query: str,
+    skip: int,
+    limit: int,
+    by_time: bool = False,
+    cursor: Optional[Tuple[str, int]] = None,
+) -> Optional[List[Conversation]]:
+    if db.bind.dialect.name != "sqlite" or not contains_cjk(query):
+        return None
+
+    matches = await db.run_sync(
+        lambda session: search_cjk_index(session.connection().connection, query)
+    )
+    if matches is None:
+        return None
+
+    if by_time:
+        ids = await db.run_sync(
+            lambda session: page_ids_by_time(
+                session.connection().connection, list(matches), skip + limit, cursor
+            )
+        )
+        ids = ids[skip:]
+        order = (Conversation.timestamp.desc(), Conversation.id.desc())
+    else:
+        ids = sorted(matches, reverse=True)[skip : skip + limit]
+        order = (Conversation.id.desc(),)
+    if not ids:
+        return []
+    result = await db.execute(
+        select(Conversation).filter(Conversation.id.in_(ids)).order_by(*order)
+    )
+    return result.scalars().all()
 
 
-# 搜尋對話的工具函數
+# 搜尋對話的工具函數；相同參數的結果由查詢快取返回，直到下一次寫入
 async def search_conversations(
-    query: str, skip: int = 0, limit: int = 10, db: Optional[AsyncSession] = None
+    query: str,
+    skip: int = 0,
+    limit: int = 10,
+    db: Optional[AsyncSession] = None,
+    recency_boost: float = 0.0,
+    cursor: Optional[str] = None,
+    sort: str = "relevance",
+) -> List[ConversationResponse]:
+    if sort not in ("relevance", "recent"):
+        raise HTTPException(status_code=400, detail="sort 只能是 relevance 或 recent")
+    cache_key = (query, skip, limit, recency_boost, cursor, sort)
+    cached = query_cache.get("search_conversations", cache_key)
+    if cached is not None:
+        return list(cached)
+    generation = query_cache.generation
+
+    conversations = [
+        ConversationResponse.model_validate(conversation)
+        for conversation in await _search_conversations(
+            query, skip, limit, db, recency_boost, cursor, sort
+        )
+    ]
+    query_cache.put("search_conversations", cache_key, conversations, generation)
+    return list(conversations)
+
+
+async def _search_conversations(
+    query: str,
+    skip: int,
+    limit: int,
+    db: Optional[AsyncSession],
+    recency_boost: float,
+    cursor: Optional[str],
+    sort: str,
 ):
+    keyset = _parse_cursor(cursor)
+    # 游標分頁固定依 (timestamp, id) 由新到舊排列，不再使用 OFFSET
+    by_time = keyset is not None or sort == "recent"
+    if keyset is not None:
+        skip = 0
+
     close_db = False
     if db is None:
         db = await get_db_session()
         close_db = True
 
     try:
-        # 構建基本搜尋查詢（使用LIKE操作進行簡單文本匹配）
-        search_query = (
-            select(Conversation)
-            .filter(
-                or_(
-                    Conversation.content.like(f"%{query}%"),
-                    Conversation.role.like(f"%{query}%"),
-                )
+        ranked = await _search_with_fts(
+            db, query, skip, limit, recency_boost, by_time, keyset
+        )
+        if ranked is None:
+            ranked = await _search_with_cjk_index(
+                db, query, skip, limit, by_time, keyset
+            )
+        if ranked is not None:
+            return ranked
+
+        # 索引無法回答的查詢（例如單一中文字），以LIKE操作進行簡單文本匹配
+        search_query = select(Conversation).filter(
+            or_(
+                Conversation.content.like(f"%{query}%"),
+                Conversation.role.like(f"%{query}%"),
             )
-            .offset(skip)
-            .limit(limit)
         )
+        if keyset is not None:
+            search_query = search_query.filter(_after_cursor(keyset, descending=True))
+        if by_time:
+            search_query = search_query.order_by(
+                Conversation.timestamp.desc(), Conversation.id.desc()
+            )
+        search_query = search_query.offset(skip).limit(limit)
 
         # 執行查詢
         result = await db.execute(search_query)
@@ -166,25 +496,39 @@ async def search_conversations(
 # 獲取所有對話的API端點（用於測試）
 @router.get("/conversations/", response_model=List[ConversationResponse])
 async def get_all_conversations_endpoint(
+    response: Response,
     skip: int = Query(0, description="跳過的記錄數"),
     limit: int = Query(10, description="返回的最大記錄數"),
+    cursor: Optional[str] = Query(None, description="分頁游標，提供時忽略 skip"),
     db: AsyncSession = Depends(get_db),
 ):
-    return await get_all_conversations(skip, limit, db)
+    conversations = await get_all_conversations(skip, limit, db, cursor=cursor)
+    _set_next_cursor(response, conversations, limit)
+    return conversations
 
 
-# 獲取所有對話的工具函數
+# 獲取所有對話的工具函數，依 (timestamp, id) 由舊到新排列
 async def get_all_conversations(
-    skip: int = 0, limit: int = 10, db: Optional[AsyncSession] = None
+    skip: int = 0,
+    limit: int = 10,
+    db: Optional[AsyncSession] = None,
+    cursor: Optional[str] = None,
 ):
+    keyset = _parse_cursor(cursor)
+
     close_db = False
     if db is None:
         db = await get_db_session()
         close_db = True
 
     try:
-        query = select(Conversation).offset(skip).limit(limit)
-        result = await db.execute(query)
+        query = select(Conversation).order_by(Conversation.timestamp, Conversation.id)
+        if keyset is not None:
+            # keyset 分頁：從游標之後開始，不必掃描前面各頁
+            query = query.filter(_after_cursor(keyset))
+        else:
+            query = query.offset(skip)
+        result = await db.execute(query.limit(limit))
         conversations = result.scalars().all()
         return conversations
     except Exception as e:
@@ -195,6 +539,83 @@ async def get_all_conversations(
             await db.close()
 
 
+# 串流匯出對話的API端點（NDJSON，需宣告在 /conversations/{conversation_id} 之前）
+@router.get("/conversations/export")
+async def export_conversations_endpoint(
+    since: Optional[str] = Query(None, description="起始時間（含），ISO 8601 格式"),
+    until: Optional[str] = Query(None, description="結束時間（不含），ISO 8601 格式"),
+    session_id: Optional[str] = Query(None, description="只匯出指定會話的記錄"),
+    gzip: bool = Query(False, description="以 gzip 壓縮回應"),
+) -> StreamingResponse:
+    params: Dict[str, str] = {}
+    try:
+        if since:
+            params["since"] = normalize_timestamp(since)
+        if until:
+            params["until"] = normalize_timestamp(until)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if session_id is not None:
+        params["session_id"] = session_id
+
+    body = export_conversations(params)
+    headers = {"Content-Disposition": 'attachment; filename="conversations.ndjson"'}
+    if gzip:
+        body = agzip_chunks(body)
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(body, media_type="application/x-ndjson", headers=headers)
+
+
+# 以伺服器端游標分段讀取並產生 NDJSON，記憶體用量與資料量無關
+async def export_conversations(params: Dict[str, str]):
+    # 串流回應在端點返回後才開始讀取，因此自行管理會話
+    db = await get_db_session()
+    try:
+        if db.bind.dialect.name == "sqlite":
+            sql = build_export_sql(
+                "extra_metadata",
+                since="since" in params,
+                until="until" in params,
+                session_id="session_id" in params,
+            )
+            result = await db.stream(text(sql), params)
+            async for rows in result.partitions(EXPORT_CHUNK_SIZE):
+                yield join_lines(row[0] for row in rows)
+            return
+
+        query = select(Conversation).order_by(Conversation.timestamp, Conversation.id)
+        if "since" in params:
+            query = query.filter(
+                Conversation.timestamp >= datetime.fromisoformat(params["since"])
+            )
+        if "until" in params:
+            query = query.filter(
+                Conversation.timestamp < datetime.fromisoformat(params["until"])
+            )
+        if "session_id" in params:
+            query = query.filter(
+                Conversation.extra_metadata["session_id"].as_string()
+                == params["session_id"]
+            )
+        result = await db.stream_scalars(query)
+        async for conversations in result.partitions(EXPORT_CHUNK_SIZE):
+            yield join_lines(
+                json.dumps(
+                    {
+                        "id": conversation.id,
+                        "timestamp": format_timestamp(conversation.timestamp),
+                        "role": conversation.role,
+                        "content": conversation.content,
+                        "extra_metadata": conversation.extra_metadata,
+                    },
+                    ensure_ascii=False,
+                )
+                for conversation in conversations
+            )
+    finally:
+        await db.close()
+
+
 # 根據ID獲取單個對話的API端點
 @router.get("/conversations/{conversation_id}", response_model=ConversationResponse)
 async def get_conversation_endpoint(
@@ -203,8 +624,23 @@ async def get_conversation_endpoint(
     return await get_conversation(conversation_id, db)
 
 
-# 根據ID獲取單個對話的工具函數
-async def get_conversation(conversation_id: int, db: Optional[AsyncSession] = None):
+# 根據ID獲取單個對話的工具函數；結果由查詢快取返回，直到下一次寫入
+async def get_conversation(
+    conversation_id: int, db: Optional[AsyncSession] = None
+) -> ConversationResponse:
+    cached = query_cache.get("get_conversation", conversation_id)
+    if cached is not None:
+        return cached
+    generation = query_cache.generation
+
+    conversation = ConversationResponse.model_validate(
+        await _get_conversation(conversation_id, db)
+    )
+    query_cache.put("get_conversation", conversation_id, conversation, generation)
+    return conversation
+
+
+async def _get_conversation(conversation_id: int, db: Optional[AsyncSession]):
     close_db = False
     if db is None:
         db = await get_db_session()
@@ -5,93 +5,574 @@ from fastapi import (
     BackgroundTasks,
     HTTPException,
     Depends,
+    Query,
 )
 from fastapi.responses import StreamingResponse
 import asyncio
-from typing import AsyncGenerator, Dict, List, Any, Optional
-import json
+import os
+import time
+from typing import AsyncGenerator, Dict, FrozenSet, List, Any, Optional, Tuple
 from datetime import datetime, UTC, timezone
 from pydantic import BaseModel, Field
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from src.database import (
+    DATABASE_URL,
+    get_pool_stats,
+    install_invalidation_hooks,
+    open_session,
+    sqlite_file_path,
+)
+from src.events import (
+    OVERFLOW_POLICIES,
+    EventDispatcher,
+    ReplayBuffer,
+    Subscriber,
+    SubscriberRegistry,
+    build_filters,
+    create_event_bus,
+    encode_frame,
+    event_keys,
+    frame_event_id,
+    install_commit_hooks,
+    pack_frames,
+)
+from src.models import Conversation
+from src.storage.cache import (
+    DEFAULT_CACHE_SIZE,
+    DataVersionWatcher,
+    QueryCache,
+    parse_cache_sizes,
+)
 
 # 創建一個路由器來處理SSE事件
 router = APIRouter()
 
 
-# 使用一個簡單的事件隊列和連接管理器
+# 每個 SSE 客戶端的緩衝區容量與預設溢位策略（drop_oldest、disconnect 或 coalesce）
+SSE_QUEUE_SIZE = int(os.getenv("SSE_QUEUE_SIZE", "256"))
+SSE_OVERFLOW_POLICY = os.getenv("SSE_OVERFLOW_POLICY", "drop_oldest")
+# 背景派送佇列的上限
+SSE_DISPATCH_BACKLOG = int(os.getenv("SSE_DISPATCH_BACKLOG", "10000"))
+# 供 Last-Event-ID 重播保留的最近事件數，以及超出此範圍時最多從資料庫補送的記錄數
+SSE_REPLAY_BUFFER = int(os.getenv("SSE_REPLAY_BUFFER", "1024"))
+SSE_REPLAY_DB_LIMIT = int(os.getenv("SSE_REPLAY_DB_LIMIT", "1000"))
+# 沒有事件時送出心跳註解並檢查連線的間隔（秒，0 代表停用）
+SSE_HEARTBEAT_INTERVAL = float(os.getenv("SSE_HEARTBEAT_INTERVAL", "15"))
+# 同時連線的 SSE 客戶端上限（0 代表不限制），以及單則訊息送出超過多少秒仍未完成時回收該客戶端
+SSE_MAX_CONNECTIONS = int(os.getenv("SSE_MAX_CONNECTIONS", "1000"))
+SSE_SEND_TIMEOUT = float(os.getenv("SSE_SEND_TIMEOUT", "10"))
+# 客戶端以 batch_ms 啟用合併送出時，允許的最長等待時間（毫秒）與每批預設的事件數上限
+SSE_BATCH_MAX_WINDOW_MS = float(os.getenv("SSE_BATCH_MAX_WINDOW_MS", "1000"))
+SSE_BATCH_MAX_EVENTS = int(os.getenv("SSE_BATCH_MAX_EVENTS", "100"))
+# 多個工作程序之間轉送事件的匯流排：local（單一程序）或 sqlite（共用的變更記錄檔案）
+SSE_EVENT_BUS = os.getenv("SSE_EVENT_BUS", "local")
+SSE_EVENT_BUS_PATH = os.getenv("SSE_EVENT_BUS_PATH", "data/events.db")
+SSE_EVENT_BUS_POLL_MS = float(os.getenv("SSE_EVENT_BUS_POLL_MS", "50"))
+# 查詢結果快取：每個工具最多保存的結果數，以及個別工具的大小（0 為停用）
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", str(DEFAULT_CACHE_SIZE)))
+QUERY_CACHE_TOOLS = os.getenv("QUERY_CACHE_TOOLS")
+
+# metrics 中列出的延遲最大的客戶端數量
+_SLOWEST_CLIENTS = 10
+
+CONNECTED_FRAME = encode_frame({"type": "connected"})
+# SSE 註解行，EventSource 會忽略，只用來保持連線並偵測斷線
+HEARTBEAT_FRAME = b": keepalive\n\n"
+# 連線數已滿時建議客戶端多久後重試（秒）
+_RETRY_AFTER = 5
+
+# 廣播時每處理這麼多個客戶端就讓出事件迴圈一次，避免長時間佔用迴圈延遲寫入請求
+_BROADCAST_SLICE = 256
+
+
+# 使用有界緩衝區的連接管理器
 class EventManager:
-    def __init__(self):
-        self.clients: List[asyncio.Queue] = []
-        self._lock = asyncio.Lock()
-
-    async def register(self) -> asyncio.Queue:
-        """註冊一個新的客戶端，返回客戶端的事件隊列"""
-        queue = asyncio.Queue()
-        async with self._lock:
-            self.clients.append(queue)
-        return queue
-
-    async def unregister(self, queue: asyncio.Queue) -> None:
-        """從事件管理器中移除客戶端"""
-        async with self._lock:
-            if queue in self.clients:
-                self.clients.remove(queue)
+    def __init__(
+        self,
+        queue_size: int = SSE_QUEUE_SIZE,
+        policy: str = SSE_OVERFLOW_POLICY,
+        replay_size: int = SSE_REPLAY_BUFFER,
+        max_connections: int = SSE_MAX_CONNECTIONS,
+        send_timeout: float = SSE_SEND_TIMEOUT,
+    ):
+        # 新增與移除都是 O(1) 的登記表，依篩選條件建立索引；只在事件迴圈執行緒中修改，不需要鎖
+        self._registry = SubscriberRegistry()
+        # 暫停接收（WebSocket unsubscribe）但連線仍開啟的客戶端，不送事件但計入連線數
+        self._paused: Dict[int, Subscriber] = {}
+        # 最近廣播的事件，供重新連線的客戶端依 Last-Event-ID 補送
+        self.history = ReplayBuffer(replay_size)
+        self.queue_size = queue_size
+        self.policy = policy
+        self.max_connections = max(0, max_connections)
+        self.send_timeout = send_timeout
+        self._reaper: Optional[asyncio.TimerHandle] = None
+        self._reaper_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._broadcasts = 0
+        self._deliveries = 0
+        self._disconnected = 0
+        self._peak_clients = 0
+        self._rejected = 0
+        self._reaped = 0
+        self.heartbeats = 0
+        # 合併送出的統計：收集到的訊息數、合併後實際送出的訊息數、收集時等待的時間
+        self._batches = 0
+        self._batch_messages = 0
+        self._batch_frames = 0
+        self._batch_wait = 0.0
+        self._max_batch_wait = 0.0
+
+    @property
+    def clients(self) -> Tuple[Subscriber, ...]:
+        """目前已連接客戶端的快照"""
+        return self._registry.all()
+
+    @property
+    def connections(self) -> int:
+        """目前的連線數，包含暫停接收但尚未關閉的連線"""
+        return len(self._registry) + len(self._paused)
+
+    @property
+    def at_capacity(self) -> bool:
+        """連線數是否已達上限"""
+        return bool(self.max_connections) and self.connections >= self.max_connections
+
+    def reject(self) -> None:
+        """記錄一次因連線數已滿而拒絕的連線"""
+        self._rejected += 1
+
+    async def register(
+        self, policy: Optional[str] = None, filters: FrozenSet = frozenset()
+    ) -> Subscriber:
+        """註冊一個新的客戶端，返回客戶端的訊息緩衝區；filters 由 build_filters() 建立"""
+        subscriber = Subscriber(self.queue_size, policy or self.policy, filters)
+        self._registry.add(subscriber)
+        self._peak_clients = max(self._peak_clients, self.connections)
+        self._ensure_reaper()
+        return subscriber
+
+    async def unregister(self, subscriber: Subscriber) -> None:
+        """連線關閉時從事件管理器中移除客戶端"""
+        self._registry.remove(subscriber)
+        self._paused.pop(subscriber.id, None)
+
+    async def pause(self, subscriber: Subscriber) -> None:
+        """停止送事件給客戶端但仍計入連線數，直到 unregister()；update_filters() 恢復接收"""
+        if self._registry.remove(subscriber):
+            self._paused[subscriber.id] = subscriber
+
+    async def update_filters(self, subscriber: Subscriber, filters: FrozenSet) -> None:
+        """更換客戶端的篩選條件並重新登記（暫停中的客戶端恢復接收），已在緩衝區中的訊息保留"""
+        self._registry.remove(subscriber)
+        self._paused.pop(subscriber.id, None)
+        subscriber.filters = filters
+        self._registry.add(subscriber)
+        self._peak_clients = max(self._peak_clients, self.connections)
+        self._ensure_reaper()
+
+    def record_batch(self, messages: int, frames: int, waited: float) -> None:
+        """記錄一次合併送出：messages 則訊息合併成 frames 則送出，收集時等待了 waited 秒"""
+        self._batches += 1
+        self._batch_messages += messages
+        self._batch_frames += frames
+        self._batch_wait += waited
+        self._max_batch_wait = max(self._max_batch_wait, waited)
+
+    def reap_stalled(self) -> int:
+        """中斷並移除送出卡住超過 send_timeout 的客戶端，返回移除的數量"""
+        stalled = [
+            subscriber
+            for subscriber in self.clients
+            if subscriber.stalled > self.send_timeout
+        ]
+        for subscriber in stalled:
+            subscriber.close()
+            self._registry.remove(subscriber)
+        self._reaped += len(stalled)
+        return len(stalled)
+
+    def _ensure_reaper(self) -> None:
+        """在目前的事件迴圈中排程下一次回收，沒有客戶端時不再排程"""
+        if self.send_timeout <= 0:
+            return
+        loop = asyncio.get_running_loop()
+        if self._reaper is not None and self._reaper_loop is loop:
+            return
+        self._reaper_loop = loop
+        self._reaper = loop.call_later(max(0.1, self.send_timeout / 2), self._reap_tick)
+
+    def _reap_tick(self) -> None:
+        """定期回收送出卡住的客戶端（例如對端已消失但連線未關閉）"""
+        self._reaper = None
+        self.reap_stalled()
+        if len(self._registry):
+            self._ensure_reaper()
 
     async def broadcast(self, event: Dict[str, Any]) -> None:
-        """向所有已連接的客戶端廣播事件"""
-        # 轉換事件為SSE格式的字符串
-        event_str = json.dumps(event)
-        message = f"data: {event_str}\n\n"
-
-        # 將消息添加到每個客戶端的隊列中
-        async with self._lock:
-            # 複製客戶端列表，避免在迭代過程中修改列表
-            clients = self.clients.copy()
-
-        # 向所有客戶端發送消息
-        for queue in clients:
-            await queue.put(message)
+        """
+        向篩選條件符合的客戶端廣播事件
+
+        事件帶有整數 id 欄位時（新對話事件即對話 ID）作為 SSE 的事件 ID，並保留在重播緩衝區。
+        """
+        event_id = event.get("id")
+        if not isinstance(event_id, int):
+            event_id = None
+        # 只編碼一次，所有客戶端共用同一個位元組物件
+        message = encode_frame(event, event_id)
+        keys = event_keys(event)
+        if event_id is not None:
+            self.history.append(event_id, message, keys)
+        # 取得快照後即使有客戶端加入或離開也不影響本次迭代；
+        # 只取出篩選索引中與此事件相關的客戶端
+        groups = self._registry.match(keys)
+        entry = (time.monotonic(), message)
+
+        # 放入緩衝區不需等待，緩慢的客戶端不會拖慢廣播
+        self._broadcasts += 1
+        dropped = []
+        processed = 0
+        for clients in groups:
+            for start in range(0, len(clients), _BROADCAST_SLICE):
+                if processed:
+                    await asyncio.sleep(0)
+                chunk = clients[start : start + _BROADCAST_SLICE]
+                for subscriber in chunk:
+                    if not subscriber.push(entry):
+                        dropped.append(subscriber)
+                processed += len(chunk)
+        self._deliveries += processed
+        if dropped:
+            # 因溢位被中斷的客戶端立即移除，不必等到連線結束
+            self._disconnected += len(dropped)
+            for subscriber in dropped:
+                await self.unregister(subscriber)
 
     async def broadcast_conversation(self, conversation: Dict[str, Any]) -> None:
         """特定功能：廣播新對話記錄事件"""
-        event = {
-            "type": "new_conversation",
-            "data": conversation,
-            "timestamp": datetime.now(UTC).isoformat(),
+        await self.broadcast(conversation_event(conversation))
+
+    def stats(self) -> Dict[str, Any]:
+        """返回客戶端數量、延遲與丟棄統計"""
+        clients = self.clients
+        slowest = sorted(clients, key=lambda subscriber: subscriber.lag, reverse=True)[
+            :_SLOWEST_CLIENTS
+        ]
+        return {
+            "clients": len(clients),
+            "paused_clients": len(self._paused),
+            "peak_clients": self._peak_clients,
+            "max_connections": self.max_connections,
+            "rejected_connections": self._rejected,
+            "reaped_clients": self._reaped,
+            "heartbeats": self.heartbeats,
+            "queue_size": self.queue_size,
+            "policy": self.policy,
+            "filtered_clients": self._registry.filtered,
+            "filter_index_keys": self._registry.index_keys,
+            "broadcasts": self._broadcasts,
+            "deliveries": self._deliveries,
+            "snapshot_rebuilds": self._registry.snapshot_rebuilds,
+            "disconnected_slow_clients": self._disconnected,
+            "pending": sum(subscriber.depth for subscriber in clients),
+            "dropped": sum(subscriber.dropped for subscriber in clients),
+            "coalesced": sum(subscriber.coalesced for subscriber in clients),
+            "max_lag_ms": slowest[0].lag * 1000 if slowest else 0.0,
+            "slowest_clients": [subscriber.stats() for subscriber in slowest],
+            "replay": self.history.stats(),
+            "batching": {
+                "batches": self._batches,
+                "messages": self._batch_messages,
+                "frames": self._batch_frames,
+                "frames_saved": self._batch_messages - self._batch_frames,
+                "avg_wait_ms": (
+                    (self._batch_wait / self._batches * 1000) if self._batches else 0.0
+                ),
+                "max_wait_ms": self._max_batch_wait * 1000,
+            },
         }
-        await self.broadcast(event)
+
+
+def conversation_data(conversation: Conversation) -> Dict[str, Any]:
+    """將對話記錄轉換為事件中的字典"""
+    return {
+        "id": conversation.id,
+        "timestamp": conversation.timestamp.isoformat(),
+        "role": conversation.role,
+        "content": conversation.content,
+        "extra_metadata": conversation.extra_metadata,
+    }
+
+
+def conversation_event(conversation: Dict[str, Any]) -> Dict[str, Any]:
+    """新對話記錄事件，事件 ID 即對話 ID"""
+    return {
+        "id": conversation["id"],
+        "type": "new_conversation",
+        "data": conversation,
+        "timestamp": datetime.now(UTC).isoformat(),
+    }
+
+
+async def replay_from_database(
+    after: int,
+    before: Optional[int] = None,
+    filters: FrozenSet = frozenset(),
+    limit: int = SSE_REPLAY_DB_LIMIT,
+    session_factory: Optional[async_sessionmaker] = None,
+) -> List[bytes]:
+    """
+    從資料庫補送 ID 介於 after 與 before 之間（不含兩端）的新對話事件
+
+    以主鍵範圍查詢，最多讀取 limit 筆；超過時在最後附上 replay_truncated 通知，
+    其中的 last_event_id 是已補送的最後一筆，客戶端可由此透過 API 繼續同步。
+    """
+    query = select(Conversation).where(Conversation.id > after)
+    if before is not None:
+        query = query.where(Conversation.id < before)
+    db = await open_session(session_factory)
+    try:
+        rows = (
+            (await db.execute(query.order_by(Conversation.id).limit(limit + 1)))
+            .scalars()
+            .all()
+        )
+    finally:
+        await db.close()
+
+    messages = []
+    for row in rows[:limit]:
+        event = conversation_event(conversation_data(row))
+        keys = event_keys(event)
+        if keys is None or filters <= keys:
+            messages.append(encode_frame(event, row.id))
+    if len(rows) > limit:
+        messages.append(
+            encode_frame(
+                {"type": "replay_truncated", "last_event_id": rows[limit - 1].id}
+            )
+        )
+    return messages
+
+
+async def replay_events(
+    last_event_id: int, filters: FrozenSet = frozenset()
+) -> List[bytes]:
+    """
+    返回 last_event_id 之後應補送的事件：重播緩衝區涵蓋的部分直接取出，更早的部分從資料庫讀取
+
+    緩衝區在第一個 await 之前就已取出；呼叫端須在註冊訂閱者後立即呼叫，
+    之後廣播的事件只會進入訂閱者的緩衝區。
+    """
+    history = event_manager.history
+    covered = history.covers(last_event_id)
+    floor = history.floor
+    replayed = history.since(last_event_id, filters)
+    if not covered:
+        before = None if floor is None else floor + 1
+        replayed = await replay_from_database(last_event_id, before, filters) + replayed
+    return replayed
+
+
+def replayed_ids(messages: List[bytes]) -> Optional[FrozenSet[int]]:
+    """補送訊息的事件 ID，沒有時返回 None"""
+    ids = frozenset(
+        event_id for event_id in map(frame_event_id, messages) if event_id is not None
+    )
+    return ids or None
+
+
+def skip_replayed(
+    messages: List[bytes], replayed: Optional[FrozenSet[int]]
+) -> Tuple[List[bytes], Optional[FrozenSet[int]]]:
+    """
+    略過已補送過的訊息（從資料庫補送後又被即時廣播的事件）
+
+    只略過 ID 在 replayed 中的事件；其他程序晚到的較小 ID 仍照常送出。返回保留的
+    訊息與之後仍需比對的 ID；遇到比已補送者都新的事件後不必再檢查，返回 None。
+    """
+    if replayed is None:
+        return messages, None
+    upto = max(replayed)
+    kept = []
+    for message in messages:
+        event_id = frame_event_id(message)
+        if event_id is None or replayed is None:
+            kept.append(message)
+        elif event_id not in replayed:
+            kept.append(message)
+            if event_id > upto:
+                replayed = None
+    return kept, replayed
+
+
+def parse_last_event_id(value: Optional[str]) -> Optional[int]:
+    """解析 Last-Event-ID，無法解析時視為未指定"""
+    if value is None:
+        return None
+    try:
+        return int(value.strip())
+    except ValueError:
+        return None
 
 
 # 創建一個全局事件管理器實例
 event_manager = EventManager()
 
+# 事件匯流排負責送給本程序與其他工作程序的客戶端，需在應用程式啟動時 start()
+event_bus = create_event_bus(
+    SSE_EVENT_BUS,
+    event_manager.broadcast,
+    SSE_EVENT_BUS_PATH,
+    poll_interval=SSE_EVENT_BUS_POLL_MS / 1000,
+)
+
+# 寫入路徑在交易提交後將事件交給背景派送器，不必等待廣播完成
+event_dispatcher = EventDispatcher(event_bus.publish, max_backlog=SSE_DISPATCH_BACKLOG)
+install_commit_hooks(event_dispatcher)
+
+# 重複查詢的結果快取，任何有寫入的交易提交後失效；SQLite 檔案另以 data_version
+# 偵測其他工作程序或命令列工具的寫入
+_cache_database_path = sqlite_file_path(DATABASE_URL)
+query_cache = QueryCache(
+    parse_cache_sizes(
+        ("search_conversations", "get_conversation"),
+        QUERY_CACHE_TOOLS,
+        QUERY_CACHE_SIZE,
+    ),
+    version=(
+        DataVersionWatcher(_cache_database_path) if _cache_database_path else None
+    ),
+)
+install_invalidation_hooks(query_cache)
+
 
 # 定義SSE端點
 @router.get("/events/")
-async def events(request: Request) -> StreamingResponse:
+async def events(
+    request: Request,
+    overflow: Optional[str] = Query(
+        None, description="緩衝區已滿時的處理方式：drop_oldest、disconnect 或 coalesce"
+    ),
+    session_id: Optional[str] = Query(
+        None, description="只接收此 session_id 的對話事件"
+    ),
+    role: Optional[str] = Query(None, description="只接收此角色的對話事件"),
+    metadata: List[str] = Query(
+        [], description="只接收 metadata 符合的對話事件，格式為 key:value，可重複指定"
+    ),
+    last_event_id: Optional[int] = Query(
+        None,
+        description="補送此事件 ID 之後的事件；重新連線時以 Last-Event-ID 標頭為準",
+    ),
+    batch_ms: Optional[float] = Query(
+        None, description="將此毫秒數內的對話事件合併為一則 new_conversations 訊息"
+    ),
+    batch_max: int = Query(
+        SSE_BATCH_MAX_EVENTS, description="每則合併訊息最多包含的事件數"
+    ),
+) -> StreamingResponse:
     """
     SSE端點，客戶端通過此端點訂閱實時事件
+
+    指定篩選條件時只會收到全部條件都符合的對話事件，篩選在伺服器端完成。
+    帶有 Last-Event-ID 時先補送之後的事件：重播緩衝區涵蓋的部分直接送出，
+    更早的部分從資料庫讀取。
+
+    指定 batch_ms 時，收到對話事件後最多再等待 batch_ms 毫秒或累積 batch_max 則，
+    合併成一則 new_conversations 訊息送出，減少高寫入量時的訊息與系統呼叫次數。
     """
+    if overflow is not None and overflow not in OVERFLOW_POLICIES:
+        raise HTTPException(
+            status_code=400, detail=f"overflow 只能是 {', '.join(OVERFLOW_POLICIES)}"
+        )
+    try:
+        filters = build_filters(session_id, role, metadata)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if batch_ms is not None and not 0 < batch_ms <= SSE_BATCH_MAX_WINDOW_MS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"batch_ms 必須介於 0 與 {SSE_BATCH_MAX_WINDOW_MS:g} 之間",
+        )
+    if batch_max < 1:
+        raise HTTPException(status_code=400, detail="batch_max 必須大於 0")
+    if event_manager.at_capacity:
+        event_manager.reject()
+        raise HTTPException(
+            status_code=503,
+            detail="SSE 連線數已達上限",
+            headers={"Retry-After": str(_RETRY_AFTER)},
+        )
 
-    async def event_generator() -> AsyncGenerator[str, None]:
-        # 註冊客戶端
-        client_queue = await event_manager.register()
+    # 瀏覽器的 EventSource 重新連線時會帶上最後收到的事件 ID
+    header = parse_last_event_id(request.headers.get("last-event-id"))
+    if header is not None:
+        last_event_id = header
 
-        # 發送一個初始連接成功消息
-        await client_queue.put('data: {"type": "connected"}\n\n')
+    async def event_generator() -> AsyncGenerator[bytes, None]:
+        # 註冊客戶端後立即取出重播緩衝區中的事件，兩者之間沒有 await，
+        # 之後廣播的事件只會進入客戶端的緩衝區，不會重複或遺漏
+        client = await event_manager.register(overflow, filters)
 
+        # 已補送的事件 ID；尚未廣播的事件可能已在資料庫中被補送，之後的即時事件須略過
+        replayed_upto = None
         try:
-            # 持續從隊列中獲取並發送事件
+            replayed = []
+            if last_event_id is not None:
+                replayed = await replay_events(last_event_id, filters)
+                replayed_upto = replayed_ids(replayed)
+                if batch_ms is not None:
+                    # 補送的事件同樣合併送出
+                    replayed = [
+                        pack_frames(replayed[start : start + batch_max])[0]
+                        for start in range(0, len(replayed), batch_max)
+                    ]
+
+            # 發送一個初始連接成功消息，接著是補送的事件
+            yield CONNECTED_FRAME
+            for message in replayed:
+                client.sending_since = time.monotonic()
+                yield message
+
+            # 持續從緩衝區中獲取並發送事件
             while True:
-                # 等待來自事件管理器的消息
-                message = await client_queue.get()
+                # 等待來自事件管理器的消息，因溢位或送出卡住被中斷時結束連線
+                try:
+                    message = await client.get(SSE_HEARTBEAT_INTERVAL or None)
+                except asyncio.TimeoutError:
+                    # 一段時間沒有事件：確認連線仍在並送出心跳，避免代理伺服器關閉閒置連線
+                    if await request.is_disconnected():
+                        break
+                    event_manager.heartbeats += 1
+                    client.sending_since = time.monotonic()
+                    yield HEARTBEAT_FRAME
+                    continue
+                if message is None:
+                    break
+                messages = [message]
+                waited = None
+                if batch_ms is not None and frame_event_id(message) is not None:
+                    # 在時間窗內繼續收集，稍後合併成一則訊息並以一次寫入送出
+                    started = time.monotonic()
+                    messages += await client.get_more(batch_max - 1, batch_ms / 1000)
+                    waited = time.monotonic() - started
+                messages, replayed_upto = skip_replayed(messages, replayed_upto)
+                if not messages:
+                    continue
+                message, frames = (
+                    pack_frames(messages) if len(messages) > 1 else (messages[0], 1)
+                )
+                if waited is not None:
+                    event_manager.record_batch(len(messages), frames, waited)
                 yield message
 
                 # 檢查客戶端是否斷開連接
                 if await request.is_disconnected():
                     break
         finally:
-            # 客戶端斷開連接時移除它
-            await event_manager.unregister(client_queue)
+            # 客戶端斷開連接時移除它（連線關閉時 StreamingResponse 會取消此產生器，也會執行到這裡）
+            await event_manager.unregister(client)
 
     # 返回StreamingResponse，設置正確的內容類型和其他頭部信息
     return StreamingResponse(
@@ -105,6 +586,21 @@ async def events(request: Request) -> StreamingResponse:
     )
 
 
+# 效能指標端點
+@router.get("/metrics/")
+async def metrics() -> Dict[str, Any]:
+    """
+    返回資料庫連接池等執行期指標
+    """
+    return {
+        "database": get_pool_stats(),
+        "events": event_manager.stats(),
+        "event_dispatcher": event_dispatcher.stats(),
+        "event_bus": event_bus.stats(),
+        "query_cache": query_cache.stats(),
+    }
+
+
 # 用於工具呼叫概念設計的模型
 class ToolCall(BaseModel):
     tool_name: str
@@ -187,6 +683,7 @@ def register_conversation_tools():
             search_conversations as search_conv_handler,
             get_all_conversations as get_all_conv_handler,
             get_conversation as get_conv_handler,
+            bulk_create_conversations as bulk_create_conv_handler,
         )
 
         # 註冊對話相關的工具
@@ -213,6 +710,12 @@ def register_conversation_tools():
             description="根據ID獲取單個對話記錄",
             handler_func=get_conv_handler,
         )
+
+        register_tool(
+            name="bulk_create_conversations",
+            description="批次創建對話記錄（記錄列表或 NDJSON 字串）",
+            handler_func=bulk_create_conv_handler,
+        )
     except ImportError as e:
         # Warning: Could not register conversation tools - removed print statement
         pass
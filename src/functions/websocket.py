@@ -0,0 +1,282 @@
+"""
+WebSocket 即時事件端點
+
+與 /api/events/ 使用相同的事件模型、篩選條件、重播與訂閱者緩衝區，另外支援：
+
+- encoding=json（文字訊息）或 msgpack（二進位訊息，需安裝 msgpack）
+- 連線中以 subscribe / unsubscribe 更換篩選條件，不必重新連線
+- window：未確認（ack）的事件訊息達到此數量時暫停送出，之後的事件留在
+  緩衝區中並依溢位策略處理
+- batch_ms / batch_max：與 SSE 相同的合併送出
+"""
+
+import asyncio
+import time
+from collections import deque
+from typing import Any, Deque, Dict, FrozenSet, List, Optional, Union
+
+from fastapi import APIRouter, Query, WebSocket, WebSocketDisconnect
+
+from src.events import (
+    OVERFLOW_POLICIES,
+    WS_ENCODINGS,
+    Subscriber,
+    build_filters,
+    decode_message,
+    encode_frame_for,
+    encode_message,
+    frame_event_id,
+    merge_frames,
+    msgpack_available,
+)
+from src.functions import server
+
+router = APIRouter()
+
+# 參數錯誤與連線數已滿（或緩衝區溢位被中斷）時的關閉代碼
+_POLICY_VIOLATION = 1008
+_TRY_AGAIN_LATER = 1013
+
+
+class EventFeed:
+    """單一 WebSocket 連線：從訂閱者緩衝區取出事件送出，並處理客戶端的控制訊息"""
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        client: Subscriber,
+        encoding: str = "json",
+        window: int = 0,
+        batch_ms: Optional[float] = None,
+        batch_max: int = server.SSE_BATCH_MAX_EVENTS,
+    ):
+        self.websocket = websocket
+        self.client = client
+        self.encoding = encoding
+        self.window = max(0, window)
+        self.batch_ms = batch_ms
+        self.batch_max = max(1, batch_max)
+        # 已送出但尚未確認的事件 ID（只在 window > 0 時記錄）
+        self.unacked: Deque[int] = deque()
+        self.replayed_upto: Optional[FrozenSet[int]] = None
+
+    @property
+    def can_send(self) -> bool:
+        return not self.window or len(self.unacked) < self.window
+
+    async def _send(self, data: Union[str, bytes]) -> None:
+        if isinstance(data, bytes):
+            await self.websocket.send_bytes(data)
+        else:
+            await self.websocket.send_text(data)
+
+    async def send_control(self, message: Dict[str, Any]) -> None:
+        await self._send(encode_message(message, self.encoding))
+
+    def merge(self, messages: List[bytes]) -> List[bytes]:
+        """合併送出時將連續的對話事件合併，每則最多 batch_max 則"""
+        if self.batch_ms is None or len(messages) < 2:
+            return messages
+        merged = []
+        for start in range(0, len(messages), self.batch_max):
+            merged += merge_frames(messages[start : start + self.batch_max])
+        return merged
+
+    async def send_frames(self, messages: List[bytes]) -> None:
+        """依序送出訂閱者緩衝區格式的訊息"""
+        for message in messages:
+            event_id = frame_event_id(message)
+            if self.window and event_id is not None:
+                self.unacked.append(event_id)
+            await self._send(encode_frame_for(message, self.encoding))
+        # 已交給連線送出，之後等待確認不算送出卡住
+        self.client.sending_since = None
+
+    async def collect_replay(self, last_event_id: Optional[int]) -> List[bytes]:
+        """
+        取出 last_event_id 之後應補送的事件
+
+        須在註冊或更換篩選條件後立即呼叫（見 server.replay_events）。
+        """
+        if last_event_id is None:
+            return []
+        replayed = await server.replay_events(last_event_id, self.client.filters)
+        self.replayed_upto = server.replayed_ids(replayed)
+        return self.merge(replayed)
+
+    async def next_messages(self) -> Optional[List[bytes]]:
+        """等待下一批事件；客戶端因溢位被中斷時返回 None"""
+        message = await self.client.get()
+        if message is None:
+            return None
+        messages = [message]
+        waited = None
+        if self.batch_ms is not None and frame_event_id(message) is not None:
+            started = time.monotonic()
+            messages += await self.client.get_more(
+                self.batch_max - 1, self.batch_ms / 1000
+            )
+            waited = time.monotonic() - started
+        messages, self.replayed_upto = server.skip_replayed(
+            messages, self.replayed_upto
+        )
+        frames = self.merge(messages)
+        if waited is not None and messages:
+            server.event_manager.record_batch(len(messages), len(frames), waited)
+        return frames
+
+    async def handle(self, data: Union[str, bytes]) -> None:
+        """處理客戶端送來的 subscribe、unsubscribe、ack 與 ping"""
+        try:
+            message = decode_message(data)
+        except ValueError as e:
+            await self.send_control({"type": "error", "detail": str(e)})
+            return
+        op = message.get("op")
+        if op == "ack":
+            try:
+                acked = int(message["id"])
+            except (KeyError, TypeError, ValueError):
+                await self.send_control({"type": "error", "detail": "ack 需要整數 id"})
+                return
+            # 累計確認：id 之前（含）的事件都視為已處理
+            while self.unacked and self.unacked[0] <= acked:
+                self.unacked.popleft()
+        elif op == "subscribe":
+            metadata = message.get("metadata") or []
+            if isinstance(metadata, str):
+                metadata = [metadata]
+            try:
+                filters = build_filters(
+                    message.get("session_id"), message.get("role"), metadata
+                )
+                last_event_id = message.get("last_event_id")
+                last_event_id = None if last_event_id is None else int(last_event_id)
+            except (TypeError, ValueError) as e:
+                await self.send_control({"type": "error", "detail": str(e)})
+                return
+            await server.event_manager.update_filters(self.client, filters)
+            replayed = await self.collect_replay(last_event_id)
+            await self.send_control(
+                {
+                    "type": "subscribed",
+                    "filters": {field: value for field, value in sorted(filters)},
+                }
+            )
+            await self.send_frames(replayed)
+        elif op == "unsubscribe":
+            # 只停止接收事件，連線關閉前仍計入 SSE_MAX_CONNECTIONS
+            await server.event_manager.pause(self.client)
+            await self.send_control({"type": "unsubscribed"})
+        elif op == "ping":
+            await self.send_control({"type": "pong"})
+        else:
+            await self.send_control({"type": "error", "detail": f"未知的操作: {op}"})
+
+    async def run(self) -> None:
+        """同時等待事件與客戶端訊息，直到連線關閉或客戶端因溢位被中斷"""
+        receive = asyncio.ensure_future(self.websocket.receive())
+        pending: Optional[asyncio.Future] = None
+        try:
+            while True:
+                if pending is None and self.can_send:
+                    pending = asyncio.ensure_future(self.next_messages())
+                waiting = {receive} if pending is None else {receive, pending}
+                done, _ = await asyncio.wait(
+                    waiting, return_when=asyncio.FIRST_COMPLETED
+                )
+
+                if pending in done:
+                    messages = pending.result()
+                    pending = None
+                    if messages is None:
+                        await self.websocket.close(
+                            code=_TRY_AGAIN_LATER, reason="緩衝區溢位"
+                        )
+                        return
+                    if messages:
+                        await self.send_frames(messages)
+
+                if receive in done:
+                    message = receive.result()
+                    if message["type"] == "websocket.disconnect":
+                        return
+                    await self.handle(message.get("text") or message.get("bytes"))
+                    receive = asyncio.ensure_future(self.websocket.receive())
+        finally:
+            for task in (receive, pending):
+                if task is not None:
+                    task.cancel()
+
+
+# WebSocket 事件端點
+@router.websocket("/events/ws")
+async def websocket_events(
+    websocket: WebSocket,
+    encoding: str = Query(
+        "json", description="訊息編碼：json（文字）或 msgpack（二進位）"
+    ),
+    overflow: Optional[str] = Query(
+        None, description="緩衝區已滿時的處理方式：drop_oldest、disconnect 或 coalesce"
+    ),
+    session_id: Optional[str] = Query(
+        None, description="只接收此 session_id 的對話事件"
+    ),
+    role: Optional[str] = Query(None, description="只接收此角色的對話事件"),
+    metadata: List[str] = Query(
+        [], description="只接收 metadata 符合的對話事件，格式為 key:value，可重複指定"
+    ),
+    last_event_id: Optional[int] = Query(None, description="補送此事件 ID 之後的事件"),
+    window: int = Query(0, description="未確認的事件訊息上限，0 代表不需要確認"),
+    batch_ms: Optional[float] = Query(
+        None, description="將此毫秒數內的對話事件合併為一則 new_conversations 訊息"
+    ),
+    batch_max: int = Query(
+        server.SSE_BATCH_MAX_EVENTS, description="每則合併訊息最多包含的事件數"
+    ),
+) -> None:
+    """
+    WebSocket 端點，事件模型與 /api/events/ 相同
+
+    連線後可送出 {"op": "subscribe", "session_id": ..., "role": ..., "metadata": [...],
+    "last_event_id": ...} 更換篩選條件、{"op": "unsubscribe"} 暫停接收、
+    {"op": "ack", "id": N} 確認 N 之前的事件，以及 {"op": "ping"}。
+    """
+    error = None
+    if encoding not in WS_ENCODINGS:
+        error = f"encoding 只能是 {', '.join(WS_ENCODINGS)}"
+    elif encoding == "msgpack" and not msgpack_available():
+        error = "伺服器未安裝 msgpack"
+    elif overflow is not None and overflow not in OVERFLOW_POLICIES:
+        error = f"overflow 只能是 {', '.join(OVERFLOW_POLICIES)}"
+    elif window < 0:
+        error = "window 不可為負數"
+    elif batch_ms is not None and not 0 < batch_ms <= server.SSE_BATCH_MAX_WINDOW_MS:
+        error = f"batch_ms 必須介於 0 與 {server.SSE_BATCH_MAX_WINDOW_MS:g} 之間"
+    elif batch_max < 1:
+        error = "batch_max 必須大於 0"
+    if error is None:
+        try:
+            filters = build_filters(session_id, role, metadata)
+        except ValueError as e:
+            error = str(e)
+    if error is not None:
+        await websocket.close(code=_POLICY_VIOLATION, reason=error)
+        return
+    if server.event_manager.at_capacity:
+        server.event_manager.reject()
+        await websocket.close(code=_TRY_AGAIN_LATER, reason="連線數已達上限")
+        return
+
+    await websocket.accept()
+    client = await server.event_manager.register(overflow, filters)
+    feed = EventFeed(websocket, client, encoding, window, batch_ms, batch_max)
+    try:
+        replayed = await feed.collect_replay(last_event_id)
+        await feed.send_control({"type": "connected"})
+        await feed.send_frames(replayed)
+        await feed.run()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await server.event_manager.unregister(client)
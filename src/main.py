@@ -3,26 +3,69 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+import asyncio
+
 from fastapi import FastAPI
 from contextlib import asynccontextmanager
-from typing import AsyncGenerator
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.ext.asyncio import AsyncEngine
+from typing import AsyncGenerator, Optional
 
-from .database import engine, Base, SessionLocal
+from .database import engine, Base, SessionLocal, dispose_engine
 from .functions.conversations import router as conversations_router
-from .functions.server import router as server_router, register_conversation_tools
+from .functions.websocket import router as websocket_router
+from .storage import install_cjk_index, install_fts, migrate
+from .functions.server import (
+    router as server_router,
+    event_bus,
+    event_dispatcher,
+    register_conversation_tools,
+)
+
+# 建立資料表失敗時的重試次數
+_SCHEMA_ATTEMPTS = 3
+
+
+def _install_sqlite_indexes(sync_conn) -> None:
+    """套用結構遷移，建立 FTS5 全文索引與 n-gram 倒排索引（含既有資料的回填與刪除觸發器）"""
+    raw_conn = sync_conn.connection
+    migrate(raw_conn)
+    install_fts(raw_conn)
+    install_cjk_index(raw_conn)
+
+
+async def init_schema(bind: Optional[AsyncEngine] = None) -> None:
+    """建立資料表；SQLite 另外套用結構遷移並建立全文與 n-gram 索引"""
+    async with (bind or engine).begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        if conn.dialect.name == "sqlite":
+            await conn.run_sync(_install_sqlite_indexes)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
-    # 在應用程式啟動時創建資料表
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    # 在應用程式啟動時創建資料表；多個工作程序同時啟動時可能與其他程序同時建立資料表
+    # 或套用同一個遷移而失敗，稍後重試時即可看到已完成的結構
+    for attempt in range(_SCHEMA_ATTEMPTS):
+        try:
+            await init_schema()
+            break
+        except (OperationalError, IntegrityError):
+            if attempt == _SCHEMA_ATTEMPTS - 1:
+                raise
+            await asyncio.sleep(0.5 * (attempt + 1))
 
     # 註冊對話相關工具
     register_conversation_tools()
 
+    # 開始接收其他工作程序發布的事件
+    await event_bus.start()
+
     yield
-    # 在應用程式關閉時清理資源 (如果需要)
+    # 送出尚未派送的事件並停止匯流排，再釋放共用引擎的連接
+    await event_dispatcher.stop()
+    await event_bus.stop()
+    await dispose_engine()
 
 
 app = FastAPI(lifespan=lifespan)
@@ -30,6 +73,7 @@ app = FastAPI(lifespan=lifespan)
 # 註冊路由器
 app.include_router(conversations_router, prefix="/api", tags=["conversations"])
 app.include_router(server_router, prefix="/api", tags=["server"])
+app.include_router(websocket_router, prefix="/api", tags=["server"])
 
 
 @app.get("/")
@@ -8,24 +8,108 @@ ContextRecord MCP Server
 
 import asyncio
 import logging
-from typing import Any, Dict, List, Optional, Sequence
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 from datetime import datetime, UTC
 import json
-import sqlite3
 import os
-from contextlib import asynccontextmanager
+import sys
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
 
 from fastapi import FastAPI, HTTPException, Body
 from mcp.server.fastmcp import FastMCP
 import uvicorn
 from pydantic import BaseModel
 
+# 直接以腳本執行時 (python src/mcp_server.py)，確保可以匯入 src 套件
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.storage import (
+    DEFAULT_CACHE_SIZE,
+    DEFAULT_CHUNK_SIZE,
+    DEFAULT_EMBEDDING_DIM,
+    DEFAULT_MAX_SNIPPETS,
+    DEFAULT_SNIPPET_CONTEXT,
+    HIGHLIGHT_END,
+    HIGHLIGHT_START,
+    DEFAULT_NPROBE,
+    DEFAULT_RERANK,
+    DatabaseExecutor,
+    DataVersionWatcher,
+    EmbeddingStore,
+    GroupCommitWriter,
+    IVFPQIndex,
+    QueryCache,
+    SQLitePool,
+    build_match_query,
+    build_search_sql,
+    build_snippets,
+    build_filter_sql,
+    build_index,
+    bulk_insert,
+    contains_cjk,
+    decode_cursor,
+    default_index_path,
+    default_store_path,
+    embed_texts,
+    encode_cursor,
+    filter_ids,
+    id_ranges,
+    index_conversations,
+    install_cjk_index,
+    install_fts,
+    keyset_params,
+    lexical_ranking,
+    match_spans,
+    migrate,
+    page_ids_by_time,
+    parse_cache_sizes,
+    parse_ndjson,
+    pragmas_from_env,
+    reciprocal_rank_fusion,
+    search_cjk_index,
+    search_params,
+    validate_conversations,
+)
+from src.storage.migrations import CONVERSATIONS_SCHEMA
+from src.storage.pagination import KEYSET_BEFORE_SQL
+
 # 設定日誌
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # 資料庫設定
 DATABASE_PATH = os.getenv("DATABASE_PATH", "data/conversations.db")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "256"))
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", str(DB_POOL_SIZE)))
+DB_WRITE_BATCH_SIZE = int(os.getenv("DB_WRITE_BATCH_SIZE", "256"))
+DB_WRITE_MAX_WAIT_MS = float(os.getenv("DB_WRITE_MAX_WAIT_MS", "0"))
+DB_BULK_CHUNK_SIZE = int(os.getenv("DB_BULK_CHUNK_SIZE", str(DEFAULT_CHUNK_SIZE)))
+EMBEDDING_STORE_PATH = os.getenv(
+    "EMBEDDING_STORE_PATH", default_store_path(DATABASE_PATH)
+)
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", str(DEFAULT_EMBEDDING_DIM)))
+ANN_INDEX_PATH = os.getenv("ANN_INDEX_PATH", default_index_path(DATABASE_PATH))
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", str(DEFAULT_NPROBE)))
+ANN_RERANK = int(os.getenv("ANN_RERANK", str(DEFAULT_RERANK)))
+ANN_MIN_ROWS = int(os.getenv("ANN_MIN_ROWS", "100000"))
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "50"))
+# 有篩選條件時，語意檢索多取的候選倍數（篩選在取出候選之後套用）
+HYBRID_FILTER_OVERSAMPLE = 4
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", str(DEFAULT_CACHE_SIZE)))
+QUERY_CACHE_TOOLS = os.getenv("QUERY_CACHE_TOOLS")
+
+# 重複查詢的結果快取，任何寫入或刪除提交後失效；其他程序的寫入以 data_version 偵測
+query_cache = QueryCache(
+    parse_cache_sizes(
+        ("search_conversations", "conversations_recent"),
+        QUERY_CACHE_TOOLS,
+        QUERY_CACHE_SIZE,
+    ),
+    version=DataVersionWatcher(DATABASE_PATH),
+)
 
 # 自動記錄狀態管理
 AUTO_RECORDING_SESSIONS = {}  # 存儲每個會話的自動記錄設定
@@ -65,22 +149,13 @@ async def auto_record_message(
         return False
 
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
         # 添加會話 ID 到 metadata
         if metadata is None:
             metadata = {}
         metadata["session_id"] = session_id
         metadata["auto_recorded"] = True
 
-        cursor.execute(
-            "INSERT INTO conversations (role, content, metadata) VALUES (?, ?, ?)",
-            (role, content, json.dumps(metadata)),
-        )
-
-        conn.commit()
-        conn.close()
+        await get_db_writer().insert(role, content, json.dumps(metadata))
 
         logger.info(f"自動記錄 {role} 訊息: {content[:50]}...")
         return True
@@ -92,30 +167,164 @@ async def auto_record_message(
 
 def init_database():
     """初始化資料庫"""
-    os.makedirs(os.path.dirname(DATABASE_PATH), exist_ok=True)
-
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-
-    cursor.execute(
-        """
-        CREATE TABLE IF NOT EXISTS conversations (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            role TEXT NOT NULL,
-            content TEXT NOT NULL,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-            metadata TEXT
-        )
-    """
-    )
+    db_dir = os.path.dirname(DATABASE_PATH)
+    if db_dir:
+        os.makedirs(db_dir, exist_ok=True)
+
+    with get_db_connection() as conn:
+        conn.execute(CONVERSATIONS_SCHEMA)
+        migrate(conn)
+        install_fts(conn)
+        install_cjk_index(conn)
+        conn.commit()
+
+
+_db_pool: Optional[SQLitePool] = None
+_db_pool_lock = threading.Lock()
+
 
-    conn.commit()
-    conn.close()
+def get_db_pool() -> SQLitePool:
+    """獲取（必要時建立）全域資料庫連接池"""
+    global _db_pool
+    if _db_pool is None:
+        with _db_pool_lock:
+            if _db_pool is None:
+                _db_pool = SQLitePool(
+                    DATABASE_PATH,
+                    pool_size=DB_POOL_SIZE,
+                    pragmas=pragmas_from_env(),
+                    cached_statements=DB_STATEMENT_CACHE_SIZE,
+                )
+    return _db_pool
 
 
+def close_db_pool() -> None:
+    """關閉全域資料庫連接池"""
+    global _db_pool
+    with _db_pool_lock:
+        if _db_pool is not None:
+            _db_pool.close()
+            _db_pool = None
+
+
+@contextmanager
 def get_db_connection():
-    """獲取資料庫連接"""
-    return sqlite3.connect(DATABASE_PATH)
+    """從連接池借用資料庫連接，離開區塊時自動歸還"""
+    with get_db_pool().connection() as conn:
+        yield conn
+
+
+_db_executor: Optional[DatabaseExecutor] = None
+
+
+def get_db_executor() -> DatabaseExecutor:
+    """獲取（必要時建立）全域資料庫執行層"""
+    global _db_executor
+    if _db_executor is None:
+        with _db_pool_lock:
+            if _db_executor is None:
+                _db_executor = DatabaseExecutor(
+                    get_db_connection, max_workers=DB_EXECUTOR_WORKERS
+                )
+    return _db_executor
+
+
+def close_db_executor() -> None:
+    """關閉全域資料庫執行層"""
+    global _db_executor
+    with _db_pool_lock:
+        executor, _db_executor = _db_executor, None
+    if executor is not None:
+        executor.shutdown()
+
+
+async def run_db(func, *args, **kwargs):
+    """在資料庫執行緒池中執行 func(conn, ...)，不阻塞事件迴圈"""
+    return await get_db_executor().run(func, *args, **kwargs)
+
+
+_db_writer: Optional[GroupCommitWriter] = None
+
+
+def get_db_writer() -> GroupCommitWriter:
+    """獲取（必要時建立）全域群組提交寫入器"""
+    global _db_writer
+    if _db_writer is None:
+        with _db_pool_lock:
+            if _db_writer is None:
+                _db_writer = GroupCommitWriter(
+                    run_db,
+                    max_batch_size=DB_WRITE_BATCH_SIZE,
+                    max_wait_ms=DB_WRITE_MAX_WAIT_MS,
+                    after_insert=index_conversations,
+                    after_commit=after_write_commit,
+                )
+    return _db_writer
+
+
+_embedding_store: Optional[EmbeddingStore] = None
+
+
+def get_embedding_store() -> EmbeddingStore:
+    """獲取（必要時開啟）全域語意向量儲存"""
+    global _embedding_store
+    if _embedding_store is None:
+        with _db_pool_lock:
+            if _embedding_store is None:
+                _embedding_store = EmbeddingStore(EMBEDDING_STORE_PATH, EMBEDDING_DIM)
+    return _embedding_store
+
+
+def close_embedding_store() -> None:
+    """關閉全域語意向量儲存"""
+    global _embedding_store
+    with _db_pool_lock:
+        store, _embedding_store = _embedding_store, None
+    if store is not None:
+        store.close()
+
+
+_vector_index: Optional[IVFPQIndex] = None
+
+
+def get_vector_index() -> IVFPQIndex:
+    """獲取（必要時載入）全域近似最近鄰索引"""
+    global _vector_index
+    if _vector_index is None:
+        store = get_embedding_store()
+        with _db_pool_lock:
+            if _vector_index is None:
+                _vector_index = IVFPQIndex(
+                    store, ANN_INDEX_PATH, nprobe=ANN_NPROBE, rerank=ANN_RERANK
+                )
+    return _vector_index
+
+
+def close_vector_index() -> None:
+    """關閉全域近似最近鄰索引"""
+    global _vector_index
+    with _db_pool_lock:
+        index, _vector_index = _vector_index, None
+    if index is not None:
+        index.close()
+
+
+def sync_vectors(conn, inserted=None) -> None:
+    """
+    為新對話補上向量並加入近似索引（寫入器提交後的掛鉤）
+
+    向量儲存尚未開啟（沒有使用過語意搜尋）時略過，由第一次搜尋一併補上。
+    """
+    if _embedding_store is None:
+        return
+    index = get_vector_index()
+    _embedding_store.sync(conn, on_embed=index.add)
+
+
+def after_write_commit(conn, inserted) -> None:
+    """寫入器提交後的掛鉤：使查詢快取失效，並為新對話補上向量"""
+    query_cache.invalidate()
+    sync_vectors(conn, inserted)
 
 
 @asynccontextmanager
@@ -124,8 +333,13 @@ async def lifespan(app: FastAPI):
     init_database()
     logger.info("ContextRecord MCP Server 正在啟動...")
     yield
-    # 應用程式關閉時執行 (如果需要清理資源)
+    # 應用程式關閉時執行
     logger.info("ContextRecord MCP Server 正在關閉...")
+    await get_db_writer().stop()
+    close_db_executor()
+    close_db_pool()
+    close_vector_index()
+    close_embedding_store()
 
 
 # 創建 MCP 伺服器
@@ -138,20 +352,32 @@ mcp_app_instance = FastMCP(
     description="一個用於記錄和搜尋對話內容的 MCP 伺服器。提供對話記錄、搜尋和管理功能。",
 )
 
+
 # 新增標準 FastAPI 端點來提供最近的對話記錄
 @app.get("/conversations/recent", operation_id="conversations_recent")
-async def get_recent_conversations() -> List[Dict[str, Any]]:
-    """獲取最近的對話記錄"""
+async def get_recent_conversations(
+    session_id: Optional[str] = None, role: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """獲取最近的對話記錄，可依會話或角色篩選"""
+    cache_key = (session_id, role)
+    cached = query_cache.get("conversations_recent", cache_key)
+    if cached is not None:
+        return list(cached)
+    generation = query_cache.generation
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        cursor.execute(
-            "SELECT id, role, content, timestamp, metadata FROM conversations ORDER BY timestamp DESC LIMIT 10"
-        )
-
-        rows = cursor.fetchall()
-        conn.close()
+        sql_query = "SELECT id, role, content, timestamp, metadata FROM conversations"
+        conditions, params = [], []
+        if session_id is not None:
+            conditions.append("session_id = ?")
+            params.append(session_id)
+        if role is not None:
+            conditions.append("role = ?")
+            params.append(role)
+        if conditions:
+            sql_query += " WHERE " + " AND ".join(conditions)
+        sql_query += " ORDER BY timestamp DESC LIMIT 10"
+
+        rows = await run_db(lambda conn: conn.execute(sql_query, params).fetchall())
 
         conversations = []
         for row in rows:
@@ -165,7 +391,8 @@ async def get_recent_conversations() -> List[Dict[str, Any]]:
                 }
             )
 
-        return conversations
+        query_cache.put("conversations_recent", cache_key, conversations, generation)
+        return list(conversations)
 
     except Exception as e:
         logger.error(f"獲取最近對話資源時發生錯誤: {e}")
@@ -184,9 +411,6 @@ async def create_conversation(request: CreateConversationRequest) -> Dict[str, A
     """創建新的對話記錄"""
     logger.info(f"調用工具: create_conversation, 參數: {request.role}, {request.content}, {request.metadata}")
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
         # 解析 metadata
         metadata_dict = None
         if request.metadata:
@@ -195,15 +419,12 @@ async def create_conversation(request: CreateConversationRequest) -> Dict[str, A
             except json.JSONDecodeError:
                 metadata_dict = {"raw": request.metadata}
 
-        cursor.execute(
-            "INSERT INTO conversations (role, content, metadata) VALUES (?, ?, ?)",
-            (request.role, request.content, json.dumps(metadata_dict) if metadata_dict else None),
+        conversation_id = await get_db_writer().insert(
+            request.role,
+            request.content,
+            json.dumps(metadata_dict) if metadata_dict else None,
         )
 
-        conversation_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-
         result = {
             "success": True,
             "conversation_id": conversation_id,
@@ -217,6 +438,49 @@ async def create_conversation(request: CreateConversationRequest) -> Dict[str, A
         return {"success": False, "error": str(e)}
 
 
+class BulkCreateConversationsRequest(BaseModel):
+    # 對話記錄陣列，每筆包含 role、content 與可選的 metadata
+    conversations: Optional[List[Any]] = None
+    # 或以 NDJSON 字串提供（每行一筆），與 conversations 擇一
+    ndjson: Optional[str] = None
+
+
+@mcp_app_instance.tool()
+@app.post("/tools/bulk_create_conversations", operation_id="bulk_create_conversations")
+async def bulk_create_conversations(
+    request: BulkCreateConversationsRequest,
+) -> Dict[str, Any]:
+    """批次創建對話記錄，用於匯入大量歷史對話"""
+    try:
+        if request.ndjson is not None:
+            items, errors = parse_ndjson(request.ndjson)
+        else:
+            items, errors = request.conversations or [], []
+        logger.info(f"調用工具: bulk_create_conversations, 記錄數: {len(items)}")
+
+        rows, invalid = validate_conversations(
+            items, skip=[error["index"] for error in errors]
+        )
+        ids, failed = await run_db(
+            bulk_insert, rows, DB_BULK_CHUNK_SIZE, index_conversations
+        )
+        if ids:
+            query_cache.invalidate()
+        errors = sorted(errors + invalid + failed, key=lambda error: error["index"])
+
+        return {
+            "success": True,
+            "total": len(items),
+            "inserted": len(ids),
+            "id_ranges": id_ranges(ids),
+            "errors": errors,
+        }
+
+    except Exception as e:
+        logger.error(f"批次創建對話時發生錯誤: {e}")
+        return {"success": False, "error": str(e)}
+
+
 class AutoRecordConversationRequest(BaseModel):
     user_message: str
     assistant_response: str
@@ -322,6 +586,23 @@ async def get_auto_recording_status(request: GetAutoRecordingStatusRequest) -> D
 class SearchConversationsRequest(BaseModel):
     query: str
     limit: Optional[int] = None
+    recency_boost: Optional[float] = None
+    # 分頁游標：傳入上一頁最後一筆結果的 cursor，結果依時間由新到舊排列
+    cursor: Optional[str] = None
+    # 排序方式：relevance（相關度，預設）或 recent（時間由新到舊，可搭配 cursor 分頁）
+    sort: Optional[str] = None
+    # 為 True 時以命中位置附近的片段（snippets）取代完整內容
+    snippets: Optional[bool] = False
+    # 片段中命中位置前後保留的字元數
+    snippet_context: Optional[int] = DEFAULT_SNIPPET_CONTEXT
+    # 每筆記錄最多返回的片段數
+    max_snippets: Optional[int] = DEFAULT_MAX_SNIPPETS
+    # 包住命中文字的標記
+    highlight_start: Optional[str] = HIGHLIGHT_START
+    highlight_end: Optional[str] = HIGHLIGHT_END
+
+
+SEARCH_COLUMNS = ["id", "role", "content", "timestamp", "metadata"]
 
 
 @mcp_app_instance.tool()
@@ -329,57 +610,374 @@ class SearchConversationsRequest(BaseModel):
 async def search_conversations(request: SearchConversationsRequest) -> List[Dict[str, Any]]:
     """搜尋對話記錄"""
     logger.info(f"調用工具: search_conversations, 參數: {request.query}, {request.limit}")
+    if request.sort not in (None, "relevance", "recent"):
+        raise HTTPException(status_code=400, detail="sort 只能是 relevance 或 recent")
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        # 使用 LIKE 進行簡單的內容模糊搜尋
-        sql_query = "SELECT id, role, content, timestamp, metadata FROM conversations WHERE content LIKE ? ORDER BY timestamp DESC"
-        params = [f"%{request.query}%"]
+        cursor = decode_cursor(request.cursor) if request.cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if request.snippets and (request.max_snippets or 0) <= 0:
+        raise HTTPException(status_code=400, detail="max_snippets 必須大於 0")
+    by_time = cursor is not None or request.sort == "recent"
+    select_columns = ", ".join(f"c.{column}" for column in SEARCH_COLUMNS)
+    cache_key = tuple(request.model_dump().values())
+    cached = query_cache.get("search_conversations", cache_key)
+    if cached is not None:
+        return list(cached)
+    generation = query_cache.generation
 
-        if request.limit:
-            sql_query += " LIMIT ?"
-            params.append(request.limit)
+    try:
 
-        cursor.execute(sql_query, params)
+        def search(conn):
+            if contains_cjk(request.query):
+                # 中日韓文字使用 n-gram 倒排索引，結果由新到舊排列
+                matches = search_cjk_index(conn, request.query)
+                if matches is not None:
+                    offsets.update(matches)
+                    if by_time:
+                        ids = page_ids_by_time(
+                            conn, list(matches), request.limit or None, cursor
+                        )
+                    else:
+                        ids = sorted(matches, reverse=True)[: request.limit or None]
+                    if not ids:
+                        return []
+                    placeholders = ", ".join("?" * len(ids))
+                    order = "c.timestamp DESC, c.id DESC" if by_time else "c.id DESC"
+                    return conn.execute(
+                        f"SELECT {select_columns} FROM conversations AS c WHERE c.id IN ({placeholders}) ORDER BY {order}",
+                        ids,
+                    ).fetchall()
+            else:
+                match_query = build_match_query(request.query)
+                if match_query:
+                    # 使用 FTS5 全文索引，依 BM25 相關度排序
+                    sql_query = build_search_sql(
+                        SEARCH_COLUMNS,
+                        recency_boost=bool(request.recency_boost),
+                        order_by_time=by_time,
+                        after_cursor=cursor is not None,
+                    )
+                    params = search_params(
+                        match_query,
+                        request.limit or -1,
+                        request.recency_boost or 0.0,
+                        cursor=cursor,
+                    )
+                    return conn.execute(sql_query, params).fetchall()
+
+            # 索引無法回答的查詢（例如單一中文字），使用 LIKE 進行內容模糊搜尋
+            sql_query = f"SELECT {select_columns} FROM conversations AS c WHERE c.content LIKE ?"
+            params = [f"%{request.query}%"]
+            if cursor is not None:
+                sql_query += f" AND {KEYSET_BEFORE_SQL}"
+                params.extend(keyset_params(cursor))
+            sql_query += " ORDER BY c.timestamp DESC, c.id DESC"
+
+            if request.limit:
+                sql_query += " LIMIT ?"
+                params.append(request.limit)
+            return conn.execute(sql_query, params).fetchall()
+
+        # 中文倒排索引返回的命中位置，供片段使用
+        offsets: Dict[int, List[int]] = {}
+
+        def search_with_spans(conn):
+            rows = search(conn)
+            if not request.snippets:
+                return rows, None
+            spans = match_spans(
+                conn, request.query, [(row[0], row[2]) for row in rows], offsets or None
+            )
+            return rows, spans
 
-        rows = cursor.fetchall()
-        conn.close()
+        rows, spans = await run_db(search_with_spans)
 
         conversations = []
         for row in rows:
-            conversations.append(
-                {
-                    "id": row[0],
-                    "role": row[1],
-                    "content": row[2],
-                    "timestamp": row[3],
-                    "metadata": json.loads(row[4]) if row[4] else None,
-                }
-            )
-        return conversations
+            conversation = {
+                "id": row[0],
+                "role": row[1],
+                "content": row[2],
+                "timestamp": row[3],
+                "metadata": json.loads(row[4]) if row[4] else None,
+                "cursor": encode_cursor(row[3], row[0]),
+            }
+            if spans is not None:
+                # 以片段取代完整內容，回應大小與內容長度無關
+                del conversation["content"]
+                conversation["content_length"] = len(row[2])
+                conversation["snippets"] = build_snippets(
+                    row[2],
+                    spans.get(row[0], []),
+                    (
+                        request.snippet_context
+                        if request.snippet_context is not None
+                        else DEFAULT_SNIPPET_CONTEXT
+                    ),
+                    request.max_snippets,
+                    request.highlight_start or "",
+                    request.highlight_end or "",
+                )
+            conversations.append(conversation)
+        query_cache.put("search_conversations", cache_key, conversations, generation)
+        return list(conversations)
 
     except Exception as e:
         logger.error(f"搜尋對話記錄時發生錯誤: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def semantic_hits(
+    conn,
+    query: str,
+    limit: int,
+    min_score: float = 0.0,
+    nprobe: Optional[int] = None,
+    exact: bool = False,
+) -> List[Tuple[int, float]]:
+    """
+    返回語意最相近的 (id, score)，需在資料庫執行緒中呼叫
+
+    先為新對話補上向量；近似索引已訓練時使用索引，否則以暴力搜尋。
+    """
+    store = get_embedding_store()
+    index = get_vector_index()
+    # 其他程序重建索引後改用新的索引
+    index.refresh()
+    # 先為尚未計算向量的新對話補上向量，只讀取 last_id 之後的記錄
+    store.sync(conn, on_embed=index.add)
+    if not index.trained and not index.building and store.last_id >= ANN_MIN_ROWS:
+        # 對話數達到門檻後在背景訓練索引，訓練期間仍使用暴力搜尋
+        threading.Thread(target=build_index, args=(index,), daemon=True).start()
+    if index.trained and not exact:
+        vector = embed_texts([query], store.dim)[0]
+        return (
+            index.search(vector, limit, min_score, nprobe=nprobe)[0]
+            if vector.any()
+            else []
+        )
+    return store.search_text(query, limit, min_score)
+
+
+class SemanticSearchRequest(BaseModel):
+    query: str
+    limit: Optional[int] = 10
+    # 相似度下限（餘弦相似度，-1 到 1），低於或等於此值的結果不返回
+    min_score: Optional[float] = None
+    # 近似索引每次探查的群數，越大召回率越高、延遲越長（預設 ANN_NPROBE）
+    nprobe: Optional[int] = None
+    # 為 True 時不使用近似索引，以暴力搜尋取得精確結果
+    exact: Optional[bool] = False
+
+
+@mcp_app_instance.tool()
+@app.post("/tools/semantic_search", operation_id="semantic_search")
+async def semantic_search(request: SemanticSearchRequest) -> List[Dict[str, Any]]:
+    """依語意相似度搜尋對話記錄，結果依相似度由高到低排列"""
+    logger.info(f"調用工具: semantic_search, 參數: {request.query}, {request.limit}")
+    if request.limit is not None and request.limit <= 0:
+        raise HTTPException(status_code=400, detail="limit 必須大於 0")
+    if request.nprobe is not None and request.nprobe <= 0:
+        raise HTTPException(status_code=400, detail="nprobe 必須大於 0")
+    select_columns = ", ".join(SEARCH_COLUMNS)
+
+    try:
+
+        def search(conn):
+            store = get_embedding_store()
+            hits = semantic_hits(
+                conn,
+                request.query,
+                request.limit or 10,
+                request.min_score or 0.0,
+                request.nprobe,
+                request.exact,
+            )
+            if not hits:
+                return [], {}
+            ids = [conversation_id for conversation_id, _ in hits]
+            placeholders = ", ".join("?" * len(ids))
+            rows = conn.execute(
+                f"SELECT {select_columns} FROM conversations WHERE id IN ({placeholders})",
+                ids,
+            ).fetchall()
+            by_id = {row[0]: row for row in rows}
+            # 已被刪除的對話從向量儲存中移除
+            store.remove(
+                conversation_id
+                for conversation_id in ids
+                if conversation_id not in by_id
+            )
+            return [
+                by_id[conversation_id]
+                for conversation_id in ids
+                if conversation_id in by_id
+            ], dict(hits)
+
+        rows, scores = await run_db(search)
+
+        return [
+            {
+                "id": row[0],
+                "role": row[1],
+                "content": row[2],
+                "timestamp": row[3],
+                "metadata": json.loads(row[4]) if row[4] else None,
+                "score": scores[row[0]],
+            }
+            for row in rows
+        ]
+
+    except Exception as e:
+        logger.error(f"語意搜尋時發生錯誤: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+class HybridSearchRequest(BaseModel):
+    query: str
+    limit: Optional[int] = 10
+    # 篩選條件：角色、會話，以及時間範圍（since 含、until 不含，ISO 8601）
+    role: Optional[str] = None
+    session_id: Optional[str] = None
+    since: Optional[str] = None
+    until: Optional[str] = None
+    # 關鍵字與語意檢索各取前幾名參與融合（預設 HYBRID_CANDIDATES）
+    candidates: Optional[int] = None
+    # 為 True 時返回各階段耗時與每筆結果在兩種檢索中的名次
+    debug: Optional[bool] = False
+
+
+def _timed(conn, func):
+    """在資料庫執行緒中執行 func(conn)，返回 (結果, 耗時毫秒)"""
+    started = time.perf_counter()
+    result = func(conn)
+    return result, (time.perf_counter() - started) * 1000
+
+
+@mcp_app_instance.tool()
+@app.post("/tools/hybrid_search", operation_id="hybrid_search")
+async def hybrid_search(request: HybridSearchRequest) -> Dict[str, Any]:
+    """同時以關鍵字與語意搜尋對話記錄，並以倒數排名融合（RRF）合併結果"""
+    logger.info(f"調用工具: hybrid_search, 參數: {request.query}, {request.limit}")
+    if request.limit is not None and request.limit <= 0:
+        raise HTTPException(status_code=400, detail="limit 必須大於 0")
+    if request.candidates is not None and request.candidates <= 0:
+        raise HTTPException(status_code=400, detail="candidates 必須大於 0")
+    try:
+        filter_sql, filter_params = build_filter_sql(
+            request.role, request.session_id, request.since, request.until
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    limit = request.limit or 10
+    depth = max(request.candidates or HYBRID_CANDIDATES, limit)
+    select_columns = ", ".join(SEARCH_COLUMNS)
+
+    try:
+        started = time.perf_counter()
+
+        def lexical(conn):
+            return lexical_ranking(
+                conn, request.query, depth, filter_sql, filter_params
+            )
+
+        def semantic(conn):
+            count = depth * HYBRID_FILTER_OVERSAMPLE if filter_sql else depth
+            ids = [
+                conversation_id
+                for conversation_id, _ in semantic_hits(conn, request.query, count)
+            ]
+            return filter_ids(conn, ids, filter_sql, filter_params)[:depth]
+
+        # 兩種檢索在不同的資料庫執行緒中同時進行
+        (lexical_ids, lexical_ms), (semantic_ids, semantic_ms) = await asyncio.gather(
+            run_db(_timed, lexical), run_db(_timed, semantic)
+        )
+
+        fusion_started = time.perf_counter()
+        fused = reciprocal_rank_fusion([lexical_ids, semantic_ids])[:limit]
+        fusion_ms = (time.perf_counter() - fusion_started) * 1000
+
+        def fetch(conn):
+            if not fused:
+                return []
+            ids = [conversation_id for conversation_id, _ in fused]
+            placeholders = ", ".join("?" * len(ids))
+            return conn.execute(
+                f"SELECT {select_columns} FROM conversations WHERE id IN ({placeholders})",
+                ids,
+            ).fetchall()
+
+        rows, fetch_ms = await run_db(_timed, fetch)
+        by_id = {row[0]: row for row in rows}
+        lexical_ranks = {
+            conversation_id: rank
+            for rank, conversation_id in enumerate(lexical_ids, start=1)
+        }
+        semantic_ranks = {
+            conversation_id: rank
+            for rank, conversation_id in enumerate(semantic_ids, start=1)
+        }
+
+        results = []
+        for conversation_id, score in fused:
+            row = by_id.get(conversation_id)
+            if row is None:
+                # 檢索後才被刪除的記錄
+                continue
+            result = {
+                "id": row[0],
+                "role": row[1],
+                "content": row[2],
+                "timestamp": row[3],
+                "metadata": json.loads(row[4]) if row[4] else None,
+                "score": score,
+            }
+            if request.debug:
+                result["ranks"] = {
+                    "lexical": lexical_ranks.get(conversation_id),
+                    "semantic": semantic_ranks.get(conversation_id),
+                }
+            results.append(result)
+
+        response: Dict[str, Any] = {"success": True, "results": results}
+        if request.debug:
+            response["candidates"] = {
+                "lexical": len(lexical_ids),
+                "semantic": len(semantic_ids),
+            }
+            response["timings_ms"] = {
+                "lexical": lexical_ms,
+                "semantic": semantic_ms,
+                "fusion": fusion_ms,
+                "fetch": fetch_ms,
+                "total": (time.perf_counter() - started) * 1000,
+            }
+        return response
+
+    except Exception as e:
+        logger.error(f"混合搜尋時發生錯誤: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @mcp_app_instance.tool()
 @app.post("/tools/get_conversation_stats", operation_id="get_conversation_stats")
 async def get_conversation_stats() -> Dict[str, Any]:
     """獲取對話統計信息"""
     logger.info("調用工具: get_conversation_stats")
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
 
-        cursor.execute("SELECT COUNT(*) FROM conversations")
-        total_conversations = cursor.fetchone()[0]
-
-        cursor.execute("SELECT role, COUNT(*) FROM conversations GROUP BY role")
-        role_counts = dict(cursor.fetchall())
+        def collect(conn):
+            total = conn.execute("SELECT COUNT(*) FROM conversations").fetchone()[0]
+            counts = dict(
+                conn.execute(
+                    "SELECT role, COUNT(*) FROM conversations GROUP BY role"
+                ).fetchall()
+            )
+            return total, counts
 
-        conn.close()
+        total_conversations, role_counts = await run_db(collect)
 
         return {
             "success": True,
@@ -392,6 +990,30 @@ async def get_conversation_stats() -> Dict[str, Any]:
         return {"success": False, "error": str(e)}
 
 
+@mcp_app_instance.tool()
+@app.post("/tools/get_server_metrics", operation_id="get_server_metrics")
+async def get_server_metrics() -> Dict[str, Any]:
+    """獲取伺服器效能指標（連接池使用狀況等）"""
+    logger.info("調用工具: get_server_metrics")
+    try:
+        return {
+            "success": True,
+            "db_pool": get_db_pool().stats(),
+            "db_executor": get_db_executor().stats(),
+            "db_writer": get_db_writer().stats(),
+            "embeddings": (
+                _embedding_store.stats() if _embedding_store is not None else None
+            ),
+            "vector_index": (
+                _vector_index.stats() if _vector_index is not None else None
+            ),
+            "query_cache": query_cache.stats(),
+        }
+    except Exception as e:
+        logger.error(f"獲取伺服器效能指標時發生錯誤: {e}")
+        return {"success": False, "error": str(e)}
+
+
 class DeleteConversationRequest(BaseModel):
     conversation_id: int
 
@@ -402,18 +1024,23 @@ async def delete_conversation(request: DeleteConversationRequest) -> Dict[str, A
     """刪除指定 ID 的對話記錄"""
     logger.info(f"調用工具: delete_conversation, 參數: {request.conversation_id}")
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
 
-        cursor.execute("DELETE FROM conversations WHERE id = ?", (request.conversation_id,))
-        conn.commit()
-
-        if cursor.rowcount > 0:
+        def delete(conn):
+            cursor = conn.execute(
+                "DELETE FROM conversations WHERE id = ?", (request.conversation_id,)
+            )
+            conn.commit()
+            if cursor.rowcount:
+                query_cache.invalidate()
+                if _embedding_store is not None:
+                    _embedding_store.remove([request.conversation_id])
+            return cursor.rowcount
+
+        if await run_db(delete) > 0:
             result = {"success": True, "message": f"成功刪除對話記錄 ID: {request.conversation_id}"}
         else:
             result = {"success": False, "message": f"未找到對話記錄 ID: {request.conversation_id}"}
 
-        conn.close()
         return result
 
     except Exception as e:
@@ -431,16 +1058,13 @@ async def conversation_summary(request: ConversationIdsRequest) -> str:
     """根據提供的對話 ID 生成對話摘要"""
     logger.info(f"調用工具: conversation_summary, 參數: {request.conversation_ids}")
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
         # 構建 SQL 查詢，用於根據 ID 列表獲取對話內容
         placeholders = ", ".join("?" * len(request.conversation_ids))
         query = f"SELECT role, content FROM conversations WHERE id IN ({placeholders}) ORDER BY timestamp ASC"
-        cursor.execute(query, tuple(request.conversation_ids))
 
-        rows = cursor.fetchall()
-        conn.close()
+        rows = await run_db(
+            lambda conn: conn.execute(query, tuple(request.conversation_ids)).fetchall()
+        )
 
         if not rows:
             return "未找到指定 ID 的對話記錄。"
@@ -463,15 +1087,12 @@ async def extract_action_items(request: ConversationIdsRequest) -> str:
     """從指定的對話記錄中提取行動項目"""
     logger.info(f"調用工具: extract_action_items, 參數: {request.conversation_ids}")
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
         placeholders = ", ".join("?" * len(request.conversation_ids))
         query = f"SELECT role, content FROM conversations WHERE id IN ({placeholders}) ORDER BY timestamp ASC"
-        cursor.execute(query, tuple(request.conversation_ids))
 
-        rows = cursor.fetchall()
-        conn.close()
+        rows = await run_db(
+            lambda conn: conn.execute(query, tuple(request.conversation_ids)).fetchall()
+        )
 
         if not rows:
             return "未找到指定 ID 的對話記錄。"
@@ -495,4 +1116,3 @@ if __name__ == "__main__":
     init_database() # 確保在啟動時初始化資料庫
     logger.info("直接啟動 ContextRecord MCP Server (STDIO 模式)...")
     asyncio.run(mcp_app_instance.run()) # 使用 asyncio.run 包裹 mcp_app_instance.run()
- 
\ No newline at end of file
@@ -1,14 +1,21 @@
-from sqlalchemy import Column, Integer, String, DateTime, JSON
+from sqlalchemy import Column, Integer, String, DateTime, JSON, Index, event, inspect
 from datetime import datetime
 
 # 移除PostgreSQL專用類型，確保與SQLite兼容
 # from sqlalchemy.dialects.postgresql import ARRAY
 
 from src.database import Base
+from src.storage.cjk_index import posting_rows
 
 
 class Conversation(Base):
     __tablename__ = "conversations"
+    # 與 src.storage.migrations 建立的索引相同；SQLite 的 session_id 生成欄位
+    # 由遷移步驟加入
+    __table_args__ = (
+        Index("ix_conversations_timestamp_id", "timestamp", "id"),
+        Index("ix_conversations_role_timestamp", "role", "timestamp"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     timestamp = Column(DateTime, default=datetime.now)
@@ -19,3 +26,42 @@ class Conversation(Base):
     # 注意：若未來切換到PostgreSQL並需要向量搜尋功能，可以添加以下註釋代碼
     # from pgvector.sqlalchemy import Vector
     # embedding = Column(Vector(1536), nullable=True) # 向量維度可能根據使用的嵌入模型而不同
+
+
+class ConversationTerm(Base):
+    """中日韓文字 n-gram 倒排索引（結構與 src.storage.cjk_index 相同）"""
+
+    __tablename__ = "conversation_terms"
+    __table_args__ = {"sqlite_with_rowid": False}
+
+    term = Column(String, primary_key=True)
+    conversation_id = Column(Integer, primary_key=True, index=True)
+    positions = Column(String, nullable=False)
+
+
+@event.listens_for(Conversation, "after_insert")
+def index_conversation_terms(mapper, connection, target):
+    """在同一個交易中為新對話建立 n-gram 索引"""
+    rows = posting_rows([(target.id, target.content)])
+    if rows:
+        connection.execute(
+            ConversationTerm.__table__.insert(),
+            [
+                {
+                    "term": term,
+                    "conversation_id": conversation_id,
+                    "positions": positions,
+                }
+                for term, conversation_id, positions in rows
+            ],
+        )
+
+
+@event.listens_for(Conversation, "after_update")
+def reindex_conversation_terms(mapper, connection, target):
+    """內容被修改時以新內容重建該筆的 n-gram 索引"""
+    if not inspect(target).attrs.content.history.has_changes():
+        return
+    table = ConversationTerm.__table__
+    connection.execute(table.delete().where(table.c.conversation_id == target.id))
+    index_conversation_terms(mapper, connection, target)
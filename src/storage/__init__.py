@@ -0,0 +1,74 @@
+# SQLite 儲存層（供 MCP Server 使用）
+from src.storage.ann import (
+    DEFAULT_NPROBE,
+    DEFAULT_RERANK,
+    IVFPQIndex,
+    build_index,
+    default_index_path,
+)
+from src.storage.bulk import (
+    DEFAULT_CHUNK_SIZE,
+    bulk_insert,
+    chunk_errors,
+    id_ranges,
+    insert_chunk,
+    parse_ndjson,
+    validate_conversations,
+)
+from src.storage.cache import (
+    DEFAULT_CACHE_SIZE,
+    DataVersionWatcher,
+    QueryCache,
+    parse_cache_sizes,
+)
+from src.storage.cjk_index import (
+    index_conversations,
+    install_cjk_index,
+    rebuild_cjk_index,
+    search_cjk_index,
+)
+from src.storage.embeddings import (
+    DEFAULT_EMBEDDING_DIM,
+    EmbeddingStore,
+    default_store_path,
+    embed_texts,
+)
+from src.storage.executor import DatabaseExecutor
+from src.storage.fts import (
+    build_match_query,
+    build_search_sql,
+    contains_cjk,
+    fts_exists,
+    install_fts,
+    rebuild_fts,
+    search_params,
+)
+from src.storage.hybrid import (
+    RRF_K,
+    build_filter_sql,
+    filter_ids,
+    lexical_ranking,
+    reciprocal_rank_fusion,
+)
+from src.storage.migrations import current_version, migrate
+from src.storage.pagination import (
+    decode_cursor,
+    encode_cursor,
+    keyset_params,
+    page_ids_by_time,
+)
+from src.storage.pool import (
+    DEFAULT_PRAGMAS,
+    PoolTimeoutError,
+    SQLitePool,
+    pragmas_from_env,
+)
+from src.storage.snippets import (
+    DEFAULT_MAX_SNIPPETS,
+    DEFAULT_SNIPPET_CONTEXT,
+    HIGHLIGHT_END,
+    HIGHLIGHT_START,
+    build_snippets,
+    match_spans,
+)
+from src.storage.writer import GroupCommitWriter
@@ -0,0 +1,691 @@
+"""
+近似最近鄰（IVF-PQ）索引
+
+暴力搜尋的成本與對話數成正比。本模組以倒排檔（IVF）加乘積量化（PQ）建立
+近似索引：
+
+- 粗分群：以球面 k-means 將向量分成 nlist 群，每個向量歸入內積最大的中心。
+- 乘積量化：向量減去所屬中心後的殘差切成 m 段，每段以 256 個碼字的 k-means
+  編碼成 1 位元組，每個向量只佔 m 位元組。
+- 查詢：只探查內積最大的 nprobe 群；內積可拆成 q·中心 + Σ q_j·碼字，
+  每個查詢只需計算一次 (m, 256) 的查表，候選分數是查表後相加。最後取前
+  k × rerank 名，以向量儲存（src.storage.embeddings）中的原始向量重新計算
+  精確分數。
+
+索引存放在資料庫旁的目錄中：訓練結果與依群排列的 ids / codes 以 .npy 儲存，
+開啟時以記憶體映射載入，不會讀入整個檔案；之後新增的向量附加到 delta 檔案，
+累積到一定數量時與主索引合併（不需重新訓練）。向量分布改變很多時可重建：
+
+    python -m src.storage.ann data/conversations.db
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.storage.embeddings import (
+    DEFAULT_EMBEDDING_DIM,
+    EmbeddingStore,
+    default_store_path,
+)
+
+# 每段碼字數（以 uint8 儲存）
+PQ_CODEWORDS = 256
+
+# 預設參數：每次查詢探查的群數，以及精確重排的候選倍數
+DEFAULT_NPROBE = 16
+DEFAULT_RERANK = 16
+DEFAULT_PQ_M = 32
+
+# k-means 的迭代次數、粗分群每群的訓練樣本數與 PQ 碼字的訓練樣本數
+_KMEANS_ITERATIONS = 10
+_SAMPLES_PER_CENTROID = 32
+_PQ_TRAIN_ROWS = 65536
+_PQ_CHUNK_ROWS = 256
+_ASSIGN_CHUNK_ROWS = 16384
+
+# delta 超過 max(COMPACT_MIN_ROWS, 主索引筆數 × COMPACT_RATIO) 時與主索引合併
+COMPACT_MIN_ROWS = 50000
+COMPACT_RATIO = 0.1
+
+_META_FILE = "meta.json"
+_BASE_FILES = ("centroids", "codebooks", "offsets", "ids", "codes")
+_DELTA_FILES = {"ids": np.int64, "lists": np.int32, "codes": np.uint8}
+
+
+def default_index_path(database_path: str) -> str:
+    """與資料庫檔案放在同一個目錄的索引目錄路徑"""
+    return os.path.splitext(database_path)[0] + ".ann"
+
+
+def default_nlist(rows: int) -> int:
+    """依資料量決定群數（約 4√N，介於 16 與 65536 之間）"""
+    return int(min(65536, max(16, 4 * np.sqrt(max(rows, 1)))))
+
+
+def _assign(data: np.ndarray, centroids: np.ndarray, spherical: bool) -> np.ndarray:
+    """分段計算每列所屬的中心：spherical 時取內積最大者，否則取 L2 距離最小者"""
+    labels = np.empty(len(data), dtype=np.int32)
+    norms = None if spherical else (centroids * centroids).sum(axis=1)
+    for start in range(0, len(data), _ASSIGN_CHUNK_ROWS):
+        scores = data[start : start + _ASSIGN_CHUNK_ROWS] @ centroids.T
+        if spherical:
+            labels[start : start + len(scores)] = scores.argmax(axis=1)
+        else:
+            labels[start : start + len(scores)] = (norms - 2 * scores).argmin(axis=1)
+    return labels
+
+
+def kmeans(
+    data: np.ndarray,
+    k: int,
+    iterations: int = _KMEANS_ITERATIONS,
+    spherical: bool = False,
+    seed: int = 0,
+) -> np.ndarray:
+    """
+    Lloyd k-means，返回 (k, dim) 的中心
+
+    以 bincount 逐維累加取代 np.add.at；空的群保留原本的中心。spherical 時中心
+    正規化為單位向量（用於內積）。
+    """
+    rng = np.random.default_rng(seed)
+    data = np.asarray(data, dtype=np.float32)
+    k = min(k, len(data))
+    centroids = data[rng.choice(len(data), k, replace=False)].copy()
+    for _ in range(iterations):
+        labels = _assign(data, centroids, spherical)
+        counts = np.bincount(labels, minlength=k)
+        sums = np.stack(
+            [
+                np.bincount(labels, weights=data[:, d], minlength=k)
+                for d in range(data.shape[1])
+            ],
+            axis=1,
+        )
+        filled = counts > 0
+        centroids[filled] = (sums[filled] / counts[filled, None]).astype(np.float32)
+        if spherical:
+            norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+            np.divide(centroids, norms, out=centroids, where=norms > 0)
+    return centroids
+
+
+def pq_kmeans(
+    residuals: np.ndarray, m: int, iterations: int = _KMEANS_ITERATIONS, seed: int = 0
+) -> np.ndarray:
+    """
+    同時為 m 段訓練碼字，返回 (m, 256, dim / m)
+
+    各段的 k-means 互相獨立，分配時以批次矩陣乘法一起計算；樣本不足 256 筆時
+    其餘碼字為零向量。
+    """
+    n, dim = residuals.shape
+    dsub = dim // m
+    parts = residuals.reshape(n, m, dsub)
+    k = min(PQ_CODEWORDS, n)
+    rng = np.random.default_rng(seed)
+    codebooks = np.zeros((m, PQ_CODEWORDS, dsub), dtype=np.float32)
+    codebooks[:, :k] = parts[rng.choice(n, k, replace=False)].transpose(1, 0, 2)
+    for _ in range(iterations):
+        codes = _pq_assign(residuals, codebooks)
+        for j in range(m):
+            counts = np.bincount(codes[:, j], minlength=PQ_CODEWORDS)
+            filled = counts > 0
+            for d in range(dsub):
+                sums = np.bincount(
+                    codes[:, j], weights=parts[:, j, d], minlength=PQ_CODEWORDS
+                )
+                codebooks[j, filled, d] = sums[filled] / counts[filled]
+    return codebooks
+
+
+def _pq_assign(residuals: np.ndarray, codebooks: np.ndarray) -> np.ndarray:
+    """以批次矩陣乘法一次計算所有段最近的碼字，返回 (n, m) 的編碼"""
+    m, _, dsub = codebooks.shape
+    norms = (codebooks * codebooks).sum(axis=2)[:, None, :]
+    transposed = np.ascontiguousarray(codebooks.transpose(0, 2, 1))
+    codes = np.empty((len(residuals), m), dtype=np.uint8)
+    for start in range(0, len(residuals), _PQ_CHUNK_ROWS):
+        parts = (
+            residuals[start : start + _PQ_CHUNK_ROWS]
+            .reshape(-1, m, dsub)
+            .transpose(1, 0, 2)
+        )
+        # (m, n, 256)：每段各自的 ||c||² - 2 r·c；分段大小讓暫存矩陣留在快取中
+        distances = np.matmul(parts, transposed)
+        distances *= -2
+        distances += norms
+        codes[start : start + _PQ_CHUNK_ROWS] = distances.argmin(axis=2).T
+    return codes
+
+
+def pq_encode(
+    vectors: np.ndarray, centroids: np.ndarray, codebooks: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """返回向量所屬的群（內積最大的中心）與殘差的 PQ 編碼"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    lists = _assign(vectors, centroids, spherical=True)
+    return lists, _pq_assign(vectors - centroids[lists], codebooks)
+
+
+class IVFPQIndex:
+    """
+    持久化的 IVF-PQ 索引（可在多個執行緒中使用）
+
+    以向量儲存中的原始向量重排結果，並在主索引替換後由向量儲存補上之後新增的
+    向量，因此不會因重建或其他程序的重建而遺漏新對話。
+    """
+
+    def __init__(
+        self,
+        store: EmbeddingStore,
+        path: str,
+        nprobe: int = DEFAULT_NPROBE,
+        rerank: int = DEFAULT_RERANK,
+    ):
+        self.store = store
+        self.path = path
+        self.dim = store.dim
+        self.nprobe = max(1, nprobe)
+        self.rerank = max(1, rerank)
+        # 可重入：替換主索引、重新載入與補上新向量在同一個鎖內完成，期間的 add() 等待
+        self._lock = threading.RLock()
+        # 同一時間只有一個訓練或合併
+        self._build_lock = threading.Lock()
+        self._compactor: Optional[threading.Thread] = None
+
+        self.centroids: Optional[np.ndarray] = None
+        self.codebooks: Optional[np.ndarray] = None
+        self._offsets: Optional[np.ndarray] = None
+        self._ids: Optional[np.ndarray] = None
+        self._codes: Optional[np.ndarray] = None
+        self._meta_mtime: Optional[int] = None
+        self._base_max_id = 0
+        self._max_id = 0
+        # delta 以倍增容量的陣列保存，前 _delta_count 筆有效
+        self._delta: Dict[str, np.ndarray] = {}
+        self._delta_count = 0
+        self._delta_files: Dict[str, Any] = {}
+
+        # 統計資訊
+        self._added = 0
+        self._compactions = 0
+        self._reloads = 0
+        self._searches = 0
+        self._candidates = 0
+        self._search_time = 0.0
+        self._load()
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    @property
+    def building(self) -> bool:
+        return self._build_lock.locked()
+
+    @property
+    def nlist(self) -> int:
+        return 0 if self.centroids is None else len(self.centroids)
+
+    @property
+    def m(self) -> int:
+        return 0 if self.codebooks is None else len(self.codebooks)
+
+    def __len__(self) -> int:
+        return (0 if self._ids is None else len(self._ids)) + self._delta_count
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _load(self) -> None:
+        """
+        以記憶體映射載入主索引並讀入 delta，再補上向量儲存中之後新增的向量
+
+        尚未建立或維度不同時為未訓練狀態。載入與補上在同一個鎖內完成，期間的
+        add() 不會寫入即將被取代的 delta。
+        """
+        meta_path = self._file(_META_FILE)
+        if not os.path.exists(meta_path):
+            return
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("dim") != self.dim:
+            return
+        base = {
+            name: np.load(self._file(f"{name}.npy"), mmap_mode="r")
+            for name in _BASE_FILES
+        }
+
+        # delta 以附加方式寫入；中途中斷時以三個檔案中最短者為準
+        m = len(base["codebooks"])
+        delta = {}
+        for name, dtype in _DELTA_FILES.items():
+            file_path = self._file(f"delta_{name}.bin")
+            delta[name] = (
+                np.fromfile(file_path, dtype=dtype)
+                if os.path.exists(file_path)
+                else np.empty(0, dtype)
+            )
+        count = min(len(delta["ids"]), len(delta["lists"]), len(delta["codes"]) // m)
+
+        with self._lock:
+            self._close_delta_files()
+            self.centroids = np.asarray(base["centroids"])
+            self.codebooks = np.asarray(base["codebooks"])
+            self._offsets = np.asarray(base["offsets"])
+            self._ids, self._codes = base["ids"], base["codes"]
+            self._base_max_id = meta.get("max_id", 0)
+            self._meta_mtime = os.stat(meta_path).st_mtime_ns
+            self._delta = {
+                "ids": delta["ids"][:count].copy(),
+                "lists": delta["lists"][:count].copy(),
+                "codes": delta["codes"][: count * m].reshape(count, m).copy(),
+            }
+            self._delta_count = count
+            self._max_id = max(
+                self._base_max_id, int(self._delta["ids"].max()) if count else 0
+            )
+            if (
+                len(delta["ids"]) != count
+                or len(delta["lists"]) != count
+                or len(delta["codes"]) != count * m
+            ):
+                # 截掉中斷時寫了一半的記錄
+                for name, values in self._delta.items():
+                    values.tofile(self._file(f"delta_{name}.bin"))
+            self._catch_up()
+
+    @property
+    def covered_id(self) -> int:
+        """索引中（主索引或 delta）的最大對話 ID"""
+        return self._max_id
+
+    def _catch_up(self) -> None:
+        """
+        加入向量儲存中 ID 大於 covered_id 的向量
+
+        補到已寫入矩陣的最大 ID，而不是 last_id：sync() 在 on_embed 返回後才
+        更新 last_id，建立或合併期間送到舊 delta 的向量因此不會遺漏。
+        """
+        for ids, vectors in self.store.iter_vectors(
+            self.covered_id + 1, end_id=self.store.written_id
+        ):
+            self.add(ids, vectors, compact=False)
+
+    def refresh(self) -> bool:
+        """其他程序重建索引後重新載入，返回是否重新載入"""
+        try:
+            mtime = os.stat(self._file(_META_FILE)).st_mtime_ns
+        except FileNotFoundError:
+            return False
+        if mtime == self._meta_mtime:
+            return False
+        self._load()
+        self._reloads += 1
+        return True
+
+    def encode(self, vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """以目前的模型返回向量所屬的群與 PQ 編碼"""
+        return pq_encode(vectors, self.centroids, self.codebooks)
+
+    def train(
+        self, sample: np.ndarray, nlist: int, m: int = DEFAULT_PQ_M, seed: int = 0
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """以樣本訓練粗分群中心與 PQ 碼字，返回 (centroids, codebooks)，由 build() 套用"""
+        if self.dim % m:
+            raise ValueError(f"PQ 段數 m={m} 必須能整除向量維度 {self.dim}")
+        sample = np.asarray(sample, dtype=np.float32)
+        centroids = kmeans(sample, nlist, spherical=True, seed=seed)
+        rows = np.random.default_rng(seed).permutation(len(sample))[:_PQ_TRAIN_ROWS]
+        residuals = (
+            sample[rows] - centroids[_assign(sample[rows], centroids, spherical=True)]
+        )
+        return centroids, pq_kmeans(residuals, m, seed=seed + 1)
+
+    def build(
+        self,
+        centroids: np.ndarray,
+        codebooks: np.ndarray,
+        ids: np.ndarray,
+        lists: np.ndarray,
+        codes: np.ndarray,
+    ) -> None:
+        """
+        依群排序後寫入新的主索引並清空 delta
+
+        先寫到暫存目錄再替換，寫入期間進行中的搜尋仍使用舊的記憶體映射；替換後
+        在同一個鎖內重新載入，並由向量儲存補上建立期間新增的向量。
+        """
+        nlist = len(centroids)
+        order = np.argsort(lists, kind="stable")
+        offsets = np.zeros(nlist + 1, dtype=np.int64)
+        np.cumsum(np.bincount(lists, minlength=nlist), out=offsets[1:])
+        ids = np.asarray(ids, dtype=np.int64)
+
+        staging = self.path + ".tmp"
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        arrays = {
+            "centroids": centroids,
+            "codebooks": codebooks,
+            "offsets": offsets,
+            "ids": ids[order],
+            "codes": np.asarray(codes, dtype=np.uint8)[order],
+        }
+        for name, array in arrays.items():
+            np.save(os.path.join(staging, f"{name}.npy"), array)
+        meta = {
+            "dim": self.dim,
+            "nlist": nlist,
+            "m": len(codebooks),
+            "rows": len(ids),
+            "max_id": int(ids.max()) if len(ids) else 0,
+        }
+        with open(os.path.join(staging, _META_FILE), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+
+        with self._lock:
+            self._close_delta_files()
+            retired = self.path + ".old"
+            shutil.rmtree(retired, ignore_errors=True)
+            if os.path.exists(self.path):
+                os.rename(self.path, retired)
+            os.rename(staging, self.path)
+            shutil.rmtree(retired, ignore_errors=True)
+            self._load()
+
+    def add(
+        self, ids: Sequence[int], vectors: np.ndarray, compact: bool = True
+    ) -> None:
+        """
+        加入新的向量；尚未訓練時略過（由暴力搜尋涵蓋，訓練後再補上）
+
+        已在索引中的 ID（例如替換主索引後已由向量儲存補上）不會重複加入。delta
+        達到上限時在背景執行緒合併，不阻塞呼叫端（例如寫入器提交後的掛鉤）。
+        """
+        if not self.trained or not len(ids):
+            return
+        ids = np.asarray(ids, dtype=np.int64)
+        with self._lock:
+            keep = ids > self._max_id
+            if not keep.all():
+                ids, vectors = ids[keep], np.asarray(vectors)[keep]
+                if not len(ids):
+                    return
+            # 在鎖內編碼，避免以替換前的中心編碼後寫入新的 delta
+            lists, codes = self.encode(vectors)
+            values = {"ids": ids, "lists": lists, "codes": codes}
+            for name, array in values.items():
+                handle = self._delta_files.get(name)
+                if handle is None:
+                    handle = self._delta_files[name] = open(
+                        self._file(f"delta_{name}.bin"), "ab"
+                    )
+                handle.write(array.tobytes())
+                handle.flush()
+            count = self._delta_count + len(ids)
+            for name, array in values.items():
+                buffer = self._delta[name]
+                if len(buffer) < count:
+                    # 進行中的搜尋仍持有舊的陣列，其有效範圍不受影響
+                    grown = np.empty(
+                        (max(count, 2 * len(buffer)),) + array.shape[1:],
+                        dtype=array.dtype,
+                    )
+                    grown[: self._delta_count] = buffer[: self._delta_count]
+                    buffer = self._delta[name] = grown
+                buffer[self._delta_count : count] = array
+            self._delta_count = count
+            self._max_id = max(self._max_id, int(ids.max()))
+            self._added += len(ids)
+            base_rows = 0 if self._ids is None else len(self._ids)
+            full = count > max(COMPACT_MIN_ROWS, base_rows * COMPACT_RATIO)
+            if compact and full and not self.building and not self.compacting:
+                self._compactor = threading.Thread(target=self.compact, daemon=True)
+                self._compactor.start()
+
+    @property
+    def compacting(self) -> bool:
+        """背景合併是否進行中"""
+        return self._compactor is not None and self._compactor.is_alive()
+
+    def compact(self) -> bool:
+        """將 delta 併入主索引（沿用目前的中心與碼字），已有其他建立進行中時略過"""
+        if not self._build_lock.acquire(blocking=False):
+            return False
+        try:
+            with self._lock:
+                centroids, codebooks, offsets = (
+                    self.centroids,
+                    self.codebooks,
+                    self._offsets,
+                )
+                base_ids, base_codes = self._ids, self._codes
+                count = self._delta_count
+                delta = {
+                    name: values[:count].copy() for name, values in self._delta.items()
+                }
+            if not count:
+                return False
+            base_lists = np.repeat(
+                np.arange(len(centroids), dtype=np.int32), np.diff(offsets)
+            )
+            self.build(
+                centroids,
+                codebooks,
+                np.concatenate([np.asarray(base_ids), delta["ids"]]),
+                np.concatenate([base_lists, delta["lists"]]),
+                np.concatenate([np.asarray(base_codes), delta["codes"]]),
+            )
+            self._compactions += 1
+            return True
+        finally:
+            self._build_lock.release()
+
+    def candidates(
+        self, query: np.ndarray, count: int, nprobe: Optional[int] = None
+    ) -> np.ndarray:
+        """以 PQ 近似分數返回單一查詢的前 count 個候選 ID"""
+        with self._lock:
+            centroids, codebooks, offsets = (
+                self.centroids,
+                self.codebooks,
+                self._offsets,
+            )
+            base_ids, base_codes = self._ids, self._codes
+            delta, delta_count = self._delta, self._delta_count
+
+        nprobe = min(nprobe or self.nprobe, len(centroids))
+        coarse = centroids @ query
+        probes = (
+            np.argpartition(-coarse, nprobe - 1)[:nprobe]
+            if nprobe < len(coarse)
+            else np.arange(len(coarse))
+        )
+
+        m, dsub = codebooks.shape[0], codebooks.shape[2]
+        # table[j, c] = q_j · codebooks[j, c]；與群無關，每個查詢只算一次
+        table = np.einsum("jcd,jd->jc", codebooks, query.reshape(m, dsub))
+        columns = np.arange(m)
+
+        id_parts: List[np.ndarray] = []
+        score_parts: List[np.ndarray] = []
+        for probe in probes:
+            start, end = offsets[probe], offsets[probe + 1]
+            if start == end:
+                continue
+            codes = np.asarray(base_codes[start:end])
+            id_parts.append(np.asarray(base_ids[start:end]))
+            score_parts.append(coarse[probe] + table[columns, codes].sum(axis=1))
+        if delta_count:
+            lists = delta["lists"][:delta_count]
+            selected = np.flatnonzero(np.isin(lists, probes))
+            if len(selected):
+                id_parts.append(delta["ids"][selected])
+                score_parts.append(
+                    coarse[lists[selected]]
+                    + table[columns, delta["codes"][selected]].sum(axis=1)
+                )
+        if not id_parts:
+            return np.empty(0, dtype=np.int64)
+
+        ids = np.concatenate(id_parts)
+        scores = np.concatenate(score_parts)
+        self._candidates += len(ids)
+        if len(ids) > count:
+            ids = ids[np.argpartition(-scores, count - 1)[:count]]
+        return ids
+
+    def search(
+        self,
+        queries: np.ndarray,
+        k: int = 10,
+        min_score: float = 0.0,
+        nprobe: Optional[int] = None,
+        rerank: Optional[int] = None,
+    ) -> List[List[Tuple[int, float]]]:
+        """
+        近似搜尋後以原始向量重新計算精確分數，結果格式與 EmbeddingStore.search 相同
+
+        nprobe 越大召回率越高、延遲越長；rerank 為重排的候選倍數。
+        """
+        started = time.perf_counter()
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        results: List[List[Tuple[int, float]]] = []
+        for query in queries:
+            ids = np.unique(self.candidates(query, k * (rerank or self.rerank), nprobe))
+            scores = self.store.vectors(ids) @ query
+            order = np.argsort(-scores, kind="stable")[:k]
+            results.append(
+                [
+                    (int(ids[i]), float(scores[i]))
+                    for i in order
+                    if scores[i] > min_score
+                ]
+            )
+        self._searches += len(queries)
+        self._search_time += time.perf_counter() - started
+        return results
+
+    def _close_delta_files(self) -> None:
+        for handle in self._delta_files.values():
+            handle.close()
+        self._delta_files = {}
+
+    def close(self) -> None:
+        compactor = self._compactor
+        if compactor is not None:
+            compactor.join()
+        with self._lock:
+            self._close_delta_files()
+
+    def stats(self) -> Dict[str, Any]:
+        """返回索引的統計資訊"""
+        return {
+            "path": self.path,
+            "trained": self.trained,
+            "nlist": self.nlist,
+            "m": self.m,
+            "nprobe": self.nprobe,
+            "rerank": self.rerank,
+            "base_rows": 0 if self._ids is None else len(self._ids),
+            "delta_rows": self._delta_count,
+            "added": self._added,
+            "compacting": self.compacting,
+            "compactions": self._compactions,
+            "reloads": self._reloads,
+            "searches": self._searches,
+            "avg_candidates": (
+                self._candidates / self._searches if self._searches else 0.0
+            ),
+            "avg_search_ms": (
+                (self._search_time / self._searches * 1000) if self._searches else 0.0
+            ),
+        }
+
+
+def build_index(
+    index: IVFPQIndex,
+    nlist: Optional[int] = None,
+    m: int = DEFAULT_PQ_M,
+    seed: int = 0,
+) -> int:
+    """
+    以向量儲存中的所有向量訓練並建立索引，返回建立時的向量數
+
+    訓練只使用約 max(nlist, 256) × 32 筆樣本；編碼則分段讀取全部向量。
+    """
+    with index._build_lock:
+        store = index.store
+        present = [ids for ids, _ in store.iter_vectors()]
+        ids = np.concatenate(present) if present else np.empty(0, dtype=np.int64)
+        if len(ids) == 0:
+            return 0
+        nlist = nlist or default_nlist(len(ids))
+        rng = np.random.default_rng(seed)
+        sample_size = min(len(ids), max(nlist, PQ_CODEWORDS) * _SAMPLES_PER_CENTROID)
+        sample = store.vectors(np.sort(rng.choice(ids, sample_size, replace=False)))
+        centroids, codebooks = index.train(sample, nlist, m, seed)
+
+        # 以新的模型編碼；替換前索引仍以舊的模型服務查詢，只編碼到取樣時的最大 ID
+        id_parts, list_parts, code_parts = [], [], []
+        last = int(ids[-1])
+        for chunk_ids, vectors in store.iter_vectors():
+            keep = chunk_ids <= last
+            lists, codes = pq_encode(vectors[keep], centroids, codebooks)
+            id_parts.append(chunk_ids[keep])
+            list_parts.append(lists)
+            code_parts.append(codes)
+        index.build(
+            centroids,
+            codebooks,
+            np.concatenate(id_parts),
+            np.concatenate(list_parts),
+            np.concatenate(code_parts),
+        )
+        return len(ids)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    """命令列入口：補齊向量後重新訓練並建立近似索引"""
+    parser = argparse.ArgumentParser(description="建立或重建對話向量的近似最近鄰索引")
+    parser.add_argument("database", help="SQLite 資料庫檔案路徑")
+    parser.add_argument("--store", help="向量檔案路徑，預設為資料庫檔名改為 .vectors")
+    parser.add_argument("--index", help="索引目錄路徑，預設為資料庫檔名改為 .ann")
+    parser.add_argument(
+        "--dim", type=int, default=DEFAULT_EMBEDDING_DIM, help="向量維度"
+    )
+    parser.add_argument("--nlist", type=int, help="粗分群的群數，預設約為 4√N")
+    parser.add_argument(
+        "--m", type=int, default=DEFAULT_PQ_M, help="PQ 段數，須能整除向量維度"
+    )
+    args = parser.parse_args(argv)
+
+    conn = sqlite3.connect(args.database)
+    store = EmbeddingStore(args.store or default_store_path(args.database), args.dim)
+    try:
+        started = time.perf_counter()
+        store.sync(conn)
+        index = IVFPQIndex(store, args.index or default_index_path(args.database))
+        count = build_index(index, args.nlist, args.m)
+        print(
+            f"已為 {count} 個向量建立索引（nlist={index.nlist}, m={index.m}），"
+            f"耗時 {time.perf_counter() - started:.2f} 秒"
+        )
+        index.close()
+    finally:
+        store.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
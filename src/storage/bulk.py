@@ -0,0 +1,180 @@
+"""
+批次寫入對話記錄
+
+用於匯入大量歷史對話：先一次驗證所有記錄並收集每筆的錯誤，再分段寫入，
+每段以單一語句寫入並作為一個交易提交，返回分配到的 ID 區間。
+"""
+
+import json
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from src.storage.pagination import normalize_timestamp
+
+# 每個交易寫入的記錄數
+DEFAULT_CHUNK_SIZE = 5000
+
+# 驗證後的記錄：(原始位置, role, content, metadata, timestamp)
+ValidRow = Tuple[int, str, str, Any, Optional[str]]
+RowError = Dict[str, Any]
+
+
+def parse_ndjson(body: str) -> Tuple[List[Any], List[RowError]]:
+    """
+    解析 NDJSON（每行一個 JSON 物件），略過空行
+
+    返回 (記錄列表, 錯誤列表)；無法解析的行以 None 佔位，index 與行號對應
+    （從 0 起算，不含空行）。
+    """
+    items: List[Any] = []
+    errors: List[RowError] = []
+    for line in body.splitlines():
+        if not line.strip():
+            continue
+        try:
+            items.append(json.loads(line))
+        except ValueError as e:
+            errors.append({"index": len(items), "error": f"JSON 格式錯誤: {e}"})
+            items.append(None)
+    return items, errors
+
+
+def validate_conversations(
+    items: Sequence[Any], skip: Iterable[int] = ()
+) -> Tuple[List[ValidRow], List[RowError]]:
+    """
+    驗證對話記錄，返回 (合法記錄, 錯誤列表)
+
+    每筆記錄需包含非空字串 role 與字串 content；metadata（或 extra_metadata）
+    可為物件、JSON 字串或 null，與 create_conversation 相同，無法解析的字串
+    以 {"raw": ...} 保存。timestamp 可省略，或為 ISO 8601 字串／epoch 秒數，
+    用於保留匯入記錄原本的時間。skip 中的位置視為已有錯誤，不再檢查。
+    """
+    skipped = set(skip)
+    rows: List[ValidRow] = []
+    errors: List[RowError] = []
+    for index, item in enumerate(items):
+        if index in skipped:
+            continue
+        if not isinstance(item, dict):
+            errors.append({"index": index, "error": "記錄必須是物件"})
+            continue
+        role = item.get("role")
+        content = item.get("content")
+        metadata = item.get("metadata", item.get("extra_metadata"))
+        timestamp = item.get("timestamp")
+        if not isinstance(role, str) or not role:
+            errors.append({"index": index, "error": "role 必須是非空字串"})
+        elif not isinstance(content, str):
+            errors.append({"index": index, "error": "content 必須是字串"})
+        elif metadata is not None and not isinstance(metadata, (dict, str)):
+            errors.append({"index": index, "error": "metadata 必須是物件或字串"})
+        else:
+            if timestamp is not None:
+                try:
+                    timestamp = normalize_timestamp(timestamp)
+                except ValueError as e:
+                    errors.append({"index": index, "error": f"timestamp 格式錯誤: {e}"})
+                    continue
+            if isinstance(metadata, str):
+                try:
+                    metadata = json.loads(metadata)
+                except ValueError:
+                    metadata = {"raw": metadata}
+            rows.append((index, role, content, metadata, timestamp))
+    return rows, errors
+
+
+def id_ranges(ids: Iterable[int]) -> List[List[int]]:
+    """將遞增的 ID 壓縮為 [起始, 結束] 區間列表"""
+    ranges: List[List[int]] = []
+    for conversation_id in ids:
+        if ranges and conversation_id == ranges[-1][1] + 1:
+            ranges[-1][1] = conversation_id
+        else:
+            ranges.append([conversation_id, conversation_id])
+    return ranges
+
+
+def _metadata_text(metadata: Any) -> Optional[str]:
+    return json.dumps(metadata) if metadata else None
+
+
+def insert_chunk(
+    conn,
+    rows: Sequence[ValidRow],
+    after_insert: Optional[Callable[[Any, List[Tuple[int, str]]], None]] = None,
+    metadata_column: str = "metadata",
+    timestamp: Optional[str] = None,
+) -> List[int]:
+    """
+    以單一 INSERT ... SELECT 寫入一段記錄，返回依序分配的 ID（不會自動提交）
+
+    整段記錄以 JSON 陣列作為一個參數，由 json_each 展開。與 executemany 逐筆
+    執行相比，全文索引觸發器只在同一個語句內執行，FTS5 不會每筆都寫出暫存的
+    索引資料。寫入期間持有寫入鎖，同一段的 ID 是連續的，由 last_insert_rowid()
+    推算。SQLAlchemy 模型的欄位為 extra_metadata 且時間由應用程式產生，可透過
+    metadata_column 與 timestamp 指定；記錄自帶的時間優先於 timestamp。
+    """
+    columns = ["role", "content", metadata_column, "timestamp"]
+    values = [
+        "json_extract(value, '$[0]')",
+        "json_extract(value, '$[1]')",
+        "json_extract(value, '$[2]')",
+        (
+            "COALESCE(json_extract(value, '$[3]'), ?)"
+            if timestamp is not None
+            else "COALESCE(json_extract(value, '$[3]'), CURRENT_TIMESTAMP)"
+        ),
+    ]
+    params: List[Any] = [] if timestamp is None else [timestamp]
+    params.append(
+        json.dumps([[row[1], row[2], _metadata_text(row[3]), row[4]] for row in rows])
+    )
+
+    cursor = conn.cursor()
+    cursor.execute(
+        f"INSERT INTO conversations ({', '.join(columns)}) "
+        f"SELECT {', '.join(values)} FROM json_each(?) ORDER BY key",
+        params,
+    )
+    cursor.execute("SELECT last_insert_rowid()")
+    last_id = cursor.fetchone()[0]
+    ids = list(range(last_id - len(rows) + 1, last_id + 1))
+    if after_insert is not None:
+        after_insert(
+            conn, [(conversation_id, row[2]) for conversation_id, row in zip(ids, rows)]
+        )
+    return ids
+
+
+def bulk_insert(
+    conn,
+    rows: Sequence[ValidRow],
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    after_insert: Optional[Callable[[Any, List[Tuple[int, str]]], None]] = None,
+) -> Tuple[List[int], List[RowError]]:
+    """
+    分段寫入 conversations（MCP Server 的資料表結構），每段一個交易
+
+    某段寫入失敗時整段回滾，該段每筆記錄都會列入錯誤。
+    返回 (依序分配的 ID, 錯誤列表)。
+    """
+    chunk_size = max(1, chunk_size)
+    ids: List[int] = []
+    errors: List[RowError] = []
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start : start + chunk_size]
+        try:
+            chunk_ids = insert_chunk(conn, chunk, after_insert)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            errors.extend(chunk_errors(chunk, e))
+            continue
+        ids.extend(chunk_ids)
+    return ids, errors
+
+
+def chunk_errors(chunk: Sequence[ValidRow], error: Exception) -> List[RowError]:
+    """將整段寫入失敗轉為該段每筆記錄的錯誤"""
+    return [{"index": row[0], "error": f"寫入失敗: {error}"} for row in chunk]
@@ -0,0 +1,202 @@
+"""
+查詢結果快取
+
+代理程式在同一個會話中常以相同參數重複呼叫搜尋與讀取工具。本模組以工具
+名稱分開的 LRU 快取保存組好的結果，命中時完全不存取資料庫。
+
+失效以寫入世代計數器判斷：每次寫入或刪除提交後呼叫 invalidate() 將世代加一
+並清空快取。查詢前先記下世代，查詢完成後以 put(..., generation) 存入；期間
+若有寫入提交，世代已改變，結果不會被存入，因此不會快取到寫入前的舊資料。
+
+其他工作程序、匯入工具或批次命令列的寫入不會經過本程序的 invalidate()。
+給定 version（例如 DataVersionWatcher）時，每次讀取或存入前比對資料庫的
+PRAGMA data_version，數值改變即視同一次寫入，使快取失效。
+"""
+
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional
+
+# 每個工具預設最多保存的結果數
+DEFAULT_CACHE_SIZE = 256
+
+
+def parse_cache_sizes(
+    tools: Iterable[str],
+    spec: Optional[str] = None,
+    default_size: int = DEFAULT_CACHE_SIZE,
+) -> Dict[str, int]:
+    """
+    解析各工具的快取大小設定
+
+    spec 格式為 "工具=大小,工具=大小"，未列出的工具使用 default_size，
+    大小為 0 時停用該工具的快取。格式錯誤時拋出 ValueError。
+    """
+    sizes = {tool: default_size for tool in tools}
+    for item in (spec or "").split(","):
+        if not item.strip():
+            continue
+        tool, separator, size = item.partition("=")
+        tool = tool.strip()
+        if not separator or tool not in sizes:
+            raise ValueError(f"無效的快取設定: {item.strip()}")
+        try:
+            sizes[tool] = int(size)
+        except ValueError:
+            raise ValueError(f"無效的快取大小: {item.strip()}") from None
+    return sizes
+
+
+class DataVersionWatcher:
+    """
+    以獨立的連接讀取 SQLite 的 PRAGMA data_version（可在多個執行緒中使用）
+
+    此連接從不寫入，因此任何其他連接（包含其他程序）提交後數值都會改變。
+    讀取只檢查 WAL 索引或檔案變更計數，不讀取資料頁。資料庫尚無法開啟時
+    返回 None，不比對。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def __call__(self) -> Optional[int]:
+        with self._lock:
+            try:
+                if self._conn is None:
+                    self._conn = sqlite3.connect(self.path, check_same_thread=False)
+                return self._conn.execute("PRAGMA data_version").fetchone()[0]
+            except sqlite3.Error:
+                return None
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class QueryCache:
+    """以寫入世代失效、各工具大小獨立的 LRU 結果快取（可在多個執行緒中使用）"""
+
+    def __init__(
+        self,
+        sizes: Dict[str, int],
+        version: Optional[Callable[[], Optional[int]]] = None,
+    ):
+        """
+        參數:
+        - sizes: 各工具最多保存的結果數，0 表示停用
+        - version: 返回資料庫版本的函數（例如 DataVersionWatcher），數值改變時
+          視同其他程序有寫入；None 時只依本程序的 invalidate() 失效
+        """
+        self.sizes = {tool: size for tool, size in sizes.items() if size > 0}
+        self._lock = threading.Lock()
+        self._entries: Dict[str, "OrderedDict[Hashable, Any]"] = {
+            tool: OrderedDict() for tool in self.sizes
+        }
+        self._generation = 0
+        self._version = version
+        self._data_version: Optional[int] = None
+
+        # 統計資訊
+        self._hits = dict.fromkeys(self.sizes, 0)
+        self._misses = dict.fromkeys(self.sizes, 0)
+        self._evictions = dict.fromkeys(self.sizes, 0)
+        self._stale_puts = 0
+        self._invalidations = 0
+        self._external_invalidations = 0
+
+    def _check_version(self) -> None:
+        """資料庫版本改變（其他連接或程序提交了寫入）時使快取失效"""
+        if self._version is None or not self.sizes:
+            return
+        version = self._version()
+        if version is None or version == self._data_version:
+            return
+        with self._lock:
+            if self._data_version is not None and version != self._data_version:
+                self._clear()
+                self._external_invalidations += 1
+            self._data_version = version
+
+    @property
+    def generation(self) -> int:
+        """目前的寫入世代，查詢前讀取並傳給 put()"""
+        self._check_version()
+        return self._generation
+
+    def enabled(self, tool: str) -> bool:
+        return tool in self.sizes
+
+    def get(self, tool: str, key: Hashable) -> Optional[Any]:
+        """返回快取的結果並標記為最近使用；未命中或未啟用時返回 None"""
+        entries = self._entries.get(tool)
+        if entries is None:
+            return None
+        self._check_version()
+        with self._lock:
+            value = entries.get(key)
+            if value is None:
+                self._misses[tool] += 1
+                return None
+            entries.move_to_end(key)
+            self._hits[tool] += 1
+            return value
+
+    def put(self, tool: str, key: Hashable, value: Any, generation: int) -> bool:
+        """
+        存入結果，返回是否存入
+
+        generation 為查詢前讀取的世代；查詢期間有寫入提交時不存入。
+        """
+        entries = self._entries.get(tool)
+        if entries is None or value is None:
+            return False
+        self._check_version()
+        with self._lock:
+            if generation != self._generation:
+                self._stale_puts += 1
+                return False
+            entries[key] = value
+            entries.move_to_end(key)
+            while len(entries) > self.sizes[tool]:
+                entries.popitem(last=False)
+                self._evictions[tool] += 1
+            return True
+
+    def invalidate(self) -> None:
+        """寫入提交後呼叫：世代加一並清空所有快取"""
+        with self._lock:
+            self._clear()
+            self._invalidations += 1
+
+    def _clear(self) -> None:
+        """世代加一並清空所有快取（呼叫端持有鎖）"""
+        self._generation += 1
+        for entries in self._entries.values():
+            entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """返回各工具的命中率與整體統計"""
+        with self._lock:
+            tools = {}
+            for tool, size in self.sizes.items():
+                lookups = self._hits[tool] + self._misses[tool]
+                tools[tool] = {
+                    "size": len(self._entries[tool]),
+                    "max_size": size,
+                    "hits": self._hits[tool],
+                    "misses": self._misses[tool],
+                    "hit_ratio": self._hits[tool] / lookups if lookups else 0.0,
+                    "evictions": self._evictions[tool],
+                }
+            return {
+                "generation": self._generation,
+                "invalidations": self._invalidations,
+                "external_invalidations": self._external_invalidations,
+                "stale_puts": self._stale_puts,
+                "tools": tools,
+            }
@@ -0,0 +1,382 @@
+"""
+中日韓文字 n-gram 倒排索引
+
+unicode61 斷詞器會把一整段沒有空白的中文視為單一詞彙，無法支援子字串搜尋。
+本模組將中日韓文字切成字元 bigram，英文與程式識別字則以單字（並拆分
+snake_case / camelCase）為詞，記錄每個詞在內容中的字元位置。
+
+查詢時先取出最稀有詞的 posting list，再逐一與其他詞求交集並以位置篩選，
+因此 `自動記錄` 這類子字串查詢只需查索引，不必掃描整個資料表。各詞的稀有
+程度以最多讀取 FREQUENCY_PROBE_LIMIT 筆的計數估計，不必完整掃描常見詞的
+posting list，寫入時也不需要另外維護統計。
+
+索引只用來縮小候選範圍：查詢中的空白與標點不在索引中，查詢頭尾的英文單字
+也可能只是內容中較長單字的一部分（結尾的單字以前綴比對，開頭的單字不查
+索引）。候選記錄最後在內容中比對整個查詢字串，結果與 `LIKE '%查詢%'` 相同
+（僅 ASCII 字母不分大小寫），並得到實際的命中位置。
+
+對話內容視為寫入後不再修改：以 UPDATE 修改 content 時觸發器會移除該筆的
+舊索引，避免以舊內容命中；修改後需以 index_conversations() 重新建立索引
+（ORM 的修改會自動重建），或執行下方的重建命令。
+
+可對既有資料庫執行回填：
+
+    python -m src.storage.cjk_index data/conversations.db
+"""
+
+import argparse
+import re
+import sqlite3
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from src.storage.fts import CJK_RANGES
+
+TERMS_TABLE = "conversation_terms"
+
+# 中日韓文字切詞的 n-gram 長度
+NGRAM_SIZE = 2
+
+# 估計文件頻率時每個詞最多計數的筆數；超過的詞都視為常見詞
+FREQUENCY_PROBE_LIMIT = 1000
+
+# SQLite 單一語句的參數數量上限較保守的取值
+_MAX_PARAMS = 500
+
+CJK_INDEX_SCHEMA = [
+    f"""
+    CREATE TABLE IF NOT EXISTS {TERMS_TABLE} (
+        term TEXT NOT NULL,
+        conversation_id INTEGER NOT NULL,
+        positions TEXT NOT NULL,
+        PRIMARY KEY (term, conversation_id)
+    ) WITHOUT ROWID
+    """,
+    f"""
+    CREATE INDEX IF NOT EXISTS ix_{TERMS_TABLE}_conversation_id
+    ON {TERMS_TABLE} (conversation_id)
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {TERMS_TABLE}_ad AFTER DELETE ON conversations BEGIN
+        DELETE FROM {TERMS_TABLE} WHERE conversation_id = old.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {TERMS_TABLE}_au AFTER UPDATE OF content ON conversations BEGIN
+        DELETE FROM {TERMS_TABLE} WHERE conversation_id = old.id;
+    END
+    """,
+]
+
+_SEGMENT_PATTERN = re.compile(rf"(?P<cjk>[{CJK_RANGES}]+)|(?P<word>[^\W{CJK_RANGES}]+)")
+_IDENTIFIER_PART_PATTERN = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+|[^\W_]+")
+
+Term = Tuple[str, int]
+# 查詢詞：(詞, 相對位置, 是否以前綴比對)
+QueryTerm = Tuple[str, int, bool]
+
+# 與 SQLite LIKE 相同，只有 ASCII 字母不分大小寫；轉換後長度不變，位置可直接對應
+_ASCII_LOWER = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz")
+
+
+def _word_parts(word: str) -> List[Term]:
+    """將 snake_case / camelCase 識別字拆成小寫的子詞與相對位置"""
+    # 常見的全小寫、全大寫或純數字單字無法再拆分，略過正規表示式
+    if word.isascii() and (
+        word.isdigit() or (word.isalpha() and (word.islower() or word.isupper()))
+    ):
+        return [(word.lower(), 0)]
+    return [
+        (match.group().lower(), match.start())
+        for match in _IDENTIFIER_PART_PATTERN.finditer(word)
+    ]
+
+
+def tokenize(text: str) -> List[Term]:
+    """
+    將內容切成索引詞與其字元位置
+
+    - 中日韓文字：連續字元的 bigram（單一字元時為 unigram）
+    - 其他文字：小寫的完整單字；可拆分的識別字另外加入各個子詞
+    """
+    terms: List[Term] = []
+    for match in _SEGMENT_PATTERN.finditer(text):
+        start = match.start()
+        segment = match.group()
+        if match.lastgroup == "cjk":
+            if len(segment) < NGRAM_SIZE:
+                terms.append((segment, start))
+                continue
+            for i in range(len(segment) - NGRAM_SIZE + 1):
+                terms.append((segment[i : i + NGRAM_SIZE], start + i))
+        else:
+            terms.append((segment.lower(), start))
+            parts = _word_parts(segment)
+            if len(parts) > 1:
+                terms.extend((part, start + offset) for part, offset in parts)
+    return terms
+
+
+def query_terms(query: str) -> Optional[List[QueryTerm]]:
+    """
+    將查詢字串切成索引詞與相對位置
+
+    中日韓字串以 bigram 表示；英文等單字使用小寫的完整單字。查詢開頭的單字
+    可能只是內容中單字的後半段，不查索引；結尾的單字可能是前半段，以前綴
+    比對。若查詢包含無法由索引回答的片段（例如單一中文字），或沒有可查索引
+    的詞，返回 None。
+    """
+    terms: List[QueryTerm] = []
+    for match in _SEGMENT_PATTERN.finditer(query):
+        start = match.start()
+        segment = match.group()
+        if match.lastgroup == "cjk":
+            if len(segment) < NGRAM_SIZE:
+                return None
+            for i in range(len(segment) - NGRAM_SIZE + 1):
+                terms.append((segment[i : i + NGRAM_SIZE], start + i, False))
+        elif start > 0:
+            # 前面有其他字元時，內容中的單字從同一位置開始
+            terms.append((segment.lower(), start, match.end() == len(query)))
+
+    if not terms:
+        return None
+    base = terms[0][1]
+    return [(term, offset - base, prefix) for term, offset, prefix in terms]
+
+
+def build_postings(content: str) -> Dict[str, List[int]]:
+    """返回內容中每個詞出現的位置列表"""
+    postings: Dict[str, List[int]] = defaultdict(list)
+    for term, offset in tokenize(content):
+        postings[term].append(offset)
+    return postings
+
+
+def encode_positions(positions: Sequence[int]) -> str:
+    return ",".join(str(position) for position in positions)
+
+
+def decode_positions(encoded: str) -> List[int]:
+    return [int(position) for position in encoded.split(",")]
+
+
+def posting_rows(
+    conversations: Iterable[Tuple[int, str]],
+) -> List[Tuple[str, int, str]]:
+    """將 (conversation_id, content) 轉為索引資料表的列"""
+    rows = []
+    for conversation_id, content in conversations:
+        for term, positions in build_postings(content or "").items():
+            encoded = (
+                str(positions[0])
+                if len(positions) == 1
+                else encode_positions(positions)
+            )
+            rows.append((term, conversation_id, encoded))
+    return rows
+
+
+def match_offsets(
+    terms: List[QueryTerm], postings: Dict[Tuple[str, bool], Dict[int, List[int]]]
+) -> Dict[int, List[int]]:
+    """
+    以位置篩選候選記錄，返回每筆記錄中各詞相對位置都吻合的起始位置
+
+    postings 為 {(詞, 是否前綴): {conversation_id: [位置...]}}，需包含 terms
+    中所有詞在候選記錄上的位置。返回的是第一個查詢詞的位置，尚未與內容比對。
+    """
+    keys = {(term, prefix) for term, _, prefix in terms}
+    candidates = None
+    for key in keys:
+        ids = set(postings.get(key, {}))
+        candidates = ids if candidates is None else candidates & ids
+        if not candidates:
+            return {}
+
+    matches: Dict[int, List[int]] = {}
+    for conversation_id in candidates:
+        anchors = None
+        for term, relative, prefix in terms:
+            starts = {
+                position - relative
+                for position in postings[(term, prefix)][conversation_id]
+            }
+            anchors = starts if anchors is None else anchors & starts
+            if not anchors:
+                break
+        if anchors:
+            matches[conversation_id] = sorted(anchors)
+    return matches
+
+
+def find_offsets(content: str, query: str) -> List[int]:
+    """返回查詢字串在內容中（可重疊）的所有起始位置，僅 ASCII 字母不分大小寫"""
+    haystack = content.translate(_ASCII_LOWER)
+    needle = query.translate(_ASCII_LOWER)
+    offsets = []
+    start = haystack.find(needle)
+    while start != -1:
+        offsets.append(start)
+        start = haystack.find(needle, start + 1)
+    return offsets
+
+
+def install_cjk_index(conn) -> bool:
+    """
+    建立索引資料表與刪除、修改同步觸發器
+
+    索引是空的而已有對話時（首次建立，或資料表先由 ORM 的 create_all 建立），
+    會立即為既有資料建立索引。不會自動提交。返回是否回填了既有資料。
+    """
+    cursor = conn.cursor()
+    for statement in CJK_INDEX_SCHEMA:
+        cursor.execute(statement)
+    cursor.execute(
+        f"SELECT NOT EXISTS (SELECT 1 FROM {TERMS_TABLE}) AND EXISTS (SELECT 1 FROM conversations)"
+    )
+    if not cursor.fetchone()[0]:
+        return False
+    rebuild_cjk_index(conn)
+    return True
+
+
+def index_conversations(conn, conversations: Iterable[Tuple[int, str]]) -> None:
+    """為新寫入的記錄建立索引（需與寫入在同一個交易中呼叫）"""
+    rows = posting_rows(conversations)
+    if rows:
+        # 依主鍵順序寫入，批次較大時 B-tree 的頁面存取較集中
+        rows.sort()
+        conn.cursor().executemany(
+            f"INSERT OR REPLACE INTO {TERMS_TABLE} (term, conversation_id, positions) VALUES (?, ?, ?)",
+            rows,
+        )
+
+
+def rebuild_cjk_index(conn, batch_size: int = 1000) -> int:
+    """依 conversations 的目前內容重建索引，返回處理的記錄數"""
+    cursor = conn.cursor()
+    cursor.execute(f"DELETE FROM {TERMS_TABLE}")
+
+    read_cursor = conn.cursor()
+    read_cursor.execute("SELECT id, content FROM conversations ORDER BY id")
+    total = 0
+    while True:
+        batch = read_cursor.fetchmany(batch_size)
+        if not batch:
+            break
+        index_conversations(conn, batch)
+        total += len(batch)
+    return total
+
+
+def _term_condition(term: str, prefix: bool) -> Tuple[str, Tuple[str, ...]]:
+    """返回比對一個查詢詞的 WHERE 條件與參數；前綴比對使用主鍵範圍"""
+    if prefix:
+        return "term >= ? AND term < ?", (term, term + "\U0010ffff")
+    return "term = ?", (term,)
+
+
+def _fetch_postings(
+    cursor, term: str, prefix: bool, ids: Optional[List[int]]
+) -> Dict[int, List[int]]:
+    """讀取一個詞的 posting list；給定 ids 時只讀取這些記錄，前綴比對時合併各詞的位置"""
+    condition, params = _term_condition(term, prefix)
+    sql = f"SELECT conversation_id, positions FROM {TERMS_TABLE} WHERE {condition}"
+    if ids is None:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    else:
+        rows = []
+        for i in range(0, len(ids), _MAX_PARAMS):
+            chunk = ids[i : i + _MAX_PARAMS]
+            placeholders = ", ".join("?" * len(chunk))
+            cursor.execute(
+                f"{sql} AND conversation_id IN ({placeholders})", (*params, *chunk)
+            )
+            rows.extend(cursor.fetchall())
+
+    postings: Dict[int, List[int]] = {}
+    for conversation_id, positions in rows:
+        postings.setdefault(conversation_id, []).extend(decode_positions(positions))
+    return postings
+
+
+def _verify_matches(cursor, query: str, ids: List[int]) -> Dict[int, List[int]]:
+    """讀取候選記錄的內容，返回確實包含查詢字串的記錄與命中位置"""
+    matches: Dict[int, List[int]] = {}
+    for i in range(0, len(ids), _MAX_PARAMS):
+        chunk = ids[i : i + _MAX_PARAMS]
+        placeholders = ", ".join("?" * len(chunk))
+        cursor.execute(
+            f"SELECT id, content FROM conversations WHERE id IN ({placeholders})",
+            chunk,
+        )
+        for conversation_id, content in cursor.fetchall():
+            offsets = find_offsets(content or "", query)
+            if offsets:
+                matches[conversation_id] = offsets
+    return matches
+
+
+def search_cjk_index(conn, query: str) -> Optional[Dict[int, List[int]]]:
+    """
+    以倒排索引搜尋子字串，結果與 `LIKE '%查詢%'` 相同
+
+    返回 {conversation_id: [命中起始位置...]}；查詢無法由索引回答時返回 None，
+    呼叫端應改用其他搜尋方式。包含 LIKE 萬用字元（% 或 _）的查詢也返回 None，
+    由呼叫端的 LIKE 保持原本的比對方式。
+    """
+    if "%" in query or "_" in query:
+        return None
+    terms = query_terms(query)
+    if terms is None:
+        return None
+
+    cursor = conn.cursor()
+    frequencies = {}
+    for key in {(term, prefix) for term, _, prefix in terms}:
+        # 只沿主鍵範圍計數到 FREQUENCY_PROBE_LIMIT 筆，常見詞的成本有上限
+        condition, params = _term_condition(*key)
+        cursor.execute(
+            f"SELECT COUNT(*) FROM (SELECT 1 FROM {TERMS_TABLE} WHERE {condition} LIMIT ?)",
+            (*params, FREQUENCY_PROBE_LIMIT),
+        )
+        frequencies[key] = cursor.fetchone()[0]
+        if not frequencies[key]:
+            return {}
+
+    # 由最稀有的詞開始縮小候選範圍
+    postings: Dict[Tuple[str, bool], Dict[int, List[int]]] = {}
+    candidates: Optional[List[int]] = None
+    for key in sorted(sorted(frequencies), key=frequencies.get):
+        postings[key] = _fetch_postings(cursor, *key, candidates)
+        candidates = list(postings[key])
+        if not candidates:
+            return {}
+
+    return _verify_matches(cursor, query, sorted(match_offsets(terms, postings)))
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    """命令列入口：為既有資料庫建立或重建 n-gram 索引"""
+    parser = argparse.ArgumentParser(description="建立或重建中日韓文字 n-gram 索引")
+    parser.add_argument("database", help="SQLite 資料庫檔案路徑")
+    args = parser.parse_args(argv)
+
+    conn = sqlite3.connect(args.database)
+    try:
+        started = time.perf_counter()
+        if install_cjk_index(conn):
+            count = conn.execute("SELECT COUNT(*) FROM conversations").fetchone()[0]
+        else:
+            count = rebuild_cjk_index(conn)
+        conn.commit()
+        print(f"已索引 {count} 筆對話，耗時 {time.perf_counter() - started:.2f} 秒")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
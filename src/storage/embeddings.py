@@ -0,0 +1,400 @@
+"""
+本機語意向量搜尋
+
+以特徵雜湊（feature hashing）將對話內容投影成固定維度的向量，不需要網路或
+預先訓練的模型：詞彙沿用 n-gram 索引的切詞（中日韓文字 bigram、英文單字與
+識別字子詞），英文單字另外加入字元 trigram，讓 migrate / migration 這類
+字形相近的詞也能互相命中。每個特徵以穩定的雜湊值決定維度與正負號，詞頻取
+1 + log(tf)，最後正規化為單位向量，因此內積即為餘弦相似度。
+
+向量存放在記憶體映射的 float32 矩陣檔案中，第 i 列即為 ID 為 i 的對話，
+不需要另外的 ID 對照表；尚未建立向量或已刪除的對話為零向量。檔頭記錄維度與
+已處理到的最大 ID，sync() 只為之後新增的對話計算向量。搜尋以分段矩陣乘法
+一次計算多個查詢的分數，再以 argpartition 取出 top-k，不必掃描對話內容。
+
+可對既有資料庫建立或重建向量：
+
+    python -m src.storage.embeddings data/conversations.db
+"""
+
+import argparse
+import math
+import os
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from collections import Counter
+from functools import lru_cache
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+import numpy as np
+
+from src.storage.cjk_index import tokenize
+
+DEFAULT_EMBEDDING_DIM = 256
+
+# 檔頭：魔術字串、維度、保留欄位、已處理到的最大對話 ID，補齊到 64 位元組
+_HEADER = struct.Struct("<8sIIQ")
+_MAGIC = b"CRVEC\x00\x00\x01"
+HEADER_SIZE = 64
+
+# 矩陣列數的最小值與每次擴充的倍數
+_MIN_ROWS = 1024
+_GROWTH = 2
+
+# 搜尋時每段計算的列數，限制暫存分數矩陣的大小
+SEARCH_CHUNK_ROWS = 65536
+
+# 字元 trigram 相對於完整單字的權重
+_TRIGRAM_WEIGHT = 0.5
+
+# 常見的英文虛詞沒有語意，不計入特徵
+_STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have i in is it its of on or so "
+    "that the this to was were will with you your we they he she not do does".split()
+)
+
+
+@lru_cache(maxsize=65536)
+def _feature_slot(feature: str) -> Tuple[int, float]:
+    """特徵對應的維度與正負號（crc32 在不同程序間穩定，不受 PYTHONHASHSEED 影響）"""
+    digest = zlib.crc32(feature.encode("utf-8"))
+    return digest, (1.0 if digest & 0x80000000 else -1.0)
+
+
+def text_features(text: str) -> Counter:
+    """返回內容的特徵與權重"""
+    features: Counter = Counter()
+    for term, _ in tokenize(text or ""):
+        if term in _STOPWORDS:
+            continue
+        features[term] += 1.0
+        if term.isascii() and term.isalpha() and len(term) > 3:
+            padded = f"#{term}#"
+            for i in range(len(padded) - 2):
+                features["\x00" + padded[i : i + 3]] += _TRIGRAM_WEIGHT
+    return features
+
+
+def embed_texts(texts: Sequence[str], dim: int = DEFAULT_EMBEDDING_DIM) -> np.ndarray:
+    """將多筆內容轉為 (len(texts), dim) 的單位向量矩陣，沒有特徵的內容為零向量"""
+    matrix = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        vector = matrix[row]
+        for feature, count in text_features(text).items():
+            digest, sign = _feature_slot(feature)
+            # 詞頻取對數，避免重複多次的詞主導整個向量；trigram 權重可能小於 1
+            weight = 1.0 + math.log(count) if count >= 1 else count
+            vector[digest % dim] += sign * weight
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix
+
+
+class EmbeddingStore:
+    """以對話 ID 為列號的記憶體映射向量矩陣（可在多個執行緒中使用）"""
+
+    def __init__(self, path: str, dim: int = DEFAULT_EMBEDDING_DIM):
+        self.path = path
+        self.dim = dim
+        self._lock = threading.Lock()
+        # 同一時間只有一個 sync()，避免兩個執行緒為同一段記錄重複計算
+        self._sync_lock = threading.Lock()
+        self._file = None
+        self._matrix: Optional[np.memmap] = None
+        self._rows = 0
+        self._last_id = 0
+        # 已寫入矩陣的最大 ID；sync() 在通知 on_embed 之後才更新 last_id
+        self._written_id = 0
+
+        # 統計資訊
+        self._embedded = 0
+        self._searches = 0
+        self._search_time = 0.0
+        self._open()
+
+    def _open(self) -> None:
+        """開啟（必要時建立）向量檔案；維度不同或格式不符時清空，由 sync() 重新計算"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        mode = "r+b" if os.path.exists(self.path) else "w+b"
+        self._file = open(self.path, mode)
+        header = self._file.read(_HEADER.size)
+        if len(header) == _HEADER.size:
+            magic, dim, _, last_id = _HEADER.unpack(header)
+            if magic == _MAGIC and dim == self.dim:
+                self._last_id = self._written_id = last_id
+                self._map(self._file_rows())
+                return
+        self._reset()
+
+    def _file_rows(self) -> int:
+        size = os.fstat(self._file.fileno()).st_size
+        return max(0, (size - HEADER_SIZE) // (self.dim * 4))
+
+    def _map(self, rows: int) -> None:
+        """重新映射矩陣；舊的映射仍可供進行中的搜尋使用"""
+        self._rows = rows
+        if rows:
+            self._matrix = np.memmap(
+                self._file,
+                dtype=np.float32,
+                mode="r+",
+                offset=HEADER_SIZE,
+                shape=(rows, self.dim),
+            )
+        else:
+            self._matrix = None
+
+    def _write_header(self) -> None:
+        header = _HEADER.pack(_MAGIC, self.dim, 0, self._last_id)
+        os.pwrite(self._file.fileno(), header.ljust(HEADER_SIZE, b"\x00"), 0)
+
+    def _reset(self) -> None:
+        self._matrix = None
+        self._file.truncate(HEADER_SIZE)
+        self._last_id = self._written_id = 0
+        self._write_header()
+        self._map(0)
+
+    def _ensure_rows(self, max_id: int) -> None:
+        """擴充檔案使其包含第 max_id 列（呼叫端持有鎖）"""
+        if max_id < self._rows:
+            return
+        rows = max(_MIN_ROWS, self._rows)
+        while rows <= max_id:
+            rows *= _GROWTH
+        self._file.truncate(HEADER_SIZE + rows * self.dim * 4)
+        self._map(rows)
+
+    @property
+    def last_id(self) -> int:
+        """已計算向量的最大對話 ID"""
+        return self._last_id
+
+    @property
+    def written_id(self) -> int:
+        """已寫入矩陣的最大對話 ID（可能大於 last_id，該批次的 sync() 尚未完成）"""
+        return self._written_id
+
+    def add(self, ids: Sequence[int], vectors: np.ndarray) -> None:
+        """寫入指定對話的向量"""
+        if not len(ids):
+            return
+        with self._lock:
+            self._ensure_rows(max(ids))
+            self._matrix[np.asarray(ids)] = vectors
+            self._written_id = max(self._written_id, max(ids))
+            self._embedded += len(ids)
+
+    def remove(self, ids: Iterable[int]) -> None:
+        """將已刪除對話的向量清為零"""
+        with self._lock:
+            rows = [
+                conversation_id
+                for conversation_id in ids
+                if 0 <= conversation_id < self._rows
+            ]
+            if rows:
+                self._matrix[np.asarray(rows)] = 0.0
+
+    def vectors(self, ids: Sequence[int]) -> np.ndarray:
+        """返回指定對話的向量，超出範圍的 ID 為零向量"""
+        matrix, rows = self._matrix, self._rows
+        ids = np.asarray(ids, dtype=np.int64)
+        result = np.zeros((len(ids), self.dim), dtype=np.float32)
+        valid = (ids >= 0) & (ids < rows)
+        if valid.any():
+            result[valid] = matrix[ids[valid]]
+        return result
+
+    def iter_vectors(
+        self,
+        start_id: int = 0,
+        chunk_rows: int = SEARCH_CHUNK_ROWS,
+        end_id: Optional[int] = None,
+    ) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """從 start_id 起到 end_id（預設為 last_id）依 ID 順序分段返回 (ids, vectors)，略過零向量"""
+        end_id = self._last_id if end_id is None else end_id
+        matrix, rows = self._matrix, min(self._rows, end_id + 1)
+        for start in range(
+            max(0, start_id), rows if matrix is not None else 0, chunk_rows
+        ):
+            chunk = np.asarray(matrix[start : start + chunk_rows])
+            present = np.flatnonzero(chunk.any(axis=1))
+            if len(present):
+                yield present + start, chunk[present]
+
+    def sync(
+        self,
+        conn,
+        batch_size: int = 1000,
+        on_embed: Optional[Callable[[List[int], np.ndarray], None]] = None,
+    ) -> int:
+        """
+        為 last_id 之後新增的對話計算向量，返回處理的記錄數
+
+        先寫入向量再更新檔頭，中途失敗時下次會從原本的位置重新計算。每批
+        向量寫入後以 on_embed(ids, vectors) 通知呼叫端（例如更新近似索引）。
+        """
+        with self._sync_lock:
+            return self._sync(conn, batch_size, on_embed)
+
+    def _sync(self, conn, batch_size: int, on_embed) -> int:
+        total = 0
+        while True:
+            rows = conn.execute(
+                "SELECT id, content FROM conversations WHERE id > ? ORDER BY id LIMIT ?",
+                (self._last_id, batch_size),
+            ).fetchall()
+            if not rows:
+                break
+            ids = [row[0] for row in rows]
+            vectors = embed_texts([row[1] for row in rows], self.dim)
+            self.add(ids, vectors)
+            if on_embed is not None:
+                on_embed(ids, vectors)
+            with self._lock:
+                self._matrix.flush()
+                self._last_id = max(self._last_id, ids[-1])
+                self._write_header()
+            total += len(rows)
+            if len(rows) < batch_size:
+                break
+        return total
+
+    def rebuild(self, conn, batch_size: int = 1000) -> int:
+        """清空後依 conversations 的目前內容重新計算所有向量"""
+        with self._sync_lock:
+            with self._lock:
+                self._reset()
+            return self._sync(conn, batch_size, None)
+
+    def search(
+        self,
+        queries: np.ndarray,
+        k: int = 10,
+        min_score: float = 0.0,
+        chunk_rows: int = SEARCH_CHUNK_ROWS,
+    ) -> List[List[Tuple[int, float]]]:
+        """
+        以餘弦相似度搜尋，queries 為 (查詢數, dim) 的單位向量矩陣
+
+        每段以一次矩陣乘法計算所有查詢的分數，段內以 argpartition 保留前 k 名，
+        最後再合併排序。返回每個查詢的 [(conversation_id, score), ...]，只包含
+        分數大於 min_score 的結果（零向量的分數為 0，不會出現在結果中）。
+        """
+        started = time.perf_counter()
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        matrix, rows = self._matrix, min(self._rows, self._last_id + 1)
+        count = queries.shape[0]
+        results: List[List[Tuple[int, float]]] = [[] for _ in range(count)]
+        if matrix is None or rows == 0 or k <= 0:
+            return results
+
+        candidate_ids: List[np.ndarray] = []
+        candidate_scores: List[np.ndarray] = []
+        for start in range(0, rows, chunk_rows):
+            scores = np.asarray(matrix[start : start + chunk_rows]) @ queries.T
+            if scores.shape[0] > k:
+                top = np.argpartition(-scores, k - 1, axis=0)[:k]
+                candidate_ids.append(top + start)
+                candidate_scores.append(np.take_along_axis(scores, top, axis=0))
+            else:
+                candidate_ids.append(
+                    np.repeat(
+                        np.arange(start, start + scores.shape[0])[:, None],
+                        count,
+                        axis=1,
+                    )
+                )
+                candidate_scores.append(scores)
+
+        ids = np.concatenate(candidate_ids)
+        scores = np.concatenate(candidate_scores)
+        order = np.argsort(-scores, axis=0, kind="stable")[:k]
+        for query in range(count):
+            for row in order[:, query]:
+                score = float(scores[row, query])
+                if score <= min_score:
+                    break
+                results[query].append((int(ids[row, query]), score))
+
+        self._searches += count
+        self._search_time += time.perf_counter() - started
+        return results
+
+    def search_text(
+        self, query: str, k: int = 10, min_score: float = 0.0
+    ) -> List[Tuple[int, float]]:
+        """以文字查詢，返回 [(conversation_id, score), ...]"""
+        return self.search(embed_texts([query], self.dim), k, min_score)[0]
+
+    def close(self) -> None:
+        with self._lock:
+            if self._matrix is not None:
+                self._matrix.flush()
+            self._matrix = None
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def stats(self) -> Dict[str, Any]:
+        """返回向量儲存的統計資訊"""
+        return {
+            "path": self.path,
+            "dim": self.dim,
+            "rows": self._rows,
+            "last_id": self._last_id,
+            "file_bytes": HEADER_SIZE + self._rows * self.dim * 4,
+            "embedded": self._embedded,
+            "searches": self._searches,
+            "avg_search_ms": (
+                (self._search_time / self._searches * 1000) if self._searches else 0.0
+            ),
+        }
+
+
+def default_store_path(database_path: str) -> str:
+    """與資料庫檔案放在同一個目錄的向量檔案路徑"""
+    return os.path.splitext(database_path)[0] + ".vectors"
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    """命令列入口：為既有資料庫建立或重建向量"""
+    parser = argparse.ArgumentParser(description="建立或重建對話的語意向量")
+    parser.add_argument("database", help="SQLite 資料庫檔案路徑")
+    parser.add_argument("--store", help="向量檔案路徑，預設為資料庫檔名改為 .vectors")
+    parser.add_argument(
+        "--dim", type=int, default=DEFAULT_EMBEDDING_DIM, help="向量維度"
+    )
+    args = parser.parse_args(argv)
+
+    conn = sqlite3.connect(args.database)
+    store = EmbeddingStore(args.store or default_store_path(args.database), args.dim)
+    try:
+        started = time.perf_counter()
+        count = store.rebuild(conn)
+        print(
+            f"已為 {count} 筆對話建立向量，耗時 {time.perf_counter() - started:.2f} 秒"
+        )
+    finally:
+        store.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
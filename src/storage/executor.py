@@ -0,0 +1,119 @@
+"""
+資料庫執行層
+
+將同步的 sqlite3 查詢交給有上限的執行緒池處理，避免阻塞 asyncio 事件迴圈，
+並記錄排隊深度與等待時間等指標。
+"""
+
+import asyncio
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, ContextManager, Dict, Optional
+
+
+class DatabaseExecutor:
+    """在固定大小的執行緒池中執行資料庫工作"""
+
+    def __init__(
+        self,
+        connection_factory: Callable[[], ContextManager[sqlite3.Connection]],
+        max_workers: int = 4,
+    ):
+        self.connection_factory = connection_factory
+        self.max_workers = max(1, max_workers)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+        # 統計資訊
+        self._queued = 0
+        self._running = 0
+        self._max_queue_depth = 0
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._wait_time = 0.0
+        self._max_wait_time = 0.0
+        self._run_time = 0.0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_workers,
+                        thread_name_prefix="db-executor",
+                    )
+        return self._executor
+
+    def _execute(
+        self, func: Callable[..., Any], submitted_at: float, args, kwargs
+    ) -> Any:
+        """在工作執行緒中借用連接並執行查詢"""
+        started = time.perf_counter()
+        waited = started - submitted_at
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+            self._wait_time += waited
+            self._max_wait_time = max(self._max_wait_time, waited)
+
+        failed = False
+        try:
+            with self.connection_factory() as conn:
+                return func(conn, *args, **kwargs)
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._run_time += time.perf_counter() - started
+                if failed:
+                    self._failed += 1
+                else:
+                    self._completed += 1
+
+    async def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        在執行緒池中執行 func(conn, *args, **kwargs) 並等待結果
+
+        參數:
+        - func: 同步函數，第一個參數為借用的 sqlite3 連接
+        """
+        executor = self._get_executor()
+        with self._lock:
+            self._submitted += 1
+            self._queued += 1
+            self._max_queue_depth = max(self._max_queue_depth, self._queued)
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            executor, self._execute, func, time.perf_counter(), args, kwargs
+        )
+
+    def shutdown(self, wait: bool = True) -> None:
+        """關閉執行緒池"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+    def stats(self) -> Dict[str, Any]:
+        """返回執行層的排隊與耗時統計"""
+        with self._lock:
+            finished = self._completed + self._failed
+            started = finished + self._running
+            return {
+                "max_workers": self.max_workers,
+                "queue_depth": self._queued,
+                "max_queue_depth": self._max_queue_depth,
+                "running": self._running,
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "failed": self._failed,
+                "avg_wait_ms": (self._wait_time / started * 1000) if started else 0.0,
+                "max_wait_ms": self._max_wait_time * 1000,
+                "avg_run_ms": (self._run_time / finished * 1000) if finished else 0.0,
+            }
@@ -0,0 +1,179 @@
+"""
+串流匯出對話記錄（NDJSON）
+
+以 SQLite 的 json_object() 直接產生每一行 JSON，透過資料庫游標分段讀取，
+每次只在記憶體中保留一段資料，不受資料表大小影響。可選擇以 gzip 壓縮輸出。
+
+命令列匯出：
+
+    python -m src.storage.export data/conversations.db -o conversations.ndjson.gz --gzip
+"""
+
+import argparse
+import sqlite3
+import sys
+import time
+import zlib
+from typing import (
+    AsyncIterable,
+    AsyncIterator,
+    Dict,
+    Iterable,
+    Iterator,
+    Optional,
+    Sequence,
+)
+
+from src.storage.migrations import conversation_columns, metadata_column
+from src.storage.pagination import normalize_timestamp
+
+# 每次從游標讀取的記錄數
+EXPORT_CHUNK_SIZE = 1000
+
+
+def build_export_sql(
+    metadata_column: str = "metadata",
+    since: bool = False,
+    until: bool = False,
+    session_id: bool = False,
+    session_column: bool = True,
+) -> str:
+    """
+    產生匯出 SQL，每列為一行 JSON 字串
+
+    篩選條件使用具名參數 :since（含）、:until（不含）與 :session_id；
+    尚未遷移出 session_id 欄位時改由 metadata 取值。
+    """
+    metadata = f"CASE WHEN json_valid({metadata_column}) THEN json({metadata_column}) ELSE {metadata_column} END"
+    line = (
+        "json_object('id', id, 'timestamp', timestamp, 'role', role, "
+        f"'content', content, '{metadata_column}', {metadata})"
+    )
+
+    conditions = []
+    if since:
+        conditions.append("timestamp >= :since")
+    if until:
+        conditions.append("timestamp < :until")
+    if session_id:
+        if session_column:
+            conditions.append("session_id = :session_id")
+        else:
+            conditions.append(
+                f"CASE WHEN json_valid({metadata_column}) "
+                f"THEN json_extract({metadata_column}, '$.session_id') END = :session_id"
+            )
+
+    sql = f"SELECT {line} FROM conversations"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    # 有篩選條件時沿著 (timestamp, id) 或 (session_id, timestamp) 索引依時間讀取，
+    # 否則直接依主鍵掃描，都不需要額外排序
+    sql += " ORDER BY timestamp, id" if conditions else " ORDER BY id"
+    return sql
+
+
+def join_lines(lines: Iterable[str]) -> bytes:
+    """將一段 JSON 字串組成 NDJSON 位元組"""
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def iter_export(
+    conn, sql: str, params: Dict[str, str], chunk_size: int = EXPORT_CHUNK_SIZE
+) -> Iterator[bytes]:
+    """以 DB-API 游標分段讀取，每段產生一塊 NDJSON"""
+    cursor = conn.cursor()
+    cursor.execute(sql, params)
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            return
+        yield join_lines(row[0] for row in rows)
+
+
+def _gzip_compressor():
+    return zlib.compressobj(6, zlib.DEFLATED, 31)
+
+
+def gzip_chunks(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """以 gzip 格式串流壓縮"""
+    compressor = _gzip_compressor()
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+async def agzip_chunks(chunks: AsyncIterable[bytes]) -> AsyncIterator[bytes]:
+    """gzip_chunks 的非同步版本"""
+    compressor = _gzip_compressor()
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    """命令列入口：將資料庫匯出為 NDJSON"""
+    parser = argparse.ArgumentParser(description="將對話記錄匯出為 NDJSON")
+    parser.add_argument("database", help="SQLite 資料庫檔案路徑")
+    parser.add_argument("-o", "--output", help="輸出檔案，預設為標準輸出")
+    parser.add_argument("--gzip", action="store_true", help="以 gzip 壓縮輸出")
+    parser.add_argument("--since", help="起始時間（含），ISO 8601 格式")
+    parser.add_argument("--until", help="結束時間（不含），ISO 8601 格式")
+    parser.add_argument("--session", help="只匯出指定 session_id 的記錄")
+    parser.add_argument(
+        "--chunk-size", type=int, default=EXPORT_CHUNK_SIZE, help="每次讀取的記錄數"
+    )
+    args = parser.parse_args(argv)
+
+    params = {}
+    try:
+        if args.since:
+            params["since"] = normalize_timestamp(args.since)
+        if args.until:
+            params["until"] = normalize_timestamp(args.until)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.session:
+        params["session_id"] = args.session
+
+    conn = sqlite3.connect(f"file:{args.database}?mode=ro", uri=True)
+    output = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        cursor = conn.cursor()
+        sql = build_export_sql(
+            metadata_column(cursor),
+            since="since" in params,
+            until="until" in params,
+            session_id="session_id" in params,
+            session_column="session_id" in conversation_columns(cursor),
+        )
+        started = time.perf_counter()
+        count = 0
+
+        def counted(chunks: Iterable[bytes]) -> Iterator[bytes]:
+            nonlocal count
+            for chunk in chunks:
+                count += chunk.count(b"\n")
+                yield chunk
+
+        chunks = counted(iter_export(conn, sql, params, max(1, args.chunk_size)))
+        if args.gzip:
+            chunks = gzip_chunks(chunks)
+        for chunk in chunks:
+            output.write(chunk)
+        if args.output:
+            print(
+                f"已匯出 {count} 筆對話至 {args.output}，耗時 {time.perf_counter() - started:.2f} 秒"
+            )
+    finally:
+        if args.output:
+            output.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
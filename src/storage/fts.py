@@ -0,0 +1,191 @@
+"""
+FTS5 全文索引
+
+以 FTS5 外部內容資料表為 conversations 建立全文索引，由觸發器保持同步，
+搜尋時依 BM25 排序，並可選擇加入時間新近度加權。
+
+可對既有資料庫執行回填：
+
+    python -m src.storage.fts data/conversations.db
+"""
+
+import argparse
+import re
+import sqlite3
+import time
+from typing import List, Optional, Sequence, Tuple
+
+from src.storage.pagination import KEYSET_BEFORE_SQL, keyset_params
+
+FTS_TABLE = "conversations_fts"
+
+# BM25 欄位權重：content, role
+BM25_WEIGHTS = (1.0, 0.5)
+
+FTS_SCHEMA = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        content,
+        role,
+        content='conversations',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON conversations BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, content, role) VALUES (new.id, new.content, new.role);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON conversations BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content, role)
+        VALUES ('delete', old.id, old.content, old.role);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF content, role ON conversations BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content, role)
+        VALUES ('delete', old.id, old.content, old.role);
+        INSERT INTO {FTS_TABLE}(rowid, content, role) VALUES (new.id, new.content, new.role);
+    END
+    """,
+]
+
+FTS_EXISTS_SQL = (
+    f"SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = '{FTS_TABLE}'"
+)
+FTS_REBUILD_SQL = f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"
+
+# 中日韓文字的 Unicode 範圍（假名、CJK 統一表意文字及擴充 A、相容表意文字、韓文音節）
+CJK_RANGES = r"\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af"
+
+_TERM_PATTERN = re.compile(r"\w+", re.UNICODE)
+_CJK_PATTERN = re.compile(f"[{CJK_RANGES}]")
+
+
+def fts_exists(conn) -> bool:
+    """檢查全文索引資料表是否存在（conn 為 DB-API 連接）"""
+    cursor = conn.cursor()
+    cursor.execute(FTS_EXISTS_SQL)
+    return cursor.fetchone() is not None
+
+
+def install_fts(conn) -> bool:
+    """
+    建立全文索引資料表與同步觸發器
+
+    若索引為首次建立，會立即從 conversations 回填既有資料。
+    不會自動提交，由呼叫端決定交易範圍。返回是否為首次建立。
+    """
+    created = not fts_exists(conn)
+    cursor = conn.cursor()
+    for statement in FTS_SCHEMA:
+        cursor.execute(statement)
+    if created:
+        cursor.execute(FTS_REBUILD_SQL)
+    return created
+
+
+def rebuild_fts(conn) -> None:
+    """依 conversations 的目前內容重建全文索引"""
+    cursor = conn.cursor()
+    cursor.execute(FTS_REBUILD_SQL)
+
+
+def contains_cjk(text: str) -> bool:
+    """判斷字串是否包含中日韓文字（unicode61 無法對其斷詞）"""
+    return bool(_CJK_PATTERN.search(text))
+
+
+def build_match_query(query: str) -> Optional[str]:
+    """
+    將使用者輸入轉為 FTS5 MATCH 語法
+
+    每個詞都加上引號避免被解讀為運算子，並使用前綴比對；
+    多個詞之間為 AND 關係。沒有可搜尋的詞時返回 None。
+    """
+    terms = _TERM_PATTERN.findall(query)
+    if not terms:
+        return None
+    return " ".join('"' + term.replace('"', '""') + '"*' for term in terms)
+
+
+def build_search_sql(
+    columns: Sequence[str],
+    recency_boost: bool = False,
+    paginate: bool = False,
+    order_by_time: bool = False,
+    after_cursor: bool = False,
+) -> str:
+    """
+    產生依 BM25 排序的全文搜尋 SQL
+
+    參數順序：[新近度加權值]、MATCH 查詢、[游標排序鍵]、LIMIT、[OFFSET]。
+    bm25() 分數越小越相關；新近度加權以 (1 + boost / (1 + 天數)) 放大分數，
+    讓較新的記錄排名提前。order_by_time 時改依 (timestamp, id) 由新到舊排列，
+    搭配 after_cursor 進行 keyset 分頁。
+    """
+    select_columns = ", ".join(f"c.{column}" for column in columns)
+    weights = ", ".join(str(weight) for weight in BM25_WEIGHTS)
+    score = f"bm25({FTS_TABLE}, {weights})"
+    if recency_boost:
+        age_days = "max(0.0, julianday('now') - julianday(c.timestamp))"
+        score = f"{score} * (1.0 + ? / (1.0 + {age_days}))"
+
+    sql = (
+        f"SELECT {select_columns}, {score} AS score "
+        f"FROM {FTS_TABLE} JOIN conversations AS c ON c.id = {FTS_TABLE}.rowid "
+        f"WHERE {FTS_TABLE} MATCH ?"
+    )
+    if after_cursor:
+        sql += f" AND {KEYSET_BEFORE_SQL}"
+    if order_by_time:
+        sql += " ORDER BY c.timestamp DESC, c.id DESC LIMIT ?"
+    else:
+        sql += " ORDER BY score, c.id DESC LIMIT ?"
+    if paginate:
+        sql += " OFFSET ?"
+    return sql
+
+
+def search_params(
+    match_query: str,
+    limit: int,
+    recency_boost: float = 0.0,
+    offset: Optional[int] = None,
+    cursor: Optional[Tuple[str, int]] = None,
+) -> List:
+    """依 build_search_sql 的參數順序組合查詢參數"""
+    params: List = []
+    if recency_boost:
+        params.append(recency_boost)
+    params.append(match_query)
+    if cursor is not None:
+        params.extend(keyset_params(cursor))
+    params.append(limit)
+    if offset is not None:
+        params.append(offset)
+    return params
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    """命令列入口：為既有資料庫建立或重建全文索引"""
+    parser = argparse.ArgumentParser(description="建立或重建對話全文索引")
+    parser.add_argument("database", help="SQLite 資料庫檔案路徑")
+    args = parser.parse_args(argv)
+
+    conn = sqlite3.connect(args.database)
+    try:
+        started = time.perf_counter()
+        if not install_fts(conn):
+            rebuild_fts(conn)
+        conn.commit()
+        count = conn.execute("SELECT COUNT(*) FROM conversations").fetchone()[0]
+        print(f"已索引 {count} 筆對話，耗時 {time.perf_counter() - started:.2f} 秒")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+混合檢索：關鍵字與語意排名融合
+
+關鍵字檢索（FTS5 BM25 或中日韓 n-gram 倒排索引）擅長精確詞彙，語意檢索
+（src.storage.embeddings / src.storage.ann）擅長換句話說的查詢。兩者的分數
+尺度不同，因此以倒數排名融合（Reciprocal Rank Fusion）合併：
+
+    score(d) = Σ 1 / (k + rank_i(d))
+
+只使用各自的名次，不需要校正分數。篩選條件（角色、會話、時間範圍）在各自
+的檢索中套用，只有最後融合出的前幾名才讀取完整內容。
+"""
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from src.storage.cjk_index import search_cjk_index
+from src.storage.fts import FTS_TABLE, BM25_WEIGHTS, build_match_query, contains_cjk
+from src.storage.pagination import normalize_timestamp
+
+# RRF 的平滑常數：越大時名次之間的分數差距越小
+RRF_K = 60
+
+# SQLite 單一語句的參數數量上限較保守的取值
+_MAX_PARAMS = 500
+
+
+def reciprocal_rank_fusion(
+    rankings: Sequence[Sequence[int]], k: int = RRF_K
+) -> List[Tuple[int, float]]:
+    """
+    合併多個排名（每個為依相關度排列的 ID 列表），返回依融合分數排列的 (id, score)
+
+    分數相同時 ID 較大（較新）者在前。
+    """
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, conversation_id in enumerate(ranking, start=1):
+            scores[conversation_id] = scores.get(conversation_id, 0.0) + 1.0 / (
+                k + rank
+            )
+    return sorted(scores.items(), key=lambda item: (-item[1], -item[0]))
+
+
+def build_filter_sql(
+    role: Optional[str] = None,
+    session_id: Optional[str] = None,
+    since=None,
+    until=None,
+) -> Tuple[str, List]:
+    """
+    產生篩選條件（以 AND 開頭，可直接接在 WHERE 之後）與參數
+
+    since 含、until 不含，接受 ISO 8601 字串、epoch 秒數或 datetime；
+    格式錯誤時拋出 ValueError。
+    """
+    conditions: List[str] = []
+    params: List = []
+    if role is not None:
+        conditions.append("c.role = ?")
+        params.append(role)
+    if session_id is not None:
+        conditions.append("c.session_id = ?")
+        params.append(session_id)
+    if since is not None:
+        conditions.append("c.timestamp >= ?")
+        params.append(normalize_timestamp(since))
+    if until is not None:
+        conditions.append("c.timestamp < ?")
+        params.append(normalize_timestamp(until))
+    return "".join(f" AND {condition}" for condition in conditions), params
+
+
+def filter_ids(
+    conn, ids: Sequence[int], filter_sql: str, params: Sequence
+) -> List[int]:
+    """返回 ids 中符合篩選條件的 ID，保留原本的順序"""
+    if not filter_sql or not ids:
+        return list(ids)
+    kept = set()
+    for i in range(0, len(ids), _MAX_PARAMS):
+        chunk = list(ids[i : i + _MAX_PARAMS])
+        placeholders = ", ".join("?" * len(chunk))
+        rows = conn.execute(
+            f"SELECT c.id FROM conversations AS c WHERE c.id IN ({placeholders}){filter_sql}",
+            [*chunk, *params],
+        ).fetchall()
+        kept.update(row[0] for row in rows)
+    return [conversation_id for conversation_id in ids if conversation_id in kept]
+
+
+def lexical_ranking(
+    conn, query: str, limit: int, filter_sql: str = "", params: Sequence = ()
+) -> List[int]:
+    """
+    以關鍵字檢索返回前 limit 筆符合篩選條件的 ID，依相關度排列
+
+    英文等以 FTS5 BM25 排序；中日韓文字以倒排索引找出命中記錄，依命中次數
+    （相同時較新者）排序；索引無法回答的查詢改用 LIKE，依時間由新到舊排列。
+    """
+    if contains_cjk(query):
+        matches = search_cjk_index(conn, query)
+        if matches is not None:
+            ranked = sorted(
+                matches,
+                key=lambda conversation_id: (
+                    -len(matches[conversation_id]),
+                    -conversation_id,
+                ),
+            )
+            return filter_ids(conn, ranked, filter_sql, params)[:limit]
+    else:
+        match_query = build_match_query(query)
+        if match_query:
+            weights = ", ".join(str(weight) for weight in BM25_WEIGHTS)
+            rows = conn.execute(
+                f"SELECT c.id FROM {FTS_TABLE} JOIN conversations AS c ON c.id = {FTS_TABLE}.rowid "
+                f"WHERE {FTS_TABLE} MATCH ?{filter_sql} "
+                f"ORDER BY bm25({FTS_TABLE}, {weights}), c.id DESC LIMIT ?",
+                [match_query, *params, limit],
+            ).fetchall()
+            return [row[0] for row in rows]
+
+    rows = conn.execute(
+        f"SELECT c.id FROM conversations AS c WHERE c.content LIKE ?{filter_sql} "
+        "ORDER BY c.timestamp DESC, c.id DESC LIMIT ?",
+        [f"%{query}%", *params, limit],
+    ).fetchall()
+    return [row[0] for row in rows]
@@ -0,0 +1,343 @@
+"""
+可續傳的 JSONL 匯入
+
+逐行串流解析從其他工具匯出的對話記錄（每行一個 JSON 物件），不會將整個
+檔案載入記憶體。欄位依名稱對應到 role／content／metadata／timestamp，每批
+記錄以單一交易寫入，並在同一個交易中記下已處理的位元組位置；匯入中斷後
+再次執行會從最後提交的位置繼續，不會重複寫入。檔案之後有附加新行時，再次
+執行只會匯入新增的部分。
+
+    python -m src.storage.importer data/conversations.db history.jsonl
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from src.storage.bulk import RowError, insert_chunk, validate_conversations
+from src.storage.cjk_index import index_conversations, install_cjk_index
+from src.storage.fts import install_fts
+from src.storage.migrations import CONVERSATIONS_SCHEMA, metadata_column, migrate
+from src.storage.pagination import format_timestamp
+from src.storage.pool import pragmas_from_env
+
+# 每個交易寫入的行數
+DEFAULT_BATCH_SIZE = 10000
+
+# 保留的錯誤範例數（錯誤總數另外計算）
+MAX_ERROR_SAMPLES = 20
+
+# 各欄位依序嘗試的來源欄位，支援以 "." 取巢狀欄位
+DEFAULT_FIELDS: Dict[str, Tuple[str, ...]] = {
+    "role": ("role", "author.role", "author", "sender", "speaker", "from"),
+    "content": ("content", "text", "message", "body"),
+    "timestamp": ("timestamp", "created_at", "create_time", "time", "date"),
+    "metadata": ("metadata", "extra_metadata", "meta"),
+}
+
+Checkpoint = Tuple[int, int, int]
+
+
+def _lookup(item: Dict[str, Any], path: str) -> Any:
+    value: Any = item
+    for key in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+def _text(value: Any) -> Any:
+    """將常見的內容格式（字串、片段列表、{"parts": [...]}、{"text": ...}）轉為字串"""
+    if isinstance(value, list):
+        parts = [_text(part) for part in value]
+        return "\n".join(part for part in parts if isinstance(part, str) and part)
+    if isinstance(value, dict):
+        return _text(value.get("text", value.get("parts")))
+    return value
+
+
+def map_record(
+    item: Any,
+    fields: Dict[str, Sequence[str]] = DEFAULT_FIELDS,
+    keep_extra: bool = False,
+) -> Any:
+    """
+    將一筆來源記錄對應為 validate_conversations 接受的格式
+
+    每個欄位取第一個有值的來源欄位；keep_extra 時其餘頂層欄位併入 metadata
+    （不覆寫既有的鍵）。非物件的記錄原樣返回，由驗證步驟回報錯誤。
+    """
+    if not isinstance(item, dict):
+        return item
+    mapped: Dict[str, Any] = {}
+    used = set()
+    for name, candidates in fields.items():
+        for path in candidates:
+            value = _lookup(item, path)
+            if value is not None:
+                mapped[name] = value
+                used.add(path.split(".")[0])
+                break
+    if "role" in mapped and isinstance(mapped["role"], dict):
+        mapped["role"] = mapped["role"].get("role")
+    if "content" in mapped:
+        mapped["content"] = _text(mapped["content"])
+
+    if keep_extra:
+        extra = {key: value for key, value in item.items() if key not in used}
+        if extra:
+            metadata = mapped.get("metadata")
+            if isinstance(metadata, str):
+                try:
+                    metadata = json.loads(metadata)
+                except ValueError:
+                    metadata = {"raw": metadata}
+            if metadata is None or isinstance(metadata, dict):
+                mapped["metadata"] = {**extra, **(metadata or {})}
+    return mapped
+
+
+def load_checkpoint(conn, source: str) -> Optional[Checkpoint]:
+    """返回 (位元組位置, 已匯入筆數, 錯誤筆數)，尚未匯入過時為 None"""
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT offset, rows, errors FROM import_checkpoints WHERE source = ?",
+        (source,),
+    )
+    row = cursor.fetchone()
+    return tuple(row) if row else None
+
+
+def save_checkpoint(conn, source: str, offset: int, rows: int, errors: int) -> None:
+    """記錄匯入進度（不會自動提交，需與該批寫入在同一個交易中）"""
+    conn.cursor().execute(
+        """
+        INSERT INTO import_checkpoints (source, offset, rows, errors, updated_at)
+        VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT(source) DO UPDATE SET
+            offset = excluded.offset,
+            rows = excluded.rows,
+            errors = excluded.errors,
+            updated_at = excluded.updated_at
+        """,
+        (source, offset, rows, errors),
+    )
+
+
+def prepare_database(conn) -> None:
+    """建立資料表並套用遷移與索引，讓匯入可用於全新的資料庫"""
+    conn.cursor().execute(CONVERSATIONS_SCHEMA)
+    migrate(conn)
+    install_fts(conn)
+    install_cjk_index(conn)
+    conn.commit()
+
+
+def import_jsonl(
+    conn,
+    path: str,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    fields: Dict[str, Sequence[str]] = DEFAULT_FIELDS,
+    keep_extra: bool = False,
+    source: Optional[str] = None,
+    restart: bool = False,
+    progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> Dict[str, Any]:
+    """
+    匯入 JSONL 檔案，返回統計資訊
+
+    source 為檢查點的鍵，預設為檔案的絕對路徑；restart 時忽略既有檢查點
+    從頭匯入。每提交一批會呼叫 progress。寫入失敗時回滾該批並拋出例外，
+    檢查點停在上一批，修正問題後可直接重新執行。
+    """
+    batch_size = max(1, batch_size)
+    source = source or os.path.abspath(path)
+    size = os.path.getsize(path)
+
+    prepare_database(conn)
+    cursor = conn.cursor()
+    metadata = metadata_column(cursor)
+    # SQLAlchemy 模型的時間由應用程式產生，資料表沒有預設值
+    app_timestamp = metadata == "extra_metadata"
+
+    checkpoint = None if restart else load_checkpoint(conn, source)
+    offset, total_rows, total_errors = checkpoint or (0, 0, 0)
+    if offset > size:
+        raise ValueError(
+            f"檢查點位置 {offset} 超過檔案大小 {size}，檔案可能已被替換，請改用 restart"
+        )
+
+    started = time.perf_counter()
+    imported = 0
+    error_samples: List[RowError] = []
+    items: List[Any] = []
+    line_offsets: List[int] = []
+    bad_lines: List[int] = []
+    position = committed = offset
+
+    def flush() -> None:
+        nonlocal total_rows, total_errors, imported, committed
+        rows, errors = validate_conversations(items, skip=bad_lines)
+        try:
+            if rows:
+                insert_chunk(
+                    conn,
+                    rows,
+                    index_conversations,
+                    metadata_column=metadata,
+                    timestamp=(
+                        format_timestamp(datetime.now()) if app_timestamp else None
+                    ),
+                )
+            save_checkpoint(
+                conn,
+                source,
+                position,
+                total_rows + len(rows),
+                total_errors + len(errors),
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        committed = position
+        total_rows += len(rows)
+        total_errors += len(errors)
+        imported += len(rows)
+        for error in errors[: MAX_ERROR_SAMPLES - len(error_samples)]:
+            error_samples.append(
+                {"offset": line_offsets[error["index"]], "error": error["error"]}
+            )
+        items.clear()
+        line_offsets.clear()
+        bad_lines.clear()
+        if progress is not None:
+            elapsed = time.perf_counter() - started
+            progress(
+                {
+                    "rows": total_rows,
+                    "errors": total_errors,
+                    "offset": position,
+                    "size": size,
+                    "rate": imported / elapsed if elapsed > 0 else 0.0,
+                }
+            )
+
+    with open(path, "rb") as f:
+        f.seek(offset)
+        for line in f:
+            start = position
+            position += len(line)
+            if not line.strip():
+                continue
+            try:
+                item = map_record(json.loads(line), fields, keep_extra)
+            except ValueError as e:
+                bad_lines.append(len(items))
+                total_errors += 1
+                if len(error_samples) < MAX_ERROR_SAMPLES:
+                    error_samples.append(
+                        {"offset": start, "error": f"JSON 格式錯誤: {e}"}
+                    )
+                item = None
+            items.append(item)
+            line_offsets.append(start)
+            if len(items) >= batch_size:
+                flush()
+        if position != committed:
+            flush()
+
+    elapsed = time.perf_counter() - started
+    return {
+        "source": source,
+        "resumed_from": offset if checkpoint else 0,
+        "offset": position,
+        "size": size,
+        "imported": imported,
+        "rows": total_rows,
+        "errors": total_errors,
+        "error_samples": error_samples,
+        "elapsed": elapsed,
+        "rate": imported / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    """命令列入口：將 JSONL 檔案匯入資料庫"""
+    parser = argparse.ArgumentParser(
+        description="將 JSONL 對話記錄匯入資料庫，中斷後可續傳"
+    )
+    parser.add_argument("database", help="SQLite 資料庫檔案路徑")
+    parser.add_argument("file", help="JSONL 檔案路徑")
+    parser.add_argument(
+        "--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="每個交易寫入的行數"
+    )
+    for name in DEFAULT_FIELDS:
+        parser.add_argument(
+            f"--{name}-field",
+            help=f"{name} 的來源欄位（可用 . 取巢狀欄位），預設依序嘗試 {', '.join(DEFAULT_FIELDS[name])}",
+        )
+    parser.add_argument(
+        "--keep-extra", action="store_true", help="將其餘欄位保存到 metadata"
+    )
+    parser.add_argument("--source", help="檢查點名稱，預設為檔案的絕對路徑")
+    parser.add_argument(
+        "--restart", action="store_true", help="忽略既有檢查點，從頭匯入"
+    )
+    parser.add_argument("--quiet", action="store_true", help="不顯示進度")
+    args = parser.parse_args(argv)
+
+    fields = {
+        name: (
+            (getattr(args, f"{name}_field"),)
+            if getattr(args, f"{name}_field")
+            else candidates
+        )
+        for name, candidates in DEFAULT_FIELDS.items()
+    }
+
+    def report(stats: Dict[str, Any]) -> None:
+        percent = stats["offset"] / stats["size"] * 100 if stats["size"] else 100.0
+        print(
+            f"已匯入 {stats['rows']} 筆（錯誤 {stats['errors']} 筆），"
+            f"{stats['rate']:,.0f} 筆/秒，進度 {percent:.1f}%",
+            file=sys.stderr,
+        )
+
+    conn = sqlite3.connect(args.database)
+    try:
+        for name, value in pragmas_from_env().items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        try:
+            stats = import_jsonl(
+                conn,
+                args.file,
+                batch_size=args.batch_size,
+                fields=fields,
+                keep_extra=args.keep_extra,
+                source=args.source,
+                restart=args.restart,
+                progress=None if args.quiet else report,
+            )
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+        if stats["resumed_from"]:
+            print(f"從位元組 {stats['resumed_from']} 繼續匯入")
+        for error in stats["error_samples"]:
+            print(f"位元組 {error['offset']}: {error['error']}", file=sys.stderr)
+        print(
+            f"本次匯入 {stats['imported']} 筆對話，累計 {stats['rows']} 筆（錯誤 {stats['errors']} 筆），"
+            f"耗時 {stats['elapsed']:.2f} 秒，平均 {stats['rate']:,.0f} 筆/秒"
+        )
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+資料庫結構版本遷移
+
+以 schema_migrations 資料表記錄已套用的版本，啟動時依序套用尚未執行的
+遷移步驟。每個步驟本身都是冪等的（IF NOT EXISTS／先檢查欄位），即使在
+版本表建立前已手動建過索引也能安全執行。
+
+可對既有資料庫執行升級：
+
+    python -m src.storage.migrations data/conversations.db
+"""
+
+import argparse
+import sqlite3
+from typing import Callable, List, Optional, Sequence, Tuple
+
+MIGRATIONS_TABLE = "schema_migrations"
+
+# MCP Server 的基礎資料表結構，其餘索引與欄位由遷移步驟加入
+CONVERSATIONS_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS conversations (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        role TEXT NOT NULL,
+        content TEXT NOT NULL,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        metadata TEXT
+    )
+"""
+
+
+def conversation_columns(cursor) -> List[str]:
+    """返回 conversations 的欄位名稱（包含生成欄位）"""
+    cursor.execute("PRAGMA table_xinfo(conversations)")
+    return [row[1] for row in cursor.fetchall()]
+
+
+def metadata_column(cursor) -> str:
+    """MCP Server 的欄位為 metadata，SQLAlchemy 模型為 extra_metadata"""
+    return (
+        "metadata" if "metadata" in conversation_columns(cursor) else "extra_metadata"
+    )
+
+
+def _add_conversation_indexes(cursor) -> None:
+    """時間排序（含 keyset 分頁）、依角色篩選與統計使用的索引"""
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS ix_conversations_timestamp_id ON conversations (timestamp, id)"
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS ix_conversations_role_timestamp ON conversations (role, timestamp)"
+    )
+
+
+def _add_session_id_column(cursor) -> None:
+    """
+    由 metadata 中的 session_id 產生虛擬欄位並建立索引
+
+    虛擬生成欄位不佔用資料列空間，寫入時只需維護索引；metadata 不是合法
+    JSON 時為 NULL，避免寫入失敗。需要 SQLite 3.31 以上版本。
+    """
+    if "session_id" not in conversation_columns(cursor):
+        metadata = metadata_column(cursor)
+        cursor.execute(
+            "ALTER TABLE conversations ADD COLUMN session_id TEXT GENERATED ALWAYS AS "
+            f"(CASE WHEN json_valid({metadata}) THEN json_extract({metadata}, '$.session_id') END) VIRTUAL"
+        )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS ix_conversations_session_id ON conversations (session_id, timestamp)"
+    )
+
+
+def _add_import_checkpoints(cursor) -> None:
+    """記錄 JSONL 匯入進度（已提交的位元組位置），中斷後可從該處繼續"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS import_checkpoints (
+            source TEXT PRIMARY KEY,
+            offset INTEGER NOT NULL,
+            rows INTEGER NOT NULL,
+            errors INTEGER NOT NULL,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """)
+
+
+# (版本, 名稱, 升級函數)；只能附加新的步驟，不可修改已發佈的版本
+MIGRATIONS: List[Tuple[int, str, Callable]] = [
+    (1, "add_conversation_indexes", _add_conversation_indexes),
+    (2, "add_session_id_column", _add_session_id_column),
+    (3, "add_import_checkpoints", _add_import_checkpoints),
+]
+
+
+def current_version(conn) -> int:
+    """返回已套用的最新版本，尚未建立版本表時為 0"""
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+        (MIGRATIONS_TABLE,),
+    )
+    if cursor.fetchone() is None:
+        return 0
+    cursor.execute(f"SELECT COALESCE(MAX(version), 0) FROM {MIGRATIONS_TABLE}")
+    return cursor.fetchone()[0]
+
+
+def migrate(conn) -> List[int]:
+    """
+    套用所有尚未執行的遷移步驟
+
+    conversations 資料表需已存在。不會自動提交，由呼叫端決定交易範圍。
+    返回本次套用的版本列表。
+    """
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {MIGRATIONS_TABLE} (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """)
+    cursor.execute(f"SELECT version FROM {MIGRATIONS_TABLE}")
+    applied = {row[0] for row in cursor.fetchall()}
+
+    upgraded = []
+    for version, name, upgrade in MIGRATIONS:
+        if version in applied:
+            continue
+        upgrade(cursor)
+        cursor.execute(
+            f"INSERT INTO {MIGRATIONS_TABLE} (version, name) VALUES (?, ?)",
+            (version, name),
+        )
+        upgraded.append(version)
+    return upgraded
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    """命令列入口：將既有資料庫升級到最新版本"""
+    parser = argparse.ArgumentParser(description="升級對話資料庫結構")
+    parser.add_argument("database", help="SQLite 資料庫檔案路徑")
+    args = parser.parse_args(argv)
+
+    conn = sqlite3.connect(args.database)
+    try:
+        upgraded = migrate(conn)
+        conn.commit()
+        if upgraded:
+            print(f"已套用版本 {', '.join(str(version) for version in upgraded)}")
+        print(f"目前結構版本：{current_version(conn)}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Keyset（游標）分頁
+
+以 (timestamp, id) 作為排序鍵，將最後一筆記錄的排序鍵編碼成不透明的游標。
+下一頁直接從游標之後開始查詢，不需要像 OFFSET 一樣重新掃描被跳過的記錄，
+且在新記錄寫入時順序依然穩定。
+"""
+
+import base64
+import binascii
+import json
+from datetime import datetime, timezone
+from typing import List, Optional, Sequence, Tuple, Union
+
+# SQLite 單一語句的參數數量上限較保守的取值
+_MAX_PARAMS = 500
+
+# 依 (timestamp, id) 遞增排序時，取得游標之後的記錄
+KEYSET_AFTER_SQL = "(c.timestamp > ? OR (c.timestamp = ? AND c.id > ?))"
+# 依 (timestamp, id) 遞減排序時，取得游標之後的記錄
+KEYSET_BEFORE_SQL = "(c.timestamp < ? OR (c.timestamp = ? AND c.id < ?))"
+
+
+def format_timestamp(timestamp: Union[datetime, str]) -> str:
+    """將時間轉為與 SQLite 儲存格式一致、可直接比較的字串"""
+    if isinstance(timestamp, datetime):
+        return timestamp.strftime("%Y-%m-%d %H:%M:%S.%f")
+    return str(timestamp)
+
+
+def normalize_timestamp(value: Union[datetime, str, int, float]) -> str:
+    """
+    將 ISO 8601 字串、epoch 秒數或 datetime 轉為可與 timestamp 欄位比較的字串
+
+    帶時區的時間轉為 UTC（與 CURRENT_TIMESTAMP 相同）；沒有秒以下的部分時
+    不輸出小數，與秒精度及微秒精度的儲存格式比較時邊界都正確。
+    格式錯誤時拋出 ValueError。
+    """
+    if isinstance(value, bool):
+        raise ValueError(f"無效的時間: {value}")
+    try:
+        if isinstance(value, (int, float)):
+            parsed = datetime.fromtimestamp(value, timezone.utc)
+        elif isinstance(value, datetime):
+            parsed = value
+        else:
+            parsed = datetime.fromisoformat(value)
+    except (ValueError, TypeError, OverflowError, OSError):
+        raise ValueError(f"無效的時間: {value}") from None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed.isoformat(sep=" ")
+
+
+def encode_cursor(timestamp: Union[datetime, str], conversation_id: int) -> str:
+    """將排序鍵編碼為游標字串"""
+    payload = json.dumps(
+        [format_timestamp(timestamp), conversation_id], separators=(",", ":")
+    )
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    """解析游標字串，格式錯誤時拋出 ValueError"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        timestamp, conversation_id = json.loads(base64.urlsafe_b64decode(padded))
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        raise ValueError("無效的分頁游標") from None
+    if not isinstance(timestamp, str) or not isinstance(conversation_id, int):
+        raise ValueError("無效的分頁游標")
+    return timestamp, conversation_id
+
+
+def keyset_params(cursor: Tuple[str, int]) -> List:
+    """依 KEYSET_*_SQL 的參數順序展開排序鍵"""
+    timestamp, conversation_id = cursor
+    return [timestamp, timestamp, conversation_id]
+
+
+def page_ids_by_time(
+    conn,
+    ids: Sequence[int],
+    limit: Optional[int],
+    cursor: Optional[Tuple[str, int]] = None,
+) -> List[int]:
+    """
+    將候選記錄依 (timestamp, id) 由新到舊排序並套用游標，返回該頁的 ID
+
+    用於倒排索引等先得到候選 ID 集合的查詢（conn 為 DB-API 連接）。
+    """
+    db_cursor = conn.cursor()
+    keys: List[Tuple[str, int]] = []
+    for i in range(0, len(ids), _MAX_PARAMS):
+        chunk = list(ids[i : i + _MAX_PARAMS])
+        placeholders = ", ".join("?" * len(chunk))
+        db_cursor.execute(
+            f"SELECT timestamp, id FROM conversations WHERE id IN ({placeholders})",
+            chunk,
+        )
+        keys.extend((str(row[0]), row[1]) for row in db_cursor.fetchall())
+
+    keys.sort(reverse=True)
+    if cursor is not None:
+        keys = [key for key in keys if key < cursor]
+    return [conversation_id for _, conversation_id in keys[:limit]]
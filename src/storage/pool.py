@@ -0,0 +1,194 @@
+"""
+SQLite 連接池
+
+維護一組長期存活的 sqlite3 連接，建立時套用 WAL 日誌模式與效能相關的
+PRAGMA 設定，避免每次工具調用都重新開關資料庫檔案。
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+# 預設 PRAGMA 設定（依套用順序排列）
+DEFAULT_PRAGMAS: Dict[str, Any] = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -64000,  # 負值代表以 KiB 為單位，約 64 MB
+    "mmap_size": 268435456,  # 256 MB
+    "busy_timeout": 5000,  # 毫秒
+    "temp_store": "MEMORY",
+}
+
+# 可透過環境變數覆寫的 PRAGMA
+_PRAGMA_ENV_VARS = {
+    "journal_mode": "SQLITE_JOURNAL_MODE",
+    "synchronous": "SQLITE_SYNCHRONOUS",
+    "cache_size": "SQLITE_CACHE_SIZE",
+    "mmap_size": "SQLITE_MMAP_SIZE",
+    "busy_timeout": "SQLITE_BUSY_TIMEOUT",
+    "temp_store": "SQLITE_TEMP_STORE",
+}
+
+
+class PoolTimeoutError(Exception):
+    """在等待時間內無法取得可用連接"""
+
+
+def pragmas_from_env() -> Dict[str, Any]:
+    """讀取環境變數，返回合併後的 PRAGMA 設定"""
+    pragmas = dict(DEFAULT_PRAGMAS)
+    for name, env_var in _PRAGMA_ENV_VARS.items():
+        value = os.getenv(env_var)
+        if value:
+            pragmas[name] = value
+    return pragmas
+
+
+class SQLitePool:
+    """執行緒安全的 SQLite 連接池"""
+
+    def __init__(
+        self,
+        database_path: str,
+        pool_size: int = 5,
+        pragmas: Optional[Dict[str, Any]] = None,
+        cached_statements: int = 256,
+        timeout: float = 30.0,
+    ):
+        self.database_path = database_path
+        self.pool_size = max(1, pool_size)
+        self.pragmas = dict(DEFAULT_PRAGMAS if pragmas is None else pragmas)
+        self.cached_statements = cached_statements
+        self.timeout = timeout
+
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._closed = False
+
+        # 統計資訊
+        self._hits = 0
+        self._misses = 0
+        self._waits = 0
+        self._wait_time = 0.0
+
+    def _connect(self) -> sqlite3.Connection:
+        """建立新的連接並套用 PRAGMA"""
+        conn = sqlite3.connect(
+            self.database_path,
+            timeout=self.timeout,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+        )
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        """從連接池取得連接，池已滿時等待其他連接歸還"""
+        if self._closed:
+            raise RuntimeError("連接池已關閉")
+
+        try:
+            conn = self._idle.get_nowait()
+            with self._lock:
+                self._hits += 1
+            return conn
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_create = self._created < self.pool_size
+            if can_create:
+                self._created += 1
+                self._misses += 1
+
+        if can_create:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        started = time.perf_counter()
+        try:
+            conn = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise PoolTimeoutError(
+                f"等待 {self.timeout} 秒後仍無可用的資料庫連接"
+            ) from None
+        with self._lock:
+            self._waits += 1
+            self._wait_time += time.perf_counter() - started
+        return conn
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        """將連接歸還至連接池"""
+        if conn.in_transaction:
+            conn.rollback()
+
+        if self._closed:
+            conn.close()
+            with self._lock:
+                self._created -= 1
+            return
+
+        self._idle.put(conn)
+
+    def discard(self, conn: sqlite3.Connection) -> None:
+        """關閉已損壞的連接，不再放回連接池"""
+        try:
+            conn.close()
+        finally:
+            with self._lock:
+                self._created -= 1
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """借用一個連接，離開區塊時自動歸還"""
+        conn = self.acquire()
+        try:
+            yield conn
+        except sqlite3.ProgrammingError:
+            # 連接本身已不可用（例如被意外關閉），直接丟棄
+            self.discard(conn)
+            raise
+        except BaseException:
+            self.release(conn)
+            raise
+        else:
+            self.release(conn)
+
+    def close(self) -> None:
+        """關閉連接池中所有閒置的連接"""
+        self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        """返回連接池的使用統計"""
+        with self._lock:
+            requests = self._hits + self._misses + self._waits
+            return {
+                "pool_size": self.pool_size,
+                "connections": self._created,
+                "idle": self._idle.qsize(),
+                "hits": self._hits,
+                "misses": self._misses,
+                "waits": self._waits,
+                "hit_ratio": (self._hits + self._waits) / requests if requests else 0.0,
+                "avg_wait_ms": (
+                    (self._wait_time / self._waits * 1000) if self._waits else 0.0
+                ),
+            }
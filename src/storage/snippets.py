@@ -0,0 +1,179 @@
+"""
+搜尋結果片段與命中標示
+
+搜尋結果只需要命中位置附近的文字。本模組依命中位置切出前後各保留一段字元
+的片段，並以標記包住命中的文字，取代返回完整內容。
+
+命中位置來自索引而不是重新搜尋內容：
+
+- 中日韓查詢：search_cjk_index 已在內容中比對並返回查詢字串的起始位置。
+- 其他查詢：從 n-gram 倒排索引（同時記錄英文單字）讀取本頁記錄中各查詢詞
+  的位置，與 FTS5 查詢相同以前綴比對。
+- 索引無法回答、改用 LIKE 的查詢才直接在內容中尋找。
+"""
+
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from src.storage.cjk_index import TERMS_TABLE, decode_positions
+from src.storage.fts import contains_cjk
+
+# 命中位置前後保留的字元數、每筆記錄最多的片段數與預設標記
+DEFAULT_SNIPPET_CONTEXT = 40
+DEFAULT_MAX_SNIPPETS = 3
+HIGHLIGHT_START = "<mark>"
+HIGHLIGHT_END = "</mark>"
+ELLIPSIS = "…"
+
+# SQLite 單一語句的參數數量上限較保守的取值
+_MAX_PARAMS = 500
+
+# 與 build_match_query 相同的切詞方式
+_TERM_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+Span = Tuple[int, int]
+
+
+def phrase_spans(query: str, offsets: Dict[int, List[int]]) -> Dict[int, List[Span]]:
+    """將 search_cjk_index 返回的起始位置轉為 (起點, 終點)，長度即查詢字串的長度"""
+    length = len(query)
+    return {
+        conversation_id: [(start, start + length) for start in starts]
+        for conversation_id, starts in offsets.items()
+    }
+
+
+def term_spans(conn, query: str, ids: Sequence[int]) -> Dict[int, List[Span]]:
+    """
+    從倒排索引讀取 ids 中每個查詢詞（前綴比對）出現的位置
+
+    只讀取這幾筆記錄的索引列，並在 SQL 中以詞的範圍篩選，不讀取內容。
+    """
+    words = sorted({word.lower() for word in _TERM_PATTERN.findall(query)})
+    spans: Dict[int, List[Span]] = {}
+    if not words or not ids:
+        return spans
+    ids = list(ids)
+    ranges = " OR ".join("(term >= ? AND term < ?)" for _ in words)
+    bounds = [bound for word in words for bound in (word, word + "\U0010ffff")]
+    step = max(1, _MAX_PARAMS - len(bounds))
+    for i in range(0, len(ids), step):
+        chunk = ids[i : i + step]
+        placeholders = ", ".join("?" * len(chunk))
+        rows = conn.execute(
+            f"SELECT conversation_id, term, positions FROM {TERMS_TABLE} "
+            f"INDEXED BY ix_{TERMS_TABLE}_conversation_id "
+            f"WHERE conversation_id IN ({placeholders}) AND ({ranges})",
+            [*chunk, *bounds],
+        ).fetchall()
+        for conversation_id, term, positions in rows:
+            spans.setdefault(conversation_id, []).extend(
+                (start, start + len(term)) for start in decode_positions(positions)
+            )
+    return spans
+
+
+def text_spans(query: str, content: str) -> List[Span]:
+    """在內容中尋找查詢字串（不分大小寫），用於索引無法回答的查詢"""
+    needle = query.lower()
+    if not needle:
+        return []
+    haystack = content.lower()
+    if len(haystack) != len(content):
+        # 少數字元轉小寫後長度改變，位置無法對應，改為區分大小寫
+        needle, haystack = query, content
+    spans = []
+    start = haystack.find(needle)
+    while start != -1:
+        spans.append((start, start + len(needle)))
+        start = haystack.find(needle, start + len(needle))
+    return spans
+
+
+def match_spans(
+    conn,
+    query: str,
+    rows: Sequence[Tuple[int, str]],
+    offsets: Optional[Dict[int, List[int]]] = None,
+) -> Dict[int, List[Span]]:
+    """
+    返回每筆 (id, content) 中的命中位置
+
+    offsets 為中日韓查詢時 search_cjk_index 的結果；英文等查詢讀取倒排索引；
+    兩者皆不適用時才在內容中尋找。
+    """
+    if offsets is not None:
+        return phrase_spans(
+            query,
+            {
+                conversation_id: offsets.get(conversation_id, [])
+                for conversation_id, _ in rows
+            },
+        )
+    if not contains_cjk(query) and _TERM_PATTERN.search(query):
+        return term_spans(conn, query, [conversation_id for conversation_id, _ in rows])
+    return {
+        conversation_id: text_spans(query, content) for conversation_id, content in rows
+    }
+
+
+def build_snippets(
+    content: str,
+    spans: Sequence[Span],
+    context: int = DEFAULT_SNIPPET_CONTEXT,
+    max_snippets: int = DEFAULT_MAX_SNIPPETS,
+    start_mark: str = HIGHLIGHT_START,
+    end_mark: str = HIGHLIGHT_END,
+) -> List[Dict[str, object]]:
+    """
+    依命中位置切出片段，返回 [{"start", "end", "text"}]
+
+    相鄰或重疊的命中合併成同一個片段；沒有命中時返回內容開頭的片段。
+    start / end 為片段在原內容中的位置，片段未到內容頭尾時加上省略號。
+    """
+    context = max(0, context)
+    merged: List[List[int]] = []
+    for start, end in sorted(spans):
+        end = min(end, len(content))
+        if start >= end:
+            continue
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    if not merged:
+        end = min(len(content), 2 * context)
+        text = content[:end] + (ELLIPSIS if end < len(content) else "")
+        return [{"start": 0, "end": end, "text": text}]
+
+    # 依命中位置分組：前後文重疊的命中放在同一個片段
+    windows: List[Tuple[int, int, List[List[int]]]] = []
+    for start, end in merged:
+        window_start, window_end = max(0, start - context), min(
+            len(content), end + context
+        )
+        if windows and window_start <= windows[-1][1]:
+            previous_start, _, hits = windows[-1]
+            hits.append([start, end])
+            windows[-1] = (previous_start, window_end, hits)
+        else:
+            if len(windows) == max_snippets:
+                break
+            windows.append((window_start, window_end, [[start, end]]))
+
+    snippets = []
+    for window_start, window_end, hits in windows:
+        parts = [ELLIPSIS] if window_start > 0 else []
+        cursor = window_start
+        for start, end in hits:
+            parts.extend(
+                (content[cursor:start], start_mark, content[start:end], end_mark)
+            )
+            cursor = end
+        parts.append(content[cursor:window_end])
+        if window_end < len(content):
+            parts.append(ELLIPSIS)
+        snippets.append(
+            {"start": window_start, "end": window_end, "text": "".join(parts)}
+        )
+    return snippets
@@ -0,0 +1,205 @@
+"""
+群組提交寫入器
+
+由單一寫入任務從佇列中取出待寫入的對話記錄，累積成批次後在同一個交易中
+寫入並提交，以一次 commit 取代每筆訊息各自 commit。
+
+提交進行期間到達的記錄會累積在佇列中，下一次一併提交，因此並發寫入越多，
+每批自然越大，不需要刻意等待。max_wait_ms 預設為 0；設定後每批會再等待
+一段時間湊批，但每個寫入者同時只有一筆待寫入時，批次大小受限於寫入者數量，
+等待只會拉長每批的時間（見 examples/benchmark_group_commit.py）。
+"""
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+INSERT_CONVERSATION_SQL = (
+    "INSERT INTO conversations (role, content, metadata) VALUES (?, ?, ?)"
+)
+
+# 佇列中的項目：(寫入的欄位值, 等待結果的 future)
+_PendingRow = Tuple[Tuple[str, str, Optional[str]], asyncio.Future]
+
+
+class GroupCommitWriter:
+    """單一寫入者的群組提交佇列"""
+
+    def __init__(
+        self,
+        run_db: Callable[..., Awaitable[Any]],
+        max_batch_size: int = 256,
+        max_wait_ms: float = 0.0,
+        after_insert: Optional[Callable[[Any, List[Tuple[int, str]]], None]] = None,
+        after_commit: Optional[Callable[[Any, List[Tuple[int, str]]], None]] = None,
+    ):
+        """
+        參數:
+        - run_db: 在資料庫執行層中執行 func(conn) 的協程函數
+        - max_batch_size: 每次提交最多包含的記錄數
+        - max_wait_ms: 收到第一筆記錄後，最多再等待多久湊成批次；0 時只合併已在佇列中的記錄
+        - after_insert: 在同一個交易中以 (conn, [(id, content), ...]) 呼叫的掛鉤，
+          用於維護索引
+        - after_commit: 提交後以相同參數呼叫的掛鉤，用於維護資料庫以外的索引；
+          失敗只記錄在統計中，不影響已提交的寫入
+        """
+        self.run_db = run_db
+        self.after_insert = after_insert
+        self.after_commit = after_commit
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_ms = max(0.0, max_wait_ms)
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        # 統計資訊
+        self._batches = 0
+        self._rows = 0
+        self._failed_rows = 0
+        self._max_batch = 0
+        self._commit_time = 0.0
+        self._after_commit_errors = 0
+
+    def _ensure_started(self) -> asyncio.Queue:
+        """在目前的事件迴圈中啟動寫入任務"""
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._task = loop.create_task(self._run(self._queue))
+        return self._queue
+
+    async def insert(
+        self, role: str, content: str, metadata: Optional[str] = None
+    ) -> int:
+        """將一筆對話記錄加入佇列，所屬批次提交後返回其 ID"""
+        queue = self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        queue.put_nowait(((role, content, metadata), future))
+        return await future
+
+    async def _run(self, queue: asyncio.Queue) -> None:
+        """寫入任務主迴圈：收集批次並提交"""
+        loop = asyncio.get_running_loop()
+        while True:
+            first = await queue.get()
+            if first is None:
+                return
+            batch: List[_PendingRow] = [first]
+            stop = False
+
+            deadline = loop.time() + self.max_wait_ms / 1000
+            while len(batch) < self.max_batch_size:
+                try:
+                    item = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+
+            await self._commit(batch)
+            if stop:
+                return
+
+    async def _commit(self, batch: List[_PendingRow]) -> None:
+        """在單一交易中寫入整個批次，失敗時改為逐筆寫入以隔離錯誤"""
+        rows = [row for row, _ in batch]
+
+        def write_batch(conn):
+            ids = [conn.execute(INSERT_CONVERSATION_SQL, row).lastrowid for row in rows]
+            self._after_insert(conn, ids, rows)
+            conn.commit()
+            self._after_commit(conn, ids, rows)
+            return ids
+
+        started = time.perf_counter()
+        try:
+            ids = await self.run_db(write_batch)
+        except Exception:
+            await self._commit_individually(batch)
+            return
+        finally:
+            self._commit_time += time.perf_counter() - started
+
+        self._record_batch(len(batch))
+        for (_, future), conversation_id in zip(batch, ids):
+            if not future.done():
+                future.set_result(conversation_id)
+
+    async def _commit_individually(self, batch: List[_PendingRow]) -> None:
+        for row, future in batch:
+
+            def write_row(conn, row=row):
+                conversation_id = conn.execute(INSERT_CONVERSATION_SQL, row).lastrowid
+                self._after_insert(conn, [conversation_id], [row])
+                conn.commit()
+                self._after_commit(conn, [conversation_id], [row])
+                return conversation_id
+
+            try:
+                conversation_id = await self.run_db(write_row)
+            except Exception as e:
+                self._failed_rows += 1
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                self._record_batch(1)
+                if not future.done():
+                    future.set_result(conversation_id)
+
+    def _after_insert(self, conn, ids: List[int], rows) -> None:
+        if self.after_insert is not None:
+            inserted = [
+                (conversation_id, row[1]) for conversation_id, row in zip(ids, rows)
+            ]
+            self.after_insert(conn, inserted)
+
+    def _after_commit(self, conn, ids: List[int], rows) -> None:
+        if self.after_commit is not None:
+            inserted = [
+                (conversation_id, row[1]) for conversation_id, row in zip(ids, rows)
+            ]
+            try:
+                self.after_commit(conn, inserted)
+            except Exception:
+                # 記錄已提交，不能讓呼叫端重試而重複寫入
+                self._after_commit_errors += 1
+
+    def _record_batch(self, size: int) -> None:
+        self._batches += 1
+        self._rows += size
+        self._max_batch = max(self._max_batch, size)
+
+    async def stop(self) -> None:
+        """寫完佇列中剩餘的記錄後停止寫入任務"""
+        task, queue = self._task, self._queue
+        if task is None or task.done() or self._loop is not asyncio.get_running_loop():
+            return
+        queue.put_nowait(None)
+        await task
+
+    def stats(self) -> Dict[str, Any]:
+        """返回群組提交的統計資訊"""
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "pending": self._queue.qsize() if self._queue is not None else 0,
+            "batches": self._batches,
+            "rows": self._rows,
+            "failed_rows": self._failed_rows,
+            "avg_batch_size": self._rows / self._batches if self._batches else 0.0,
+            "max_batch": self._max_batch,
+            "avg_commit_ms": (
+                (self._commit_time / self._batches * 1000) if self._batches else 0.0
+            ),
+            "after_commit_errors": self._after_commit_errors,
+        }
@@ -0,0 +1,227 @@
+import os
+import sqlite3
+import threading
+
+import numpy as np
+import pytest
+
+from src.storage.ann import IVFPQIndex, build_index, kmeans, main as ann_main
+from src.storage.embeddings import EmbeddingStore
+
+
+def clustered_vectors(rows, dim=32, clusters=20, seed=0):
+    """產生分群的單位向量"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, rows)] + 0.3 * rng.standard_normal(
+        (rows, dim)
+    ).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def fill(store, vectors, start_id=1):
+    ids = list(range(start_id, start_id + len(vectors)))
+    store.add(ids, vectors)
+    store._last_id = ids[-1]
+    return ids
+
+
+@pytest.fixture
+def store(tmp_path):
+    embedding_store = EmbeddingStore(str(tmp_path / "conversations.vectors"), dim=32)
+    yield embedding_store
+    embedding_store.close()
+
+
+@pytest.fixture
+def index_path(tmp_path):
+    return str(tmp_path / "conversations.ann")
+
+
+def recall(results, expected):
+    found = [
+        len({i for i, _ in r} & {i for i, _ in e}) / len(e)
+        for r, e in zip(results, expected)
+    ]
+    return sum(found) / len(found)
+
+
+def test_kmeans_separates_clusters():
+    """測試 k-means 的中心落在各群附近"""
+    rng = np.random.default_rng(0)
+    data = np.concatenate(
+        [rng.normal(-5, 0.1, (50, 2)), rng.normal(5, 0.1, (50, 2))]
+    ).astype(np.float32)
+    centroids = kmeans(data, 2)
+    assert sorted(np.round(centroids[:, 0]).tolist()) == [-5.0, 5.0]
+
+
+def test_search_matches_exact_results(store, index_path):
+    """測試探查所有群時，重排後的結果與暴力搜尋幾乎相同"""
+    vectors = clustered_vectors(2000)
+    fill(store, vectors)
+    index = IVFPQIndex(store, index_path, rerank=32)
+    assert not index.trained
+    assert build_index(index, nlist=16, m=8) == 2000
+    assert index.trained and len(index) == 2000
+
+    queries = vectors[:20]
+    expected = store.search(queries, 10, min_score=-1.0)
+    results = index.search(queries, 10, min_score=-1.0, nprobe=16)
+    assert recall(results, expected) >= 0.95
+    assert results[0][0] == (1, pytest.approx(1.0))
+    index.close()
+
+
+def test_add_is_searchable_and_persisted(store, index_path):
+    """測試新增的向量寫入 delta，立即可搜尋，重新開啟後仍在索引中"""
+    fill(store, clustered_vectors(500))
+    index = IVFPQIndex(store, index_path)
+    build_index(index, nlist=8, m=8)
+
+    added = clustered_vectors(3, seed=1)
+    ids = fill(store, added, start_id=501)
+    index.add(ids, added)
+    assert index.stats()["delta_rows"] == 3
+    assert index.search(added[0], 1, nprobe=8)[0][0][0] == 501
+    index.close()
+
+    reopened = IVFPQIndex(store, index_path)
+    assert reopened.stats()["delta_rows"] == 3 and reopened.covered_id == 503
+    assert reopened.search(added[2], 1, nprobe=8)[0][0][0] == 503
+    reopened.close()
+
+
+def test_reopen_catches_up_from_store(store, index_path):
+    """測試索引關閉期間新增到向量儲存的向量，開啟時自動補上"""
+    fill(store, clustered_vectors(500))
+    index = IVFPQIndex(store, index_path)
+    build_index(index, nlist=8, m=8)
+    index.close()
+
+    added = clustered_vectors(2, seed=2)
+    fill(store, added, start_id=501)
+    reopened = IVFPQIndex(store, index_path)
+    assert len(reopened) == 502
+    assert reopened.search(added[1], 1, nprobe=8)[0][0][0] == 502
+    reopened.close()
+
+
+def test_compact_merges_delta_and_refresh_reloads(store, index_path):
+    """測試合併後 delta 清空；其他實例重建索引後 refresh 重新載入"""
+    fill(store, clustered_vectors(500))
+    index = IVFPQIndex(store, index_path)
+    build_index(index, nlist=8, m=8)
+    other = IVFPQIndex(store, index_path)
+
+    added = clustered_vectors(10, seed=3)
+    ids = fill(store, added, start_id=501)
+    index.add(ids, added, compact=False)
+    assert index.compact()
+    assert index.stats()["delta_rows"] == 0 and len(index) == 510
+    assert not os.path.exists(index_path + ".tmp")
+
+    assert other.refresh() and len(other) == 510
+    assert not other.refresh()
+    index.close()
+    other.close()
+
+
+def test_vectors_added_during_build_are_kept(store, index_path):
+    """測試重建期間寫入的向量（sync() 尚未更新 last_id）在替換後仍在索引中"""
+    fill(store, clustered_vectors(500))
+    index = IVFPQIndex(store, index_path)
+    build_index(index, nlist=8, m=8)
+
+    training, release = threading.Event(), threading.Event()
+    train = index.train
+
+    def slow_train(*args, **kwargs):
+        training.set()
+        release.wait(5)
+        return train(*args, **kwargs)
+
+    index.train = slow_train
+    builder = threading.Thread(
+        target=build_index, args=(index,), kwargs={"nlist": 8, "m": 8}
+    )
+    builder.start()
+    assert training.wait(5)
+    # 與 EmbeddingStore.sync 相同：先寫入向量再通知索引，last_id 之後才更新
+    added = clustered_vectors(5, seed=4)
+    ids = list(range(501, 506))
+    store.add(ids, added)
+    index.add(ids, added)
+    release.set()
+    builder.join()
+
+    assert store.last_id == 500
+    assert index.covered_id == 505 and len(index) == 505
+    assert index.search(added[4], 1, nprobe=8)[0][0][0] == 505
+    index.close()
+
+
+def test_add_compacts_in_background(store, index_path, monkeypatch):
+    """測試 delta 達到上限時 add() 不等待合併，合併在背景完成"""
+    monkeypatch.setattr("src.storage.ann.COMPACT_MIN_ROWS", 4)
+    monkeypatch.setattr("src.storage.ann.COMPACT_RATIO", 0.0)
+    fill(store, clustered_vectors(500))
+    index = IVFPQIndex(store, index_path)
+    build_index(index, nlist=8, m=8)
+
+    merging, release = threading.Event(), threading.Event()
+    build = index.build
+
+    def slow_build(*args):
+        merging.set()
+        release.wait(5)
+        build(*args)
+
+    index.build = slow_build
+    added = clustered_vectors(5, seed=5)
+    ids = fill(store, added, start_id=501)
+    index.add(ids, added)
+    assert merging.wait(5) and index.stats()["compacting"]
+    assert index.stats()["delta_rows"] == 5
+    release.set()
+    index.close()
+    assert index.stats()["compactions"] == 1 and index.stats()["delta_rows"] == 0
+    assert len(index) == 505
+
+
+def test_removed_vectors_are_not_returned(store, index_path):
+    """測試向量儲存中已清除的記錄不會出現在結果中"""
+    vectors = clustered_vectors(500)
+    fill(store, vectors)
+    index = IVFPQIndex(store, index_path)
+    build_index(index, nlist=8, m=8)
+    store.remove([1])
+    assert all(
+        conversation_id != 1
+        for conversation_id, _ in index.search(vectors[0], 5, nprobe=8)[0]
+    )
+    index.close()
+
+
+def test_main_builds_index(tmp_path, capsys):
+    """測試命令列補齊向量並建立索引"""
+    database = str(tmp_path / "conversations.db")
+    connection = sqlite3.connect(database)
+    connection.execute(
+        "CREATE TABLE conversations (id INTEGER PRIMARY KEY AUTOINCREMENT, role TEXT, content TEXT,"
+        " timestamp DATETIME DEFAULT CURRENT_TIMESTAMP, metadata TEXT)"
+    )
+    connection.executemany(
+        "INSERT INTO conversations (role, content) VALUES ('user', ?)",
+        [(f"message about topic {i % 7} number {i}",) for i in range(300)],
+    )
+    connection.commit()
+    connection.close()
+
+    ann_main([database, "--nlist", "4", "--m", "16"])
+    assert "300 個向量" in capsys.readouterr().out
+    store = EmbeddingStore(str(tmp_path / "conversations.vectors"))
+    index = IVFPQIndex(store, str(tmp_path / "conversations.ann"))
+    assert index.trained and index.nlist == 4 and len(index) == 300
+    index.close()
+    store.close()
@@ -0,0 +1,165 @@
+import json
+import sqlite3
+
+import pytest
+
+from src.storage.bulk import (
+    bulk_insert,
+    id_ranges,
+    insert_chunk,
+    parse_ndjson,
+    validate_conversations,
+)
+from src.storage.cjk_index import (
+    index_conversations,
+    install_cjk_index,
+    search_cjk_index,
+)
+from src.storage.fts import (
+    build_match_query,
+    build_search_sql,
+    install_fts,
+    search_params,
+)
+
+
+@pytest.fixture
+def conn():
+    """提供已安裝全文索引與 n-gram 索引的內存資料庫"""
+    connection = sqlite3.connect(":memory:")
+    connection.execute("""
+        CREATE TABLE conversations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            metadata TEXT
+        )
+    """)
+    install_fts(connection)
+    install_cjk_index(connection)
+    connection.commit()
+    yield connection
+    connection.close()
+
+
+def test_parse_ndjson_reports_bad_lines():
+    """測試 NDJSON 解析略過空行並標記無法解析的行"""
+    items, errors = parse_ndjson(
+        '{"role": "user", "content": "a"}\n\nnot json\n{"role": "x", "content": "b"}\n'
+    )
+    assert len(items) == 3
+    assert items[1] is None
+    assert [error["index"] for error in errors] == [1]
+
+
+def test_validate_conversations():
+    """測試逐筆驗證並保留原始位置"""
+    rows, errors = validate_conversations(
+        [
+            {"role": "user", "content": "ok", "metadata": {"session_id": "s"}},
+            {"role": "", "content": "no role"},
+            {"role": "user", "content": 1},
+            "not an object",
+            {"role": "assistant", "content": "raw", "metadata": "plain text"},
+            {"role": "user", "content": "bad metadata", "metadata": 5},
+            {"role": "user", "content": "bad time", "timestamp": "yesterday"},
+        ]
+    )
+    assert [row[0] for row in rows] == [0, 4]
+    assert rows[1][3] == {"raw": "plain text"}
+    assert [error["index"] for error in errors] == [1, 2, 3, 5, 6]
+
+
+def test_id_ranges():
+    """測試將 ID 壓縮為連續區間"""
+    assert id_ranges([1, 2, 3, 7, 8, 10]) == [[1, 3], [7, 8], [10, 10]]
+    assert id_ranges([]) == []
+
+
+def test_bulk_insert_assigns_ids_and_indexes(conn):
+    """測試分段寫入返回連續 ID，並同步維護全文與 n-gram 索引"""
+    conn.execute(
+        "INSERT INTO conversations (role, content) VALUES ('user', 'existing')"
+    )
+    conn.commit()
+    items = [{"role": "user", "content": f"bulk row {i} 批次匯入"} for i in range(25)]
+    rows, _ = validate_conversations(items)
+
+    ids, errors = bulk_insert(
+        conn, rows, chunk_size=10, after_insert=index_conversations
+    )
+    assert errors == []
+    assert id_ranges(ids) == [[2, 26]]
+    assert conn.execute(
+        "SELECT content FROM conversations WHERE id = 26"
+    ).fetchone() == ("bulk row 24 批次匯入",)
+
+    fts_rows = conn.execute(
+        build_search_sql(["id"]), search_params(build_match_query("bulk"), -1)
+    ).fetchall()
+    assert len(fts_rows) == 25
+    assert len(search_cjk_index(conn, "批次")) == 25
+
+
+def test_failed_chunk_is_rolled_back(conn):
+    """測試某段寫入失敗時只回滾該段，其他段照常寫入"""
+    conn.execute(
+        "CREATE TRIGGER reject BEFORE INSERT ON conversations WHEN new.content = 'boom' "
+        "BEGIN SELECT RAISE(ABORT, 'rejected'); END"
+    )
+    items = [
+        {"role": "user", "content": content} for content in ["a", "b", "boom", "c", "d"]
+    ]
+    rows, _ = validate_conversations(items)
+
+    ids, errors = bulk_insert(conn, rows, chunk_size=2)
+    assert len(ids) == 3
+    assert [error["index"] for error in errors] == [2, 3]
+    assert conn.execute("SELECT COUNT(*) FROM conversations").fetchone()[0] == 3
+
+
+def test_insert_chunk_with_timestamp_and_metadata_column():
+    """測試 SQLAlchemy 模型結構的欄位名稱與應用程式產生的時間"""
+    connection = sqlite3.connect(":memory:")
+    connection.execute(
+        "CREATE TABLE conversations (id INTEGER PRIMARY KEY, timestamp DATETIME, role TEXT, content TEXT, extra_metadata JSON)"
+    )
+    rows, _ = validate_conversations(
+        [{"role": "user", "content": "x", "extra_metadata": {"k": "v"}}]
+    )
+    ids = insert_chunk(
+        connection,
+        rows,
+        metadata_column="extra_metadata",
+        timestamp="2024-01-01 00:00:00.000000",
+    )
+    assert ids == [1]
+    row = connection.execute(
+        "SELECT timestamp, extra_metadata FROM conversations"
+    ).fetchone()
+    assert row[0] == "2024-01-01 00:00:00.000000"
+    assert json.loads(row[1]) == {"k": "v"}
+    connection.close()
+
+
+def test_insert_chunk_keeps_row_timestamps(conn):
+    """測試記錄自帶的時間優先，未提供時使用目前時間"""
+    rows, _ = validate_conversations(
+        [
+            {
+                "role": "user",
+                "content": "old",
+                "timestamp": "2023-05-01T08:00:00+08:00",
+            },
+            {"role": "user", "content": "epoch", "timestamp": 1700000000},
+            {"role": "user", "content": "now"},
+        ]
+    )
+    insert_chunk(conn, rows)
+    timestamps = [
+        row[0]
+        for row in conn.execute("SELECT timestamp FROM conversations ORDER BY id")
+    ]
+    assert timestamps[:2] == ["2023-05-01 00:00:00", "2023-11-14 22:13:20"]
+    assert timestamps[2] > "2024"
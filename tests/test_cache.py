@@ -0,0 +1,82 @@
+import sqlite3
+
+import pytest
+
+from src.storage.cache import DataVersionWatcher, QueryCache, parse_cache_sizes
+
+
+def test_parse_cache_sizes():
+    """測試個別工具的大小覆寫預設值，未知的工具或格式錯誤時拋出 ValueError"""
+    tools = ("search_conversations", "get_conversation")
+    assert parse_cache_sizes(tools, None, 100) == {
+        "search_conversations": 100,
+        "get_conversation": 100,
+    }
+    assert parse_cache_sizes(
+        tools, "get_conversation=0, search_conversations=5", 100
+    ) == {
+        "search_conversations": 5,
+        "get_conversation": 0,
+    }
+    for spec in ("unknown=1", "get_conversation", "get_conversation=x"):
+        with pytest.raises(ValueError):
+            parse_cache_sizes(tools, spec)
+
+
+def test_lru_eviction_and_disabled_tools():
+    """測試超過大小時淘汰最久未使用的結果；大小為 0 的工具不快取"""
+    cache = QueryCache({"search": 2, "recent": 0})
+    generation = cache.generation
+    cache.put("search", "a", [1], generation)
+    cache.put("search", "b", [2], generation)
+    assert cache.get("search", "a") == [1]
+    cache.put("search", "c", [3], generation)
+    assert cache.get("search", "b") is None
+    assert cache.get("search", "a") == [1] and cache.get("search", "c") == [3]
+
+    assert not cache.enabled("recent")
+    assert not cache.put("recent", "a", [1], generation)
+    assert cache.get("recent", "a") is None
+
+    stats = cache.stats()["tools"]["search"]
+    assert stats["size"] == 2 and stats["evictions"] == 1
+    assert stats["hits"] == 3 and stats["misses"] == 1
+    assert stats["hit_ratio"] == pytest.approx(0.75)
+
+
+def test_invalidate_clears_and_rejects_stale_results():
+    """測試寫入後快取清空，查詢期間有寫入時結果不會存入"""
+    cache = QueryCache({"search": 10})
+    cache.put("search", "a", [1], cache.generation)
+
+    generation = cache.generation
+    cache.invalidate()
+    assert cache.get("search", "a") is None
+    assert not cache.put("search", "a", [1], generation)
+    assert cache.put("search", "a", [2], cache.generation)
+    assert cache.get("search", "a") == [2]
+    assert cache.stats()["stale_puts"] == 1 and cache.stats()["generation"] == 1
+
+
+def test_writes_from_other_connections_invalidate(tmp_path):
+    """測試其他連接（例如其他工作程序或命令列工具）提交後，以 data_version 偵測並失效"""
+    path = str(tmp_path / "conversations.db")
+    other = sqlite3.connect(path)
+    other.execute("CREATE TABLE conversations (id INTEGER PRIMARY KEY)")
+    other.commit()
+
+    watcher = DataVersionWatcher(path)
+    cache = QueryCache({"search": 10}, version=watcher)
+    assert cache.put("search", "a", [1], cache.generation)
+    assert cache.get("search", "a") == [1]
+
+    generation = cache.generation
+    other.execute("INSERT INTO conversations DEFAULT VALUES")
+    other.commit()
+    assert cache.get("search", "a") is None
+    assert not cache.put("search", "a", [1], generation)
+    assert cache.stats()["external_invalidations"] == 1
+    assert cache.put("search", "a", [2], cache.generation)
+    assert cache.get("search", "a") == [2]
+    other.close()
+    watcher.close()
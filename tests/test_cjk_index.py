@@ -0,0 +1,234 @@
+import sqlite3
+
+import pytest
+
+from src.storage.cjk_index import (
+    index_conversations,
+    install_cjk_index,
+    main as cjk_index_main,
+    query_terms,
+    rebuild_cjk_index,
+    search_cjk_index,
+    tokenize,
+)
+
+
+def create_conversations_table(conn):
+    conn.execute("""
+        CREATE TABLE conversations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            metadata TEXT
+        )
+    """)
+
+
+def insert(conn, content):
+    conversation_id = conn.execute(
+        "INSERT INTO conversations (role, content) VALUES ('user', ?)", (content,)
+    ).lastrowid
+    index_conversations(conn, [(conversation_id, content)])
+    return conversation_id
+
+
+@pytest.fixture
+def conn():
+    """提供已安裝 n-gram 索引的內存資料庫"""
+    connection = sqlite3.connect(":memory:")
+    create_conversations_table(connection)
+    install_cjk_index(connection)
+    yield connection
+    connection.close()
+
+
+def test_tokenize_cjk_bigrams_and_identifiers():
+    """測試中文切成 bigram，識別字拆出子詞"""
+    assert tokenize("自動記錄 autoRecord") == [
+        ("自動", 0),
+        ("動記", 1),
+        ("記錄", 2),
+        ("autorecord", 5),
+        ("auto", 5),
+        ("record", 9),
+    ]
+    assert tokenize("好") == [("好", 0)]
+
+
+def test_query_terms_relative_offsets():
+    """測試查詢詞使用相對位置，結尾單字以前綴比對，開頭單字與單一中文字不查索引"""
+    assert query_terms("啟用 auto_record 功能") == [
+        ("啟用", 0, False),
+        ("auto_record", 3, False),
+        ("功能", 15, False),
+    ]
+    assert query_terms("測試test") == [("測試", 0, False), ("test", 2, True)]
+    assert query_terms("test測試") == [("測試", 0, False)]
+    assert query_terms("測") is None
+    assert query_terms("autoRecord") is None
+
+
+def test_substring_search(conn):
+    """測試中文子字串查詢與命中位置"""
+    first = insert(conn, "今天啟用了自動記錄功能")
+    insert(conn, "自動化部署與記錄檔")
+    third = insert(conn, "請確認自動記錄是否正常，自動記錄很重要")
+
+    assert search_cjk_index(conn, "自動記錄") == {first: [5], third: [3, 12]}
+
+
+def test_bigrams_must_be_adjacent(conn):
+    """測試詞彙需連續出現，只包含所有 bigram 但不相鄰時不算命中"""
+    insert(conn, "自動 動記 記錄")
+    assert search_cjk_index(conn, "自動記錄") == {}
+
+
+def test_mixed_latin_and_cjk(conn):
+    """測試中英混合查詢，英文不分大小寫並可比對識別字子詞"""
+    conversation_id = insert(conn, "呼叫 Auto_Record_Message 函數")
+    assert search_cjk_index(conn, "呼叫 auto") == {conversation_id: [0]}
+    assert search_cjk_index(conn, "Message 函數") == {conversation_id: [15]}
+    # 底線是 LIKE 的萬用字元，交由呼叫端的 LIKE 比對
+    assert search_cjk_index(conn, "record_message 函數") is None
+
+
+def test_gaps_in_query_must_match_content(conn):
+    """測試查詢中的空白與標點需與內容相同，結果與 LIKE 一致"""
+    insert(conn, "自動化記錄功能")
+    spaced = insert(conn, "自動 記錄")
+    assert search_cjk_index(conn, "自動 記錄") == {spaced: [0]}
+    assert search_cjk_index(conn, "自動，記錄") == {}
+
+
+def test_latin_words_at_query_edges_match_partially(conn):
+    """測試查詢頭尾的英文可以是內容中較長單字的一部分，ASCII 字母不分大小寫"""
+    tests = insert(conn, "測試tests通過")
+    latest = insert(conn, "執行LATEST測試")
+    assert search_cjk_index(conn, "測試test") == {tests: [0]}
+    assert search_cjk_index(conn, "test測試") == {latest: [4]}
+    assert search_cjk_index(conn, "tests通過") == {tests: [2]}
+    assert search_cjk_index(conn, "測試testing") == {}
+    assert search_cjk_index(conn, "測試%") is None
+
+
+def test_results_match_like(conn):
+    """測試索引搜尋與 LIKE 返回相同的記錄"""
+    for content in [
+        "自動化記錄功能",
+        "自動 記錄",
+        "測試tests通過",
+        "執行LATEST測試",
+        "呼叫 AutoRecord 函數",
+        "資料庫：備份與遷移",
+    ]:
+        insert(conn, content)
+    for query in [
+        "自動 記錄",
+        "測試test",
+        "test測試",
+        "autorecord 函數",
+        "資料庫：備份",
+        "資料庫",
+    ]:
+        expected = {
+            row[0]
+            for row in conn.execute(
+                "SELECT id FROM conversations WHERE content LIKE ?", (f"%{query}%",)
+            )
+        }
+        assert set(search_cjk_index(conn, query)) == expected, query
+
+
+def test_delete_removes_postings(conn):
+    """測試刪除記錄時同步移除索引"""
+    conversation_id = insert(conn, "刪除測試")
+    conn.execute("DELETE FROM conversations WHERE id = ?", (conversation_id,))
+    assert search_cjk_index(conn, "刪除") == {}
+    assert conn.execute("SELECT COUNT(*) FROM conversation_terms").fetchone()[0] == 0
+
+
+def test_update_drops_stale_postings(conn):
+    """測試修改內容時移除舊索引，重新建立索引後以新內容命中"""
+    conversation_id = insert(conn, "自動部署")
+    conn.execute(
+        "UPDATE conversations SET content = '手動部署' WHERE id = ?", (conversation_id,)
+    )
+    assert search_cjk_index(conn, "自動") == {}
+    index_conversations(conn, [(conversation_id, "手動部署")])
+    assert search_cjk_index(conn, "手動部署") == {conversation_id: [0]}
+
+
+def test_common_terms_are_probed_with_a_limit(conn, monkeypatch):
+    """測試常見詞只計數到上限，結果與完整計數相同"""
+    monkeypatch.setattr("src.storage.cjk_index.FREQUENCY_PROBE_LIMIT", 2)
+    ids = [insert(conn, "資料庫備份") for _ in range(5)]
+    target = insert(conn, "資料庫遷移")
+    assert search_cjk_index(conn, "資料庫遷移") == {target: [0]}
+    assert set(search_cjk_index(conn, "資料庫")) == {*ids, target}
+    assert search_cjk_index(conn, "不存在") == {}
+
+
+def test_rebuild_and_cli_backfill(tmp_path, capsys):
+    """測試為既有資料庫回填索引"""
+    db_path = str(tmp_path / "existing.db")
+    existing = sqlite3.connect(db_path)
+    create_conversations_table(existing)
+    existing.execute(
+        "INSERT INTO conversations (role, content) VALUES ('user', '歷史對話紀錄')"
+    )
+    existing.commit()
+    existing.close()
+
+    cjk_index_main([db_path])
+    assert "1" in capsys.readouterr().out
+
+    conn = sqlite3.connect(db_path)
+    assert search_cjk_index(conn, "對話") == {1: [2]}
+    assert rebuild_cjk_index(conn) == 1
+    assert search_cjk_index(conn, "對話") == {1: [2]}
+    conn.close()
+
+
+@pytest.mark.asyncio
+async def test_init_schema_backfills_database_created_before_index(tmp_path):
+    """測試 FastAPI 啟動時為升級前建立的資料庫回填索引並安裝刪除觸發器"""
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    from src.functions.conversations import search_conversations
+    from src.functions.server import query_cache
+    from src.main import init_schema
+
+    db_path = tmp_path / "legacy.db"
+    legacy = sqlite3.connect(db_path)
+    legacy.execute(
+        "CREATE TABLE conversations (id INTEGER NOT NULL PRIMARY KEY, timestamp DATETIME,"
+        " role VARCHAR NOT NULL, content VARCHAR NOT NULL, extra_metadata JSON)"
+    )
+    legacy.executemany(
+        "INSERT INTO conversations (timestamp, role, content) VALUES ('2024-01-01 00:00:00', 'user', ?)",
+        [("啟用自動記錄功能",), ("其他內容",)],
+    )
+    legacy.commit()
+    legacy.close()
+
+    engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+    try:
+        await init_schema(engine)
+        query_cache.invalidate()
+        async with async_sessionmaker(engine, expire_on_commit=False)() as db:
+            results = await search_conversations("自動記錄", db=db)
+        assert [result.id for result in results] == [1]
+    finally:
+        await engine.dispose()
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("DELETE FROM conversations WHERE id = 1")
+    assert search_cjk_index(conn, "自動記錄") == {}
+    assert (
+        conn.execute(
+            "SELECT COUNT(*) FROM conversation_terms WHERE conversation_id = 1"
+        ).fetchone()[0]
+        == 0
+    )
+    conn.close()
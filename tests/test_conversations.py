@@ -1,3 +1,4 @@
+import json
 import pytest
 from httpx import AsyncClient
 import pytest_asyncio
@@ -91,3 +92,202 @@ async def test_search_conversations(client):
     data = response.json()
     assert isinstance(data, list)
     assert len(data) == 0
+
+
+# 測試全文搜尋依相關度排序
+@pytest.mark.asyncio
+async def test_search_conversations_ranked(client):
+    client.post(
+        "/api/conversations/",
+        json={"role": "user", "content": "ranking check: sqlite"},
+    )
+    client.post(
+        "/api/conversations/",
+        json={"role": "assistant", "content": "ranking ranking ranking check"},
+    )
+
+    response = client.get("/api/search/", params={"query": "ranking"})
+    assert response.status_code == 200
+    data = response.json()
+    assert len(data) == 2
+    assert data[0]["content"] == "ranking ranking ranking check"
+
+
+# 測試以游標分頁瀏覽所有對話
+@pytest.mark.asyncio
+async def test_get_all_conversations_cursor(client):
+    for i in range(3):
+        client.post(
+            "/api/conversations/", json={"role": "user", "content": f"cursor page {i}"}
+        )
+
+    seen = []
+    response = client.get("/api/conversations/", params={"limit": 2})
+    while True:
+        assert response.status_code == 200
+        seen.extend(item["id"] for item in response.json())
+        next_cursor = response.headers.get("X-Next-Cursor")
+        if next_cursor is None:
+            break
+        # 分頁途中寫入的記錄排在最後，不會造成重複或遺漏
+        if len(seen) == 2:
+            client.post(
+                "/api/conversations/", json={"role": "user", "content": "late arrival"}
+            )
+        response = client.get(
+            "/api/conversations/", params={"limit": 2, "cursor": next_cursor}
+        )
+
+    assert len(seen) == len(set(seen))
+    assert seen == sorted(seen)
+    total = client.get("/api/conversations/", params={"limit": 1000}).json()
+    assert seen == [item["id"] for item in total]
+
+
+# 測試搜尋結果的游標分頁
+@pytest.mark.asyncio
+@pytest.mark.parametrize("keyword", ["keysetpaging", "游標分頁"])
+async def test_search_conversations_cursor(client, keyword):
+    ids = [
+        client.post(
+            "/api/conversations/",
+            json={"role": "user", "content": f"{keyword} 第{i}筆"},
+        ).json()["id"]
+        for i in range(3)
+    ]
+
+    response = client.get(
+        "/api/search/", params={"query": keyword, "limit": 2, "sort": "recent"}
+    )
+    assert [item["id"] for item in response.json()] == ids[:0:-1]
+    next_cursor = response.headers["X-Next-Cursor"]
+    assert next_cursor == response.json()[-1]["cursor"]
+
+    client.post(
+        "/api/conversations/", json={"role": "user", "content": f"{keyword} 新記錄"}
+    )
+    response = client.get(
+        "/api/search/", params={"query": keyword, "limit": 2, "cursor": next_cursor}
+    )
+    assert [item["id"] for item in response.json()] == ids[:1]
+    assert "X-Next-Cursor" not in response.headers
+
+
+# 測試無效的分頁游標
+@pytest.mark.asyncio
+async def test_invalid_cursor(client):
+    response = client.get("/api/conversations/", params={"cursor": "invalid"})
+    assert response.status_code == 400
+    response = client.get("/api/search/", params={"query": "x", "sort": "oldest"})
+    assert response.status_code == 400
+
+
+# 測試批次創建對話（JSON 陣列與 NDJSON）
+@pytest.mark.asyncio
+async def test_bulk_create_conversations(client):
+    response = client.post(
+        "/api/conversations/bulk",
+        json=[
+            {
+                "role": "user",
+                "content": "bulkimport first",
+                "extra_metadata": {"source": "export"},
+            },
+            {"role": "user"},
+            {"role": "assistant", "content": "bulkimport 匯入測試"},
+        ],
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["total"] == 3
+    assert data["inserted"] == 2
+    assert [error["index"] for error in data["errors"]] == [1]
+    first, last = data["id_ranges"][0]
+    assert last - first == 1
+
+    stored = client.get(f"/api/conversations/{first}").json()
+    assert stored["extra_metadata"] == {"source": "export"}
+    assert len(client.get("/api/search/", params={"query": "bulkimport"}).json()) == 2
+    assert len(client.get("/api/search/", params={"query": "匯入測試"}).json()) == 1
+
+    ndjson = '{"role": "user", "content": "ndjson row"}\n{broken\n'
+    response = client.post(
+        "/api/conversations/bulk",
+        content=ndjson.encode(),
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    data = response.json()
+    assert data["inserted"] == 1
+    assert [error["index"] for error in data["errors"]] == [1]
+
+    response = client.post("/api/conversations/bulk", json={"role": "user"})
+    assert response.status_code == 400
+
+
+# 測試串流匯出對話
+@pytest.mark.asyncio
+async def test_export_conversations(client):
+    client.post(
+        "/api/conversations/",
+        json={
+            "role": "user",
+            "content": "export row",
+            "extra_metadata": {"session_id": "export-session"},
+        },
+    )
+
+    response = client.get("/api/conversations/export")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert len(rows) == len(
+        client.get("/api/conversations/", params={"limit": 10000}).json()
+    )
+
+    response = client.get(
+        "/api/conversations/export",
+        params={"session_id": "export-session", "gzip": True},
+    )
+    assert response.headers["content-encoding"] == "gzip"
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["content"] for row in rows] == ["export row"]
+    assert rows[0]["extra_metadata"] == {"session_id": "export-session"}
+
+    response = client.get("/api/conversations/export", params={"since": "2999-01-01"})
+    assert response.text == ""
+    assert (
+        client.get("/api/conversations/export", params={"since": "bad"}).status_code
+        == 400
+    )
+
+
+# 測試重複讀取由查詢快取返回，寫入後失效
+@pytest.mark.asyncio
+async def test_query_cache_invalidated_by_writes(client):
+    from src.functions.server import query_cache
+
+    conversation_id = client.post(
+        "/api/conversations/", json={"role": "user", "content": "cachecheck first"}
+    ).json()["id"]
+    before = query_cache.stats()["tools"]
+    for _ in range(2):
+        assert (
+            client.get(f"/api/conversations/{conversation_id}").json()["id"]
+            == conversation_id
+        )
+        assert (
+            len(client.get("/api/search/", params={"query": "cachecheck"}).json()) == 1
+        )
+    after = query_cache.stats()["tools"]
+    assert after["get_conversation"]["hits"] == before["get_conversation"]["hits"] + 1
+    assert (
+        after["search_conversations"]["hits"]
+        == before["search_conversations"]["hits"] + 1
+    )
+
+    client.post(
+        "/api/conversations/bulk",
+        json=[{"role": "user", "content": "cachecheck second"}],
+    )
+    assert len(client.get("/api/search/", params={"query": "cachecheck"}).json()) == 2
+    assert "query_cache" in client.get("/api/metrics/").json()
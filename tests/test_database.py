@@ -72,3 +72,35 @@ async def test_retrieve_conversation(db_session):
     assert retrieved_conversation.role == "assistant"
     assert retrieved_conversation.content == "測試回應"
     assert retrieved_conversation.extra_metadata == {"response_time": 0.5}
+
+
+def test_engine_options_for_file_database():
+    """測試檔案型資料庫會套用連接池大小設定，內存資料庫則不會"""
+    from src.database import engine_options
+
+    file_options = engine_options("sqlite+aiosqlite:///data/app.db")
+    assert file_options["pool_pre_ping"] is True
+    assert "pool_size" in file_options
+    assert "max_overflow" in file_options
+
+    memory_options = engine_options("sqlite+aiosqlite:///:memory:")
+    assert "pool_size" not in memory_options
+
+
+@pytest.mark.asyncio
+async def test_tool_sessions_share_engine():
+    """測試工具調用的會話與 HTTP 端點共用同一個引擎，並記錄連接池指標"""
+    from src.database import get_pool_stats
+    from src.functions.conversations import get_db_session
+
+    checkouts_before = get_pool_stats()["checkouts"]
+    first = await get_db_session()
+    second = await get_db_session()
+    try:
+        assert first.bind is engine
+        assert second.bind is engine
+    finally:
+        await first.close()
+        await second.close()
+
+    assert get_pool_stats()["checkouts"] - checkouts_before == 2
@@ -0,0 +1,75 @@
+import asyncio
+import time
+
+import pytest
+
+from src.storage import DatabaseExecutor, SQLitePool
+
+
+@pytest.fixture
+def executor(tmp_path):
+    """提供使用暫存資料庫的執行層"""
+    pool = SQLitePool(str(tmp_path / "executor.db"), pool_size=4)
+    db_executor = DatabaseExecutor(pool.connection, max_workers=4)
+    yield db_executor
+    db_executor.shutdown()
+    pool.close()
+
+
+@pytest.mark.asyncio
+async def test_run_returns_query_result(executor):
+    """測試查詢在執行緒池中執行並返回結果"""
+    result = await executor.run(lambda conn: conn.execute("SELECT 1 + 1").fetchone()[0])
+    assert result == 2
+    assert executor.stats()["completed"] == 1
+
+
+@pytest.mark.asyncio
+async def test_slow_queries_do_not_block_event_loop(executor):
+    """測試慢查詢執行期間事件迴圈仍可處理其他工作，且多個查詢可並行"""
+
+    def slow_query(conn):
+        time.sleep(0.2)
+        return conn.execute("SELECT 1").fetchone()[0]
+
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    ticker_task = asyncio.create_task(ticker())
+    started = time.perf_counter()
+    results = await asyncio.gather(*(executor.run(slow_query) for _ in range(4)))
+    elapsed = time.perf_counter() - started
+    ticker_task.cancel()
+
+    assert results == [1, 1, 1, 1]
+    assert elapsed < 0.6  # 四個 0.2 秒的查詢應重疊執行
+    assert ticks >= 5
+
+
+@pytest.mark.asyncio
+async def test_queue_depth_and_failures_tracked(tmp_path):
+    """測試排隊深度與失敗次數的統計"""
+    pool = SQLitePool(str(tmp_path / "queue.db"), pool_size=1)
+    executor = DatabaseExecutor(pool.connection, max_workers=1)
+
+    def slow_query(conn):
+        time.sleep(0.05)
+
+    await asyncio.gather(*(executor.run(slow_query) for _ in range(3)))
+    with pytest.raises(Exception):
+        await executor.run(lambda conn: conn.execute("SELECT * FROM missing_table"))
+
+    stats = executor.stats()
+    assert stats["max_queue_depth"] >= 2
+    assert stats["queue_depth"] == 0
+    assert stats["completed"] == 3
+    assert stats["failed"] == 1
+    assert stats["max_wait_ms"] > 0
+
+    executor.shutdown()
+    pool.close()
@@ -0,0 +1,91 @@
+import sqlite3
+import threading
+
+import pytest
+
+from src.storage import PoolTimeoutError, SQLitePool
+
+
+@pytest.fixture
+def pool(tmp_path):
+    """提供使用暫存資料庫的連接池"""
+    test_pool = SQLitePool(str(tmp_path / "pool.db"), pool_size=2, timeout=0.2)
+    yield test_pool
+    test_pool.close()
+
+
+def test_pragmas_applied(pool):
+    """測試連接建立時會套用 WAL 與其他 PRAGMA"""
+    with pool.connection() as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+        assert conn.execute("PRAGMA busy_timeout").fetchone()[0] == 5000
+
+
+def test_connections_are_reused(pool):
+    """測試連接歸還後會被重複使用並計入命中次數"""
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        pass
+
+    assert first is second
+    stats = pool.stats()
+    assert stats["misses"] == 1
+    assert stats["hits"] == 1
+    assert stats["connections"] == 1
+
+
+def test_uncommitted_work_rolled_back_on_release(pool):
+    """測試歸還連接時會回滾未提交的交易"""
+    with pool.connection() as conn:
+        conn.execute("CREATE TABLE items (value TEXT)")
+        conn.commit()
+
+    with pytest.raises(ValueError):
+        with pool.connection() as conn:
+            conn.execute("INSERT INTO items VALUES ('lost')")
+            raise ValueError("中斷交易")
+
+    with pool.connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM items").fetchone()[0] == 0
+
+
+def test_pool_timeout_when_exhausted(pool):
+    """測試連接池用盡時等待逾時"""
+    first = pool.acquire()
+    second = pool.acquire()
+    try:
+        with pytest.raises(PoolTimeoutError):
+            pool.acquire()
+    finally:
+        pool.release(first)
+        pool.release(second)
+
+
+def test_waiter_receives_released_connection(pool):
+    """測試等待中的請求會取得其他執行緒歸還的連接"""
+    pool.timeout = 2
+    held = [pool.acquire(), pool.acquire()]
+
+    timer = threading.Timer(0.05, pool.release, args=(held[0],))
+    timer.start()
+    conn = pool.acquire()
+    timer.join()
+
+    assert conn is held[0]
+    assert pool.stats()["waits"] == 1
+    pool.release(conn)
+    pool.release(held[1])
+
+
+def test_close_closes_idle_connections(pool):
+    """測試關閉連接池後閒置連接一併關閉"""
+    with pool.connection() as conn:
+        pass
+    pool.close()
+
+    with pytest.raises(sqlite3.ProgrammingError):
+        conn.execute("SELECT 1")
+    with pytest.raises(RuntimeError):
+        pool.acquire()
@@ -0,0 +1,136 @@
+import asyncio
+
+import pytest
+
+from src.storage import DatabaseExecutor, GroupCommitWriter, SQLitePool
+
+
+@pytest.fixture
+def database(tmp_path):
+    """提供已建立 conversations 資料表的連接池與執行層"""
+    pool = SQLitePool(str(tmp_path / "writer.db"), pool_size=2)
+    with pool.connection() as conn:
+        conn.execute("""
+            CREATE TABLE conversations (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                metadata TEXT
+            )
+        """)
+        conn.commit()
+    executor = DatabaseExecutor(pool.connection, max_workers=2)
+    yield pool, executor
+    executor.shutdown()
+    pool.close()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_inserts_are_grouped(database):
+    """測試並發寫入會合併成少數批次，且每個呼叫者取得自己的 ID"""
+    pool, executor = database
+    writer = GroupCommitWriter(executor.run, max_batch_size=50, max_wait_ms=20)
+
+    ids = await asyncio.gather(
+        *(writer.insert("user", f"訊息 {i}", None) for i in range(100))
+    )
+    await writer.stop()
+
+    assert len(set(ids)) == 100
+    stats = writer.stats()
+    assert stats["rows"] == 100
+    assert stats["batches"] < 10
+    assert stats["max_batch"] <= 50
+
+    with pool.connection() as conn:
+        rows = dict(conn.execute("SELECT id, content FROM conversations").fetchall())
+    assert [rows[i] for i in ids] == [f"訊息 {i}" for i in range(100)]
+
+
+@pytest.mark.asyncio
+async def test_failed_row_does_not_fail_batch(database):
+    """測試批次中單筆失敗時，其餘記錄仍能寫入"""
+    pool, executor = database
+    writer = GroupCommitWriter(executor.run, max_batch_size=10, max_wait_ms=20)
+
+    results = await asyncio.gather(
+        writer.insert("user", "正常訊息 1"),
+        writer.insert("user", None),  # 違反 NOT NULL 限制
+        writer.insert("assistant", "正常訊息 2"),
+        return_exceptions=True,
+    )
+    await writer.stop()
+
+    assert isinstance(results[0], int)
+    assert isinstance(results[1], Exception)
+    assert isinstance(results[2], int)
+    assert writer.stats()["failed_rows"] == 1
+
+    with pool.connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM conversations").fetchone()[0] == 2
+
+
+@pytest.mark.asyncio
+async def test_stop_flushes_pending_rows(database):
+    """測試停止寫入器時會先寫完佇列中的記錄"""
+    pool, executor = database
+    writer = GroupCommitWriter(executor.run, max_batch_size=5, max_wait_ms=50)
+
+    pending = [
+        asyncio.create_task(writer.insert("user", f"待寫入 {i}")) for i in range(12)
+    ]
+    await asyncio.sleep(0)
+    await writer.stop()
+
+    assert all(task.done() for task in pending)
+    with pool.connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM conversations").fetchone()[0] == 12
+
+
+@pytest.mark.asyncio
+async def test_after_commit_hook_failure_keeps_rows(database):
+    """測試提交後掛鉤收到新記錄，失敗時只計入統計，寫入仍成功"""
+    pool, executor = database
+    received = []
+
+    def after_commit(conn, inserted):
+        received.extend(inserted)
+        raise RuntimeError("索引失敗")
+
+    writer = GroupCommitWriter(
+        executor.run, max_batch_size=10, max_wait_ms=20, after_commit=after_commit
+    )
+    ids = await asyncio.gather(
+        writer.insert("user", "第一筆"), writer.insert("user", "第二筆")
+    )
+    await writer.stop()
+
+    assert sorted(received) == sorted(zip(ids, ["第一筆", "第二筆"]))
+    assert writer.stats()["after_commit_errors"] >= 1
+    with pool.connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM conversations").fetchone()[0] == 2
+
+
+@pytest.mark.asyncio
+async def test_concurrent_writers_share_commits(database):
+    """測試並發寫入者的記錄合併成少數幾次提交（吞吐量量測見 examples/benchmark_group_commit.py）"""
+    _, executor = database
+    writers, rows = 32, 1000
+    writer = GroupCommitWriter(executor.run)
+
+    async def insert_rows(index):
+        return [
+            await writer.insert("user", f"訊息 {i}", None)
+            for i in range(index, rows, writers)
+        ]
+
+    ids = await asyncio.gather(*(insert_rows(index) for index in range(writers)))
+    await writer.stop()
+
+    assert sorted(i for chunk in ids for i in chunk) == list(range(1, rows + 1))
+    stats = writer.stats()
+    assert stats["rows"] == rows
+    # 每筆各自提交需要 rows 次提交；寫入者同時排隊時每次提交包含多筆
+    assert stats["batches"] <= rows // 4
+    assert stats["avg_batch_size"] >= 4
@@ -0,0 +1,138 @@
+import sqlite3
+
+import numpy as np
+import pytest
+
+from src.storage.embeddings import (
+    HEADER_SIZE,
+    EmbeddingStore,
+    embed_texts,
+    main as embeddings_main,
+)
+
+
+def create_conversations_table(conn):
+    conn.execute("""
+        CREATE TABLE conversations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            metadata TEXT
+        )
+    """)
+
+
+def insert(conn, *contents):
+    conn.executemany(
+        "INSERT INTO conversations (role, content) VALUES ('user', ?)",
+        [(content,) for content in contents],
+    )
+
+
+@pytest.fixture
+def conn():
+    connection = sqlite3.connect(":memory:")
+    create_conversations_table(connection)
+    insert(
+        connection,
+        "How do I migrate the SQLite database schema?",
+        "The weather is sunny today",
+        "資料庫遷移的步驟",
+        "Add an index for faster search queries",
+    )
+    yield connection
+    connection.close()
+
+
+@pytest.fixture
+def store(tmp_path):
+    embedding_store = EmbeddingStore(str(tmp_path / "conversations.vectors"), dim=128)
+    yield embedding_store
+    embedding_store.close()
+
+
+def test_embed_texts_returns_unit_vectors():
+    """測試向量為單位向量、結果穩定，沒有特徵的內容為零向量"""
+    vectors = embed_texts(
+        ["database migration", "database migration", "the and of"], dim=64
+    )
+    assert vectors.dtype == np.float32 and vectors.shape == (3, 64)
+    assert np.isclose(np.linalg.norm(vectors[0]), 1.0)
+    assert np.array_equal(vectors[0], vectors[1])
+    assert not vectors[2].any()
+
+
+def test_sync_embeds_new_conversations_incrementally(conn, store):
+    """測試 sync 只處理 last_id 之後的記錄"""
+    assert store.sync(conn) == 4
+    assert store.last_id == 4
+    assert store.sync(conn) == 0
+    insert(conn, "another message")
+    assert store.sync(conn) == 1
+    assert store.last_id == 5
+
+
+def test_search_ranks_related_conversations(conn, store):
+    """測試英文詞形變化與中文子字串都能找到相關對話"""
+    store.sync(conn)
+    assert store.search_text("database migration", 1)[0][0] == 1
+    assert store.search_text("資料庫", 1)[0][0] == 3
+    assert store.search_text("sunny weather", 1)[0][0] == 2
+
+
+def test_search_batches_queries_across_chunks(tmp_path):
+    """測試分段計算時，多個查詢的結果與逐一完整計算相同"""
+    store = EmbeddingStore(str(tmp_path / "random.vectors"), dim=16)
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((500, 16)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    ids = list(range(1, 501))
+    store.add(ids, vectors)
+    store._last_id = 500
+
+    queries = vectors[:3]
+    results = store.search(queries, k=5, min_score=-1.0, chunk_rows=64)
+    for query, result in zip(queries, results):
+        expected = np.argsort(-(vectors @ query))[:5] + 1
+        assert [conversation_id for conversation_id, _ in result] == list(expected)
+    assert results[0][0] == (1, pytest.approx(1.0))
+    store.close()
+
+
+def test_remove_and_reopen(conn, store, tmp_path):
+    """測試刪除的記錄不再出現，重新開啟後保留向量與 last_id；維度不同時清空"""
+    store.sync(conn)
+    store.remove([2])
+    assert all(
+        conversation_id != 2
+        for conversation_id, _ in store.search_text("sunny weather", 4)
+    )
+    store.close()
+
+    path = str(tmp_path / "conversations.vectors")
+    reopened = EmbeddingStore(path, dim=128)
+    assert reopened.last_id == 4
+    assert reopened.search_text("database migration", 1)[0][0] == 1
+    reopened.close()
+
+    resized = EmbeddingStore(path, dim=64)
+    assert resized.last_id == 0 and resized.stats()["file_bytes"] == HEADER_SIZE
+    assert resized.sync(conn) == 4
+    resized.close()
+
+
+def test_main_rebuilds_store(tmp_path, capsys):
+    """測試命令列重建向量"""
+    database = str(tmp_path / "conversations.db")
+    connection = sqlite3.connect(database)
+    create_conversations_table(connection)
+    insert(connection, "first", "second")
+    connection.commit()
+    connection.close()
+
+    embeddings_main([database])
+    assert "2 筆對話" in capsys.readouterr().out
+    store = EmbeddingStore(str(tmp_path / "conversations.vectors"))
+    assert store.last_id == 2
+    store.close()
@@ -0,0 +1,660 @@
+import asyncio
+import json
+import sqlite3
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from src.database import Base
+from src.events import (
+    EventDispatcher,
+    ReplayBuffer,
+    SQLiteEventBus,
+    Subscriber,
+    build_filters,
+    create_event_bus,
+    defer_event,
+    encode_frame,
+    frame_event_id,
+    pack_frames,
+)
+from src.functions import server
+from src.functions.conversations import create_conversation
+from src.functions.server import (
+    EventManager,
+    event_dispatcher,
+    event_manager,
+    parse_last_event_id,
+    replay_from_database,
+    replayed_ids,
+    skip_replayed,
+)
+from src.models import Conversation, ConversationTerm
+
+
+def payload(message):
+    return json.loads(message.split(b"data: ", 1)[1])
+
+
+@pytest.mark.asyncio
+async def test_drop_oldest_keeps_latest_messages():
+    """測試緩衝區已滿時丟棄最舊的訊息"""
+    subscriber = Subscriber(maxsize=2, policy="drop_oldest")
+    for i in range(5):
+        assert subscriber.offer(f"data: {i}\n\n".encode())
+    assert subscriber.depth == 2
+    assert subscriber.dropped == 3
+    assert [await subscriber.get(), await subscriber.get()] == [
+        b"data: 3\n\n",
+        b"data: 4\n\n",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_disconnect_policy_closes_subscriber():
+    """測試 disconnect 策略中斷客戶端並喚醒等待中的讀取"""
+    subscriber = Subscriber(maxsize=1, policy="disconnect")
+    assert subscriber.offer(b"data: 1\n\n")
+    assert not subscriber.offer(b"data: 2\n\n")
+    assert subscriber.closed
+    assert await subscriber.get() is None
+
+
+@pytest.mark.asyncio
+async def test_coalesce_policy_replaces_backlog_with_notice():
+    """測試 coalesce 策略將積壓的訊息合併為一則通知"""
+    subscriber = Subscriber(maxsize=2, policy="coalesce")
+    for i in range(5):
+        subscriber.offer(f"data: {i}\n\n".encode())
+    assert payload(await subscriber.get()) == {"type": "events_coalesced", "skipped": 4}
+    assert await subscriber.get() == b"data: 4\n\n"
+    assert subscriber.coalesced == 4
+
+
+@pytest.mark.asyncio
+async def test_broadcast_shares_one_encoded_frame():
+    """測試廣播只編碼一次，所有客戶端收到同一個位元組物件"""
+    manager = EventManager()
+    subscribers = [await manager.register() for _ in range(10000)]
+    await manager.broadcast({"type": "ping"})
+    frames = {id(await subscriber.get()) for subscriber in subscribers}
+    assert len(frames) == 1
+
+    # 成員變動後下一次廣播才重建快照
+    snapshot = manager.clients
+    await manager.unregister(subscribers[0])
+    await manager.unregister(subscribers[0])
+    assert manager.clients is not snapshot
+    assert len(manager.clients) == 9999
+    assert manager.clients is manager.clients
+
+
+def test_build_filters():
+    """測試訂閱參數轉為篩選條件"""
+    assert build_filters("s1", "user", ["topic:db"]) == {
+        ("metadata.session_id", "s1"),
+        ("role", "user"),
+        ("metadata.topic", "db"),
+    }
+    with pytest.raises(ValueError):
+        build_filters(metadata=["no-separator"])
+
+
+@pytest.mark.asyncio
+async def test_filtered_subscribers_only_receive_matching_events():
+    """測試依 session、角色與 metadata 篩選，只把事件放入符合的客戶端"""
+    manager = EventManager()
+    everything = await manager.register()
+    session = await manager.register(filters=build_filters(session_id="s1"))
+    session_user = await manager.register(
+        filters=build_filters(session_id="s1", role="user")
+    )
+    priority = await manager.register(
+        filters=build_filters(metadata=["priority:1", "urgent:true"])
+    )
+    other = await manager.register(filters=build_filters(session_id="s2"))
+
+    def conversation(role, metadata):
+        return {
+            "type": "new_conversation",
+            "data": {"role": role, "extra_metadata": metadata},
+        }
+
+    await manager.broadcast(conversation("assistant", {"session_id": "s1"}))
+    await manager.broadcast(
+        conversation("user", {"session_id": "s1", "priority": 1, "urgent": True})
+    )
+    await manager.broadcast({"type": "notice"})
+
+    assert [
+        everything.depth,
+        session.depth,
+        session_user.depth,
+        priority.depth,
+        other.depth,
+    ] == [3, 3, 2, 2, 1]
+    # 每則對話事件只放入有興趣的客戶端
+    assert manager.stats()["deliveries"] == 2 + 4 + 5
+
+    await manager.unregister(session_user)
+    assert manager.stats()["filter_index_keys"] == 3
+
+
+def test_events_rejects_invalid_metadata_filter(client):
+    """測試 SSE 端點拒絕格式錯誤的 metadata 篩選"""
+    response = client.get("/api/events/", params={"metadata": "missing-separator"})
+    assert response.status_code == 400
+
+
+def test_unknown_policy_rejected():
+    """測試未知的溢位策略"""
+    with pytest.raises(ValueError):
+        Subscriber(policy="block")
+
+
+@pytest.mark.asyncio
+async def test_broadcast_does_not_wait_for_slow_clients():
+    """測試廣播不會因未讀取的客戶端而阻塞，並移除被中斷的客戶端"""
+    manager = EventManager(queue_size=3, policy="drop_oldest")
+    stalled = await manager.register()
+    dropped = await manager.register("disconnect")
+    reader = await manager.register()
+
+    for i in range(10):
+        await asyncio.wait_for(manager.broadcast({"n": i}), timeout=1)
+        assert payload(await reader.get()) == {"n": i}
+
+    assert stalled.depth == 3
+    assert dropped.closed
+    assert dropped not in manager.clients
+
+    stats = manager.stats()
+    assert stats["clients"] == 2
+    assert stats["disconnected_slow_clients"] == 1
+    assert stats["slowest_clients"][0]["id"] == stalled.id
+    assert stats["slowest_clients"][0]["dropped"] == 7
+
+
+def test_events_rejects_unknown_overflow(client):
+    """測試 SSE 端點拒絕未知的溢位策略"""
+    response = client.get("/api/events/", params={"overflow": "block"})
+    assert response.status_code == 400
+
+
+def test_metrics_include_events(client):
+    """測試 metrics 端點包含 SSE 指標"""
+    response = client.get("/api/metrics/")
+    assert response.status_code == 200
+    assert {"clients", "dropped", "max_lag_ms"} <= set(response.json()["events"])
+
+
+@pytest.mark.asyncio
+async def test_dispatcher_delivers_in_order_and_drains_on_stop():
+    """測試派送器依序派送，停止前送完佇列中的事件"""
+    received = []
+
+    async def handler(event):
+        await asyncio.sleep(0)
+        received.append(event["n"])
+
+    dispatcher = EventDispatcher(handler, max_backlog=100)
+    for i in range(5):
+        dispatcher.submit({"n": i})
+    assert dispatcher.stats()["backlog"] == 5
+    await dispatcher.stop()
+    assert received == [0, 1, 2, 3, 4]
+    assert dispatcher.stats()["dispatched"] == 5
+
+
+@pytest.mark.asyncio
+async def test_dispatcher_drops_oldest_over_backlog_limit():
+    """測試積壓超過上限時丟棄最舊的事件，處理失敗不影響後續事件"""
+    received = []
+
+    async def handler(event):
+        if event["n"] == 2:
+            raise RuntimeError("boom")
+        received.append(event["n"])
+
+    dispatcher = EventDispatcher(handler, max_backlog=3)
+    for i in range(5):
+        dispatcher.submit({"n": i})
+    await dispatcher.stop()
+    assert received == [3, 4]
+    stats = dispatcher.stats()
+    assert (stats["dropped"], stats["failed"], stats["max_backlog_seen"]) == (2, 1, 3)
+
+
+@pytest_asyncio.fixture
+async def session_factory():
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:", poolclass=StaticPool)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield async_sessionmaker(engine, expire_on_commit=False)
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_create_conversation_broadcasts_after_commit(session_factory):
+    """測試建立對話以 INSERT ... RETURNING 返回記錄，提交後才由背景派送器廣播"""
+    subscriber = await event_manager.register()
+    try:
+        async with session_factory() as db:
+            conversation = await create_conversation(
+                {"role": "user", "content": "派送測試"}, db
+            )
+            assert conversation.id is not None and conversation.timestamp is not None
+            frame = await asyncio.wait_for(subscriber.get(), timeout=1)
+            assert frame_event_id(frame) == conversation.id
+            message = payload(frame)
+            assert message["type"] == "new_conversation"
+            assert message["data"]["id"] == conversation.id
+            assert (
+                await db.execute(select(ConversationTerm))
+            ).scalars().first() is not None
+
+            # 回滾的交易不會產生事件
+            defer_event(db.sync_session, {"type": "rolled_back"})
+            await db.rollback()
+            await event_dispatcher.stop()
+            assert subscriber.depth == 0
+    finally:
+        await event_manager.unregister(subscriber)
+
+
+def conversation_event(id, session_id):
+    return {
+        "id": id,
+        "type": "new_conversation",
+        "data": {
+            "id": id,
+            "role": "user",
+            "extra_metadata": {"session_id": session_id},
+        },
+    }
+
+
+@pytest.mark.asyncio
+async def test_broadcast_adds_event_id_and_keeps_history():
+    """測試帶有 ID 的事件加上 SSE id 欄位並保留在重播緩衝區"""
+    manager = EventManager(replay_size=3)
+    subscriber = await manager.register()
+    for i in range(1, 6):
+        await manager.broadcast(conversation_event(i, f"s{i % 2}"))
+    await manager.broadcast({"type": "notice"})
+
+    message = await subscriber.get()
+    assert message.startswith(b"id: 1\ndata: ")
+    assert frame_event_id(message) == 1
+    assert payload(message)["data"]["id"] == 1
+    assert (manager.history.oldest, manager.history.latest) == (3, 5)
+
+
+def test_replay_buffer_since_and_covers():
+    """測試重播緩衝區依 ID 與篩選條件補送，並判斷是否涵蓋斷線期間"""
+    history = ReplayBuffer(size=3)
+    for i in range(1, 6):
+        history.append(
+            i, f"{i}".encode(), build_filters(session_id=f"s{i % 2}", role="user")
+        )
+    assert not history.append(4, b"late", None)
+
+    assert history.covers(2) and history.covers(5)
+    assert not history.covers(1)
+    assert history.since(3) == [b"4", b"5"]
+    assert history.since(2, build_filters(session_id="s1")) == [b"3", b"5"]
+    assert history.since(5) == []
+    stats = history.stats()
+    assert (stats["duplicates"], stats["hits"], stats["replayed"]) == (1, 3, 4)
+
+
+def test_replay_buffer_keeps_late_smaller_ids():
+    """測試晚到的較小 ID 依到達順序保留，從它之前或之後的事件重連都不會遺漏"""
+    history = ReplayBuffer(size=3)
+    for event_id in (9, 11, 10):
+        assert history.append(event_id, f"{event_id}".encode(), None)
+    assert history.stats()["out_of_order"] == 1
+    assert history.since(9) == [b"11", b"10"]
+    # 收到 11 後斷線，10 才到達
+    assert history.since(11) == [b"10"]
+    assert history.since(10) == []
+    # 不在緩衝區中的 ID 依大小補送
+    assert history.covers(8) and history.since(8) == [b"9", b"11", b"10"]
+
+    # 移出緩衝區的 ID 以下改從資料庫補齊，緩衝區只返回更大的 ID
+    history.append(12, b"12", None)
+    assert history.floor == 9 and not history.covers(7)
+    assert history.since(7) == [b"11", b"10", b"12"]
+
+
+def test_skip_replayed_keeps_late_live_events():
+    """測試只略過已補送的 ID，晚到的較小 ID 仍送出"""
+    replayed = replayed_ids([encode_frame({"id": 9}, 9), encode_frame({"id": 11}, 11)])
+    live = [
+        encode_frame({"id": 11}, 11),
+        encode_frame({"id": 10}, 10),
+        encode_frame({"id": 12}, 12),
+    ]
+    kept, remaining = skip_replayed(live, replayed)
+    assert [frame_event_id(message) for message in kept] == [10, 12]
+    assert remaining is None
+    assert replayed_ids([encode_frame({"type": "notice"})]) is None
+
+
+def test_parse_last_event_id():
+    """測試解析 Last-Event-ID 標頭"""
+    assert parse_last_event_id(" 42 ") == 42
+    assert parse_last_event_id("abc") is None
+    assert parse_last_event_id(None) is None
+
+
+@pytest.mark.asyncio
+async def test_replay_from_database_fills_gap_before_buffer(session_factory):
+    """測試早於重播緩衝區的事件從資料庫補送，超過上限時附上 replay_truncated"""
+    async with session_factory() as db:
+        db.add_all(
+            Conversation(
+                role="user",
+                content=f"第 {i} 則",
+                extra_metadata={"session_id": f"s{i % 2}"},
+            )
+            for i in range(1, 11)
+        )
+        await db.commit()
+
+    messages = await replay_from_database(2, 6, session_factory=session_factory)
+    assert [frame_event_id(message) for message in messages] == [3, 4, 5]
+    assert payload(messages[0])["data"]["content"] == "第 3 則"
+
+    messages = await replay_from_database(
+        0, filters=build_filters(session_id="s0"), session_factory=session_factory
+    )
+    assert [frame_event_id(message) for message in messages] == [2, 4, 6, 8, 10]
+
+    messages = await replay_from_database(0, limit=4, session_factory=session_factory)
+    assert [frame_event_id(message) for message in messages[:-1]] == [1, 2, 3, 4]
+    assert payload(messages[-1]) == {"type": "replay_truncated", "last_event_id": 4}
+
+
+class FakeRequest:
+    """只提供 SSE 端點需要的部分；第 n 次檢查後視為已斷線"""
+
+    def __init__(self, disconnect_after=1):
+        self.headers = {}
+        self.checks = 0
+        self.disconnect_after = disconnect_after
+
+    async def is_disconnected(self):
+        self.checks += 1
+        return self.checks > self.disconnect_after
+
+
+async def open_stream(request, **params):
+    """直接呼叫 SSE 端點，未指定的查詢參數使用預設值"""
+    defaults = dict(
+        overflow=None,
+        session_id=None,
+        role=None,
+        metadata=[],
+        last_event_id=None,
+        batch_ms=None,
+        batch_max=server.SSE_BATCH_MAX_EVENTS,
+    )
+    response = await server.events(request, **{**defaults, **params})
+    return response.body_iterator
+
+
+@pytest.mark.asyncio
+async def test_idle_stream_sends_heartbeats_and_detects_disconnect(monkeypatch):
+    """測試沒有事件時送出心跳註解，並在斷線後移除客戶端"""
+    monkeypatch.setattr(server, "SSE_HEARTBEAT_INTERVAL", 0.01)
+    monkeypatch.setattr(server, "event_manager", EventManager())
+    frames = [
+        frame async for frame in await open_stream(FakeRequest(disconnect_after=2))
+    ]
+    assert frames == [
+        server.CONNECTED_FRAME,
+        server.HEARTBEAT_FRAME,
+        server.HEARTBEAT_FRAME,
+    ]
+    assert server.event_manager.stats()["heartbeats"] == 2
+    assert len(server.event_manager.clients) == 0
+
+
+def test_events_rejects_connections_over_limit(client, monkeypatch):
+    """測試連線數已達上限時返回 503 與 Retry-After"""
+    monkeypatch.setattr(server, "event_manager", EventManager(max_connections=1))
+    server.event_manager._registry.add(Subscriber())
+    response = client.get("/api/events/")
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "5"
+    assert server.event_manager.stats()["rejected_connections"] == 1
+
+
+@pytest.mark.asyncio
+async def test_paused_clients_count_until_unregistered():
+    """測試暫停接收的客戶端不收事件但計入連線數，unregister 後才釋放"""
+    manager = EventManager(max_connections=1)
+    client = await manager.register()
+    await manager.pause(client)
+    await manager.broadcast({"type": "system", "message": "hi"})
+    assert client.depth == 0
+    assert manager.at_capacity and manager.clients == ()
+
+    await manager.update_filters(client, frozenset())
+    assert manager.connections == 1 and manager.clients == (client,)
+    await manager.pause(client)
+    await manager.unregister(client)
+    assert manager.connections == 0 and not manager.at_capacity
+
+
+@pytest.mark.asyncio
+async def test_reaper_removes_clients_stuck_in_send():
+    """測試送出卡住的客戶端被回收，閒置等待中的客戶端不受影響"""
+    manager = EventManager(send_timeout=0.05)
+    idle = await manager.register()
+    stuck = await manager.register()
+    await manager.broadcast({"type": "notice"})
+    # idle 讀完後回到 get() 等待；stuck 取出訊息後一直沒有回到 get()，相當於送出被卡住
+    assert await idle.get() is not None
+    with pytest.raises(asyncio.TimeoutError):
+        await idle.get(timeout=0.01)
+    assert await stuck.get() is not None
+    await asyncio.sleep(0.2)
+
+    assert stuck.closed and stuck not in manager.clients
+    assert idle in manager.clients
+    stats = manager.stats()
+    assert (stats["clients"], stats["peak_clients"], stats["reaped_clients"]) == (
+        1,
+        2,
+        1,
+    )
+    await manager.unregister(idle)
+
+
+@pytest.mark.asyncio
+async def test_sqlite_event_bus_forwards_between_workers(tmp_path):
+    """測試兩個程序共用變更記錄時，各自發布的事件都送到對方，自己的事件不會重複"""
+    received = {"a": [], "b": []}
+
+    def handler(name):
+        async def broadcast(event):
+            received[name].append(event["n"])
+
+        return broadcast
+
+    path = str(tmp_path / "events.db")
+    worker_a = SQLiteEventBus(handler("a"), path, poll_interval=0.005, batch_size=4)
+    worker_b = SQLiteEventBus(handler("b"), path, poll_interval=0.005, batch_size=4)
+    await worker_a.start()
+    await worker_b.start()
+    try:
+        for i in range(10):
+            await worker_a.publish({"n": i})
+        await worker_b.publish({"n": 100})
+        for _ in range(200):
+            if len(received["b"]) == 11 and received["a"][-1:] == [100]:
+                break
+            await asyncio.sleep(0.01)
+        # 自己發布的事件立即送出，其他程序的事件依發布順序送達
+        assert received["a"] == list(range(10)) + [100]
+        assert sorted(received["b"]) == list(range(10)) + [100]
+        assert [n for n in received["b"] if n != 100] == list(range(10))
+        assert (worker_b.stats()["received"], worker_b.stats()["missed"]) == (10, 0)
+    finally:
+        await worker_a.stop()
+        await worker_b.stop()
+
+
+@pytest.mark.asyncio
+async def test_sqlite_event_bus_interleaved_ids_are_replayed(tmp_path):
+    """測試兩個程序交錯寫入時，轉送晚到的較小 ID 在重連時仍會補送"""
+    path = str(tmp_path / "events.db")
+    manager_a, manager_b = EventManager(), EventManager()
+    worker_a = SQLiteEventBus(manager_a.broadcast, path, poll_interval=0.005)
+    worker_b = SQLiteEventBus(manager_b.broadcast, path, poll_interval=0.005)
+    await worker_a.start()
+    await worker_b.start()
+    try:
+        await worker_a.publish(conversation_event(9, "s1"))
+        await worker_a.publish(conversation_event(11, "s1"))
+        await worker_b.publish(conversation_event(10, "s0"))
+        for _ in range(200):
+            if len(manager_a.history) == 3 and len(manager_b.history) == 3:
+                break
+            await asyncio.sleep(0.01)
+        assert manager_a.history.stats()["out_of_order"] == 1
+        assert [frame_event_id(message) for message in manager_a.history.since(9)] == [
+            11,
+            10,
+        ]
+        assert [frame_event_id(message) for message in manager_a.history.since(11)] == [
+            10
+        ]
+        # worker_b 先廣播自己的 10，再收到轉送的 9 與 11
+        assert [frame_event_id(message) for message in manager_b.history.since(10)] == [
+            9,
+            11,
+        ]
+    finally:
+        await worker_a.stop()
+        await worker_b.stop()
+
+
+@pytest.mark.asyncio
+async def test_sqlite_event_bus_trims_old_records(tmp_path):
+    """測試變更記錄只保留最近 retain 筆左右"""
+
+    async def broadcast(event):
+        pass
+
+    path = str(tmp_path / "events.db")
+    bus = SQLiteEventBus(broadcast, path, batch_size=4, retain=8)
+    for i in range(30):
+        await bus.publish({"n": i})
+    await bus.stop()
+    assert bus.stats()["written"] == 30
+    conn = sqlite3.connect(path)
+    assert conn.execute("SELECT COUNT(*) FROM event_log").fetchone()[0] <= 8 + 4
+    conn.close()
+
+
+@pytest.mark.asyncio
+async def test_sqlite_event_bus_stop_waits_for_inflight_read(tmp_path):
+    """測試停止時等待執行緒中的讀取結束後才關閉連接"""
+    import threading
+
+    async def broadcast(event):
+        pass
+
+    bus = SQLiteEventBus(broadcast, str(tmp_path / "events.db"), poll_interval=0.001)
+    await bus.start()
+    reading, release = threading.Event(), threading.Event()
+    read = bus._read
+
+    def slow_read(after):
+        reading.set()
+        release.wait(5)
+        return read(after)
+
+    bus._read = slow_read
+    await asyncio.to_thread(reading.wait, 5)
+    stopping = asyncio.ensure_future(bus.stop())
+    await asyncio.sleep(0.05)
+    assert not stopping.done()
+    release.set()
+    await stopping
+    assert bus._reader is None
+
+
+def test_create_event_bus_rejects_unknown_backend():
+    """測試未知的匯流排名稱"""
+    with pytest.raises(ValueError):
+        create_event_bus("redis", None)
+
+
+def test_pack_frames_merges_consecutive_conversation_events():
+    """測試連續的對話事件合併成一則 new_conversations 訊息，通知維持原樣且順序不變"""
+    frames = [encode_frame(conversation_event(i, "s1"), i) for i in (1, 2, 3)]
+    notice = encode_frame({"type": "notice"})
+    frames += [notice, encode_frame(conversation_event(4, "s1"), 4)]
+
+    packed, count = pack_frames(frames)
+    messages = packed.split(b"\n\n")[:-1]
+    assert count == len(messages) == 3
+    assert frame_event_id(messages[0] + b"\n\n") == 3
+    batch = payload(messages[0])
+    assert batch["type"] == "new_conversations"
+    assert [event["id"] for event in batch["events"]] == [1, 2, 3]
+    assert messages[1] + b"\n\n" == notice
+    assert messages[2] + b"\n\n" == frames[-1]
+
+
+@pytest.mark.asyncio
+async def test_get_more_collects_within_window():
+    """測試在時間窗內收集已緩衝與稍後到達的訊息，逾時或達到上限即返回"""
+    subscriber = Subscriber()
+    subscriber.offer(b"data: 1\n\n")
+    asyncio.get_running_loop().call_later(0.01, subscriber.offer, b"data: 2\n\n")
+    assert await subscriber.get_more(10, 0.1) == [b"data: 1\n\n", b"data: 2\n\n"]
+
+    for i in range(5):
+        subscriber.offer(b"data: %d\n\n" % i)
+    assert len(await subscriber.get_more(3, 1)) == 3
+    assert len(await subscriber.get_more(10, 0)) == 2
+
+
+@pytest.mark.asyncio
+async def test_stream_batches_events_when_requested(monkeypatch):
+    """測試以 batch_ms 訂閱時，時間窗內的對話事件合併成一則訊息送出"""
+    monkeypatch.setattr(server, "event_manager", EventManager())
+    stream = await open_stream(
+        FakeRequest(disconnect_after=0), batch_ms=20, batch_max=100
+    )
+    assert await stream.__anext__() == server.CONNECTED_FRAME
+    pending = asyncio.ensure_future(stream.__anext__())
+    await asyncio.sleep(0)
+    for i in range(1, 6):
+        await server.event_manager.broadcast(conversation_event(i, "s1"))
+    frame = await asyncio.wait_for(pending, timeout=1)
+    await stream.aclose()
+
+    assert frame_event_id(frame) == 5
+    assert [event["id"] for event in payload(frame)["events"]] == [1, 2, 3, 4, 5]
+    batching = server.event_manager.stats()["batching"]
+    assert (batching["messages"], batching["frames"], batching["frames_saved"]) == (
+        5,
+        1,
+        4,
+    )
+    assert batching["max_wait_ms"] >= 15
+
+
+def test_events_rejects_invalid_batch_window(client):
+    """測試 SSE 端點拒絕超出範圍的 batch_ms"""
+    response = client.get("/api/events/", params={"batch_ms": 0})
+    assert response.status_code == 400
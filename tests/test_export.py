@@ -0,0 +1,95 @@
+import gzip
+import json
+import sqlite3
+
+import pytest
+
+from src.storage.export import (
+    build_export_sql,
+    gzip_chunks,
+    iter_export,
+    main as export_main,
+)
+from src.storage.migrations import migrate
+from src.storage.pagination import normalize_timestamp
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """提供含不同時間與會話記錄的資料庫檔案"""
+    path = str(tmp_path / "export.db")
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE conversations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            metadata TEXT
+        )
+    """)
+    conn.executemany(
+        "INSERT INTO conversations (role, content, timestamp, metadata) VALUES (?, ?, ?, ?)",
+        [
+            ("user", "第一行\n第二行", "2024-01-01 00:00:00", '{"session_id": "a"}'),
+            ("assistant", "reply", "2024-01-02 00:00:00", '{"session_id": "b"}'),
+            ("user", "later", "2024-01-03 00:00:00", "not json"),
+        ],
+    )
+    conn.commit()
+    conn.close()
+    return path
+
+
+def read_lines(data: bytes):
+    return [json.loads(line) for line in data.decode().splitlines()]
+
+
+def test_iter_export_in_chunks(db_path):
+    """測試分段產生 NDJSON，內容中的換行與非 JSON 的 metadata 都能正確輸出"""
+    conn = sqlite3.connect(db_path)
+    chunks = list(iter_export(conn, build_export_sql(), {}, chunk_size=2))
+    conn.close()
+
+    assert len(chunks) == 2
+    rows = read_lines(b"".join(chunks))
+    assert [row["id"] for row in rows] == [1, 2, 3]
+    assert rows[0]["content"] == "第一行\n第二行"
+    assert rows[0]["metadata"] == {"session_id": "a"}
+    assert rows[2]["metadata"] == "not json"
+
+
+@pytest.mark.parametrize("migrated", [False, True])
+def test_filters(db_path, migrated):
+    """測試時間範圍與會話篩選（遷移前後皆可使用）"""
+    conn = sqlite3.connect(db_path)
+    if migrated:
+        migrate(conn)
+
+    sql = build_export_sql(since=True, until=True, session_column=migrated)
+    params = {
+        "since": normalize_timestamp("2024-01-02"),
+        "until": normalize_timestamp("2024-01-03"),
+    }
+    assert [
+        row["id"] for row in read_lines(b"".join(iter_export(conn, sql, params)))
+    ] == [2]
+
+    sql = build_export_sql(session_id=True, session_column=migrated)
+    rows = read_lines(b"".join(iter_export(conn, sql, {"session_id": "a"})))
+    assert [row["id"] for row in rows] == [1]
+    conn.close()
+
+
+def test_gzip_chunks():
+    """測試串流壓縮結果可被 gzip 解壓"""
+    assert gzip.decompress(b"".join(gzip_chunks([b"a\n", b"b\n"]))) == b"a\nb\n"
+
+
+def test_cli_export(db_path, tmp_path, capsys):
+    """測試命令列匯出並以 gzip 壓縮"""
+    output = str(tmp_path / "out.ndjson.gz")
+    export_main([db_path, "-o", output, "--gzip", "--since", "2024-01-02"])
+    assert "2" in capsys.readouterr().out
+    with gzip.open(output) as f:
+        assert [row["id"] for row in read_lines(f.read())] == [2, 3]
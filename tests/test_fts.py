@@ -0,0 +1,124 @@
+import sqlite3
+
+import pytest
+
+from src.storage.fts import (
+    build_match_query,
+    build_search_sql,
+    contains_cjk,
+    install_fts,
+    main as fts_main,
+    search_params,
+)
+
+COLUMNS = ["id", "role", "content", "timestamp", "metadata"]
+
+
+def create_conversations_table(conn):
+    conn.execute("""
+        CREATE TABLE conversations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            metadata TEXT
+        )
+    """)
+
+
+@pytest.fixture
+def conn():
+    """提供已安裝全文索引的內存資料庫"""
+    connection = sqlite3.connect(":memory:")
+    create_conversations_table(connection)
+    install_fts(connection)
+    yield connection
+    connection.close()
+
+
+def search(conn, query, limit=10, recency_boost=0.0):
+    sql = build_search_sql(COLUMNS, recency_boost=bool(recency_boost))
+    params = search_params(build_match_query(query), limit, recency_boost)
+    return conn.execute(sql, params).fetchall()
+
+
+def test_build_match_query_quotes_terms():
+    """測試使用者輸入的運算子與引號會被轉義"""
+    assert build_match_query('fix "bug" OR -crash') == '"fix"* "bug"* "OR"* "crash"*'
+    assert build_match_query("  ...  ") is None
+
+
+def test_contains_cjk():
+    """測試中日韓文字偵測"""
+    assert contains_cjk("自動記錄")
+    assert contains_cjk("MCP 伺服器")
+    assert not contains_cjk("database migration")
+
+
+def test_search_ranks_by_bm25(conn):
+    """測試搜尋結果依 BM25 相關度排序"""
+    conn.executemany(
+        "INSERT INTO conversations (role, content) VALUES (?, ?)",
+        [
+            ("user", "the sqlite database is slow"),
+            ("assistant", "database database database tuning for sqlite"),
+            ("user", "unrelated message about lunch"),
+        ],
+    )
+
+    rows = search(conn, "database")
+    assert [row[0] for row in rows] == [2, 1]
+
+
+def test_prefix_match(conn):
+    """測試詞的前綴比對"""
+    conn.execute(
+        "INSERT INTO conversations (role, content) VALUES ('user', 'recording sessions')"
+    )
+    assert len(search(conn, "record")) == 1
+
+
+def test_triggers_keep_index_in_sync(conn):
+    """測試新增、更新與刪除會同步到全文索引"""
+    conn.execute(
+        "INSERT INTO conversations (role, content) VALUES ('user', 'alpha message')"
+    )
+    assert len(search(conn, "alpha")) == 1
+
+    conn.execute("UPDATE conversations SET content = 'beta message' WHERE id = 1")
+    assert search(conn, "alpha") == []
+    assert len(search(conn, "beta")) == 1
+
+    conn.execute("DELETE FROM conversations WHERE id = 1")
+    assert search(conn, "beta") == []
+
+
+def test_recency_boost_prefers_newer_rows(conn):
+    """測試新近度加權讓較新的記錄排在前面"""
+    conn.execute(
+        "INSERT INTO conversations (role, content, timestamp) VALUES ('user', 'deploy plan', '2020-01-01 00:00:00')"
+    )
+    conn.execute(
+        "INSERT INTO conversations (role, content) VALUES ('user', 'deploy plan')"
+    )
+
+    assert search(conn, "deploy", recency_boost=5.0)[0][0] == 2
+
+
+def test_backfill_existing_database(tmp_path, capsys):
+    """測試命令列工具可為既有資料庫回填索引"""
+    db_path = str(tmp_path / "existing.db")
+    existing = sqlite3.connect(db_path)
+    create_conversations_table(existing)
+    existing.execute(
+        "INSERT INTO conversations (role, content) VALUES ('user', 'legacy history row')"
+    )
+    existing.commit()
+    existing.close()
+
+    fts_main([db_path])
+    assert "1" in capsys.readouterr().out
+
+    conn = sqlite3.connect(db_path)
+    assert len(search(conn, "legacy")) == 1
+    conn.close()
@@ -0,0 +1,77 @@
+import json
+import sqlite3
+
+import pytest
+
+from src.storage.cjk_index import index_conversations, install_cjk_index
+from src.storage.fts import install_fts
+from src.storage.hybrid import (
+    build_filter_sql,
+    filter_ids,
+    lexical_ranking,
+    reciprocal_rank_fusion,
+)
+from src.storage.migrations import CONVERSATIONS_SCHEMA, migrate
+
+ROWS = [
+    ("user", "How do I migrate the database schema?", "a", "2024-01-01 10:00:00"),
+    ("assistant", "Run the database migration script", "a", "2024-01-02 10:00:00"),
+    ("user", "database database database tuning", "b", "2024-02-01 10:00:00"),
+    ("user", "資料庫遷移與資料庫備份", "b", "2024-02-02 10:00:00"),
+    ("assistant", "資料庫遷移的步驟", "a", "2024-03-01 10:00:00"),
+]
+
+
+@pytest.fixture
+def conn():
+    """提供已遷移並建立索引的內存資料庫"""
+    connection = sqlite3.connect(":memory:")
+    connection.execute(CONVERSATIONS_SCHEMA)
+    migrate(connection)
+    install_fts(connection)
+    install_cjk_index(connection)
+    for role, content, session_id, timestamp in ROWS:
+        cursor = connection.execute(
+            "INSERT INTO conversations (role, content, metadata, timestamp) VALUES (?, ?, ?, ?)",
+            (role, content, json.dumps({"session_id": session_id}), timestamp),
+        )
+        index_conversations(connection, [(cursor.lastrowid, content)])
+    yield connection
+    connection.close()
+
+
+def test_reciprocal_rank_fusion_prefers_items_in_both_rankings():
+    """測試兩個排名都有的項目排在前面，分數相同時較新者在前"""
+    fused = reciprocal_rank_fusion([[1, 2, 3], [3, 4]], k=60)
+    assert [conversation_id for conversation_id, _ in fused] == [3, 1, 4, 2]
+    assert fused[0][1] == pytest.approx(1 / 63 + 1 / 61)
+    assert reciprocal_rank_fusion([[], []]) == []
+
+
+def test_build_filter_sql_normalizes_timestamps():
+    """測試篩選條件的 SQL 與時間正規化，格式錯誤時拋出 ValueError"""
+    sql, params = build_filter_sql(role="user", since="2024-01-01T00:00:00+08:00")
+    assert sql == " AND c.role = ? AND c.timestamp >= ?"
+    assert params == ["user", "2023-12-31 16:00:00"]
+    assert build_filter_sql() == ("", [])
+    with pytest.raises(ValueError):
+        build_filter_sql(until="yesterday")
+
+
+def test_filter_ids_keeps_order(conn):
+    """測試篩選後保留原本的順序"""
+    sql, params = build_filter_sql(session_id="a")
+    assert filter_ids(conn, [5, 4, 3, 2, 1], sql, params) == [5, 2, 1]
+    assert filter_ids(conn, [3, 1], "", []) == [3, 1]
+
+
+def test_lexical_ranking_with_filters(conn):
+    """測試英文依 BM25、中文依命中次數排序，並套用篩選條件"""
+    assert lexical_ranking(conn, "database", 10)[0] == 3
+    sql, params = build_filter_sql(role="assistant")
+    assert lexical_ranking(conn, "database", 10, sql, params) == [2]
+    assert lexical_ranking(conn, "資料庫", 10) == [4, 5]
+    sql, params = build_filter_sql(since="2024-03-01")
+    assert lexical_ranking(conn, "資料庫", 10, sql, params) == [5]
+    # 單一中文字無法以索引回答，改用 LIKE
+    assert lexical_ranking(conn, "庫", 1) == [5]
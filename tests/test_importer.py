@@ -0,0 +1,172 @@
+import json
+import sqlite3
+
+import pytest
+
+from src.storage.cjk_index import search_cjk_index
+from src.storage.importer import (
+    import_jsonl,
+    load_checkpoint,
+    main as importer_main,
+    map_record,
+)
+
+
+@pytest.fixture
+def conn():
+    """全新的資料庫，由匯入程序建立資料表"""
+    connection = sqlite3.connect(":memory:")
+    yield connection
+    connection.close()
+
+
+def write_jsonl(path, records):
+    with open(path, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(
+                (
+                    record
+                    if isinstance(record, str)
+                    else json.dumps(record, ensure_ascii=False)
+                )
+                + "\n"
+            )
+
+
+def test_map_record_common_formats():
+    """測試常見匯出格式的欄位對應"""
+    assert map_record(
+        {"author": {"role": "user"}, "content": {"parts": ["a", "b"]}, "create_time": 0}
+    ) == {
+        "role": "user",
+        "content": "a\nb",
+        "timestamp": 0,
+    }
+    assert map_record(
+        {"sender": "assistant", "text": [{"type": "text", "text": "hi"}]}
+    ) == {
+        "role": "assistant",
+        "content": "hi",
+    }
+    assert map_record(
+        {"role": "user", "content": "x", "id": 7, "metadata": {"k": 1}}, keep_extra=True
+    ) == {
+        "role": "user",
+        "content": "x",
+        "metadata": {"id": 7, "k": 1},
+    }
+    assert map_record("not an object") == "not an object"
+
+
+def test_import_jsonl_maps_fields_and_reports_errors(conn, tmp_path):
+    """測試匯入時對應欄位、保留原始時間並回報錯誤行的位置"""
+    path = tmp_path / "history.jsonl"
+    write_jsonl(
+        path,
+        [
+            {
+                "role": "user",
+                "content": "匯入的中文對話",
+                "timestamp": "2023-01-01T00:00:00",
+            },
+            "not json",
+            "",
+            {"speaker": "assistant", "message": "reply", "meta": {"session_id": "s1"}},
+            {"role": "user"},
+        ],
+    )
+
+    stats = import_jsonl(conn, str(path), batch_size=2)
+    assert (stats["imported"], stats["rows"], stats["errors"]) == (2, 2, 2)
+    assert stats["offset"] == path.stat().st_size
+    assert [error["offset"] for error in stats["error_samples"]] == [
+        len(
+            json.dumps(
+                {
+                    "role": "user",
+                    "content": "匯入的中文對話",
+                    "timestamp": "2023-01-01T00:00:00",
+                },
+                ensure_ascii=False,
+            ).encode()
+        )
+        + 1,
+        path.read_bytes().rindex(b'{"role": "user"}'),
+    ]
+
+    rows = conn.execute(
+        "SELECT role, content, timestamp, session_id FROM conversations ORDER BY id"
+    ).fetchall()
+    assert rows[0][:3] == ("user", "匯入的中文對話", "2023-01-01 00:00:00")
+    assert rows[1][0] == "assistant" and rows[1][3] == "s1"
+    assert len(search_cjk_index(conn, "中文")) == 1
+
+
+def test_import_resumes_from_checkpoint(conn, tmp_path):
+    """測試中斷後從最後提交的位置繼續，且不會重複寫入"""
+    path = tmp_path / "history.jsonl"
+    write_jsonl(path, [{"role": "user", "content": f"row {i}"} for i in range(10)])
+    conn.execute(
+        "CREATE TABLE conversations (id INTEGER PRIMARY KEY AUTOINCREMENT, role TEXT NOT NULL, "
+        "content TEXT NOT NULL, timestamp DATETIME DEFAULT CURRENT_TIMESTAMP, metadata TEXT)"
+    )
+    conn.execute(
+        "CREATE TRIGGER crash BEFORE INSERT ON conversations WHEN new.content = 'row 7' "
+        "BEGIN SELECT RAISE(ABORT, 'disk full'); END"
+    )
+
+    with pytest.raises(sqlite3.IntegrityError):
+        import_jsonl(conn, str(path), batch_size=3)
+    offset, rows, _ = load_checkpoint(conn, str(path.resolve()))
+    assert rows == 6
+    assert conn.execute("SELECT COUNT(*) FROM conversations").fetchone()[0] == 6
+
+    conn.execute("DROP TRIGGER crash")
+    stats = import_jsonl(conn, str(path), batch_size=3)
+    assert stats["resumed_from"] == offset
+    assert (stats["imported"], stats["rows"]) == (4, 10)
+    contents = [
+        row[0] for row in conn.execute("SELECT content FROM conversations ORDER BY id")
+    ]
+    assert contents == [f"row {i}" for i in range(10)]
+
+    # 檔案附加新行後再次執行，只匯入新增的部分
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"role": "user", "content": "appended"}) + "\n")
+    assert import_jsonl(conn, str(path))["imported"] == 1
+    assert import_jsonl(conn, str(path))["imported"] == 0
+
+
+def test_import_into_sqlalchemy_schema(tmp_path):
+    """測試匯入 SQLAlchemy 模型結構的資料庫時寫入 extra_metadata 與時間"""
+    connection = sqlite3.connect(":memory:")
+    connection.execute(
+        "CREATE TABLE conversations (id INTEGER PRIMARY KEY, timestamp DATETIME, role VARCHAR(50), "
+        "content TEXT, extra_metadata JSON)"
+    )
+    path = tmp_path / "history.jsonl"
+    write_jsonl(path, [{"role": "user", "content": "x", "metadata": {"k": "v"}}])
+
+    assert import_jsonl(connection, str(path))["imported"] == 1
+    timestamp, metadata = connection.execute(
+        "SELECT timestamp, extra_metadata FROM conversations"
+    ).fetchone()
+    assert timestamp is not None
+    assert json.loads(metadata) == {"k": "v"}
+    connection.close()
+
+
+def test_importer_cli(tmp_path, capsys):
+    """測試命令列以自訂欄位匯入並輸出速率"""
+    database = tmp_path / "conversations.db"
+    path = tmp_path / "history.jsonl"
+    write_jsonl(path, [{"who": "user", "body": {"text": "cli row"}}])
+
+    importer_main([str(database), str(path), "--role-field", "who", "--quiet"])
+    assert "本次匯入 1 筆對話" in capsys.readouterr().out
+
+    connection = sqlite3.connect(database)
+    assert connection.execute("SELECT role, content FROM conversations").fetchall() == [
+        ("user", "cli row")
+    ]
+    connection.close()
@@ -0,0 +1,120 @@
+import sqlite3
+
+import pytest
+
+from src.storage.migrations import (
+    MIGRATIONS,
+    current_version,
+    main as migrations_main,
+    migrate,
+)
+
+
+def create_conversations_table(conn, metadata_column="metadata"):
+    conn.execute(f"""
+        CREATE TABLE conversations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            {metadata_column} TEXT
+        )
+    """)
+
+
+def query_plan(conn, sql, params=()):
+    return " ".join(
+        row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+    )
+
+
+@pytest.fixture
+def conn():
+    """提供尚未遷移、已有資料的內存資料庫"""
+    connection = sqlite3.connect(":memory:")
+    create_conversations_table(connection)
+    connection.executemany(
+        "INSERT INTO conversations (role, content, metadata) VALUES (?, ?, ?)",
+        [
+            ("user", "hello", '{"session_id": "s1"}'),
+            ("assistant", "hi", '{"session_id": "s2"}'),
+            ("user", "plain", "not json"),
+        ],
+    )
+    yield connection
+    connection.close()
+
+
+def test_migrate_applies_all_versions_once(conn):
+    """測試依序套用所有版本，重複執行不會再套用"""
+    assert current_version(conn) == 0
+    assert migrate(conn) == [version for version, _, _ in MIGRATIONS]
+    assert current_version(conn) == MIGRATIONS[-1][0]
+    assert migrate(conn) == []
+
+
+def test_session_id_extracted_from_metadata(conn):
+    """測試 session_id 由 metadata 產生，非 JSON 的 metadata 不影響寫入"""
+    migrate(conn)
+    conn.execute(
+        "INSERT INTO conversations (role, content, metadata) VALUES ('user', 'later', '{\"session_id\": \"s1\"}')"
+    )
+    conn.execute(
+        "INSERT INTO conversations (role, content, metadata) VALUES ('user', 'bad', '{')"
+    )
+
+    rows = conn.execute(
+        "SELECT id FROM conversations WHERE session_id = 's1' ORDER BY id"
+    ).fetchall()
+    assert [row[0] for row in rows] == [1, 4]
+    assert conn.execute(
+        "SELECT session_id FROM conversations WHERE id = 3"
+    ).fetchone() == (None,)
+
+
+def test_queries_use_indexes(conn):
+    """測試依時間、角色與會話的查詢使用索引"""
+    migrate(conn)
+    assert "ix_conversations_timestamp_id" in query_plan(
+        conn, "SELECT * FROM conversations ORDER BY timestamp DESC LIMIT 10"
+    )
+    assert "ix_conversations_role_timestamp" in query_plan(
+        conn, "SELECT role, COUNT(*) FROM conversations GROUP BY role"
+    )
+    assert "ix_conversations_session_id" in query_plan(
+        conn,
+        "SELECT * FROM conversations WHERE session_id = ? ORDER BY timestamp DESC LIMIT 10",
+        ("s1",),
+    )
+
+
+def test_migrate_orm_schema():
+    """測試 SQLAlchemy 模型的 extra_metadata 欄位"""
+    connection = sqlite3.connect(":memory:")
+    create_conversations_table(connection, metadata_column="extra_metadata")
+    connection.execute(
+        "INSERT INTO conversations (role, content, extra_metadata) VALUES ('user', 'x', '{\"session_id\": \"orm\"}')"
+    )
+    migrate(connection)
+    assert connection.execute("SELECT session_id FROM conversations").fetchone() == (
+        "orm",
+    )
+    connection.close()
+
+
+def test_cli_upgrades_existing_database(tmp_path, capsys):
+    """測試命令列工具升級既有資料庫"""
+    db_path = str(tmp_path / "existing.db")
+    existing = sqlite3.connect(db_path)
+    create_conversations_table(existing)
+    existing.commit()
+    existing.close()
+
+    migrations_main([db_path])
+    migrations_main([db_path])
+    output = capsys.readouterr().out
+    assert output.count("已套用版本") == 1
+
+    conn = sqlite3.connect(db_path)
+    assert current_version(conn) == MIGRATIONS[-1][0]
+    conn.close()
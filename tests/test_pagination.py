@@ -0,0 +1,99 @@
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+from src.storage.fts import (
+    build_match_query,
+    build_search_sql,
+    install_fts,
+    search_params,
+)
+from src.storage.pagination import (
+    decode_cursor,
+    encode_cursor,
+    normalize_timestamp,
+    page_ids_by_time,
+)
+
+
+@pytest.fixture
+def conn():
+    """提供含同一時間多筆記錄的內存資料庫"""
+    connection = sqlite3.connect(":memory:")
+    connection.execute("""
+        CREATE TABLE conversations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            metadata TEXT
+        )
+    """)
+    install_fts(connection)
+    connection.executemany(
+        "INSERT INTO conversations (role, content, timestamp) VALUES ('user', ?, ?)",
+        [
+            ("paging row", "2024-01-01 00:00:00"),
+            ("paging row", "2024-01-02 00:00:00"),
+            ("paging row", "2024-01-02 00:00:00"),
+            ("paging row", "2024-01-03 00:00:00"),
+        ],
+    )
+    yield connection
+    connection.close()
+
+
+def test_cursor_round_trip():
+    """測試游標編碼與解碼，datetime 轉為 SQLite 儲存格式"""
+    cursor = encode_cursor(datetime(2024, 1, 2, 3, 4, 5), 42)
+    assert decode_cursor(cursor) == ("2024-01-02 03:04:05.000000", 42)
+    assert decode_cursor(encode_cursor("2024-01-02 03:04:05", 7)) == (
+        "2024-01-02 03:04:05",
+        7,
+    )
+
+
+def test_normalize_timestamp():
+    """測試時間格式正規化，帶時區的時間轉為 UTC"""
+    assert normalize_timestamp("2024-01-02") == "2024-01-02 00:00:00"
+    assert (
+        normalize_timestamp("2024-01-02T03:04:05.5+08:00")
+        == "2024-01-01 19:04:05.500000"
+    )
+    assert normalize_timestamp(0) == "1970-01-01 00:00:00"
+    for value in ("yesterday", True, None):
+        with pytest.raises(ValueError):
+            normalize_timestamp(value)
+
+
+@pytest.mark.parametrize("cursor", ["not-a-cursor", encode_cursor("x", 1)[:-2], "W10"])
+def test_invalid_cursor(cursor):
+    """測試格式錯誤的游標"""
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_page_ids_by_time(conn):
+    """測試候選記錄依 (timestamp, id) 由新到舊分頁，同一時間以 id 區分"""
+    first = page_ids_by_time(conn, [1, 2, 3, 4], 2)
+    assert first == [4, 3]
+    second = page_ids_by_time(conn, [1, 2, 3, 4], 2, ("2024-01-02 00:00:00", 3))
+    assert second == [2, 1]
+
+
+def test_fts_keyset_pages_do_not_overlap(conn):
+    """測試全文搜尋的 keyset 分頁，新寫入的記錄不影響後續頁面"""
+    sql = build_search_sql(["id", "timestamp"], order_by_time=True)
+    page = conn.execute(sql, search_params(build_match_query("paging"), 2)).fetchall()
+    assert [row[0] for row in page] == [4, 3]
+
+    conn.execute(
+        "INSERT INTO conversations (role, content) VALUES ('user', 'paging row')"
+    )
+    cursor = decode_cursor(encode_cursor(page[-1][1], page[-1][0]))
+    sql = build_search_sql(["id", "timestamp"], order_by_time=True, after_cursor=True)
+    page = conn.execute(
+        sql, search_params(build_match_query("paging"), 2, cursor=cursor)
+    ).fetchall()
+    assert [row[0] for row in page] == [2, 1]
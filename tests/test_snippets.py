@@ -0,0 +1,76 @@
+import sqlite3
+
+import pytest
+
+from src.storage.cjk_index import (
+    index_conversations,
+    install_cjk_index,
+    search_cjk_index,
+)
+from src.storage.snippets import ELLIPSIS, build_snippets, match_spans
+
+CONTENTS = {
+    1: "x" * 100 + " To migrate the Database, run the migration script. " + "y" * 100,
+    2: "先備份資料庫，再執行資料庫遷移",
+    3: "單字查詢：庫",
+}
+
+
+@pytest.fixture
+def conn():
+    """提供已建立倒排索引的內存資料庫"""
+    connection = sqlite3.connect(":memory:")
+    connection.execute(
+        "CREATE TABLE conversations (id INTEGER PRIMARY KEY, role TEXT, content TEXT)"
+    )
+    connection.executemany(
+        "INSERT INTO conversations VALUES (?, 'user', ?)", CONTENTS.items()
+    )
+    install_cjk_index(connection)
+    index_conversations(connection, CONTENTS.items())
+    yield connection
+    connection.close()
+
+
+def highlighted(content, spans):
+    return [content[start:end] for start, end in sorted(spans)]
+
+
+def test_match_spans_reads_term_positions_from_index(conn):
+    """測試英文查詢以前綴比對索引中的詞，位置對應原文（不分大小寫）"""
+    spans = match_spans(conn, "database migrat", [(1, CONTENTS[1])])
+    assert highlighted(CONTENTS[1], spans[1]) == ["migrate", "Database", "migration"]
+
+
+def test_match_spans_uses_cjk_offsets(conn):
+    """測試中文查詢使用 search_cjk_index 的起始位置；索引無法回答時在內容中尋找"""
+    offsets = search_cjk_index(conn, "資料庫")
+    spans = match_spans(conn, "資料庫", [(2, CONTENTS[2])], offsets)
+    assert highlighted(CONTENTS[2], spans[2]) == ["資料庫", "資料庫"]
+
+    spans = match_spans(conn, "庫", [(3, CONTENTS[3])])
+    assert highlighted(CONTENTS[3], spans[3]) == ["庫"]
+
+
+def test_build_snippets_windows_and_markers():
+    """測試片段只包含命中位置前後的文字，相鄰的命中合併，並受 max_snippets 限制"""
+    content = "a" * 50 + "hit" + "b" * 5 + "hit" + "c" * 50 + "hit" + "d" * 50
+    spans = [(50, 53), (58, 61), (111, 114)]
+    snippets = build_snippets(content, spans, context=4, start_mark="[", end_mark="]")
+    assert [snippet["text"] for snippet in snippets] == [
+        f"{ELLIPSIS}aaaa[hit]bbbbb[hit]cccc{ELLIPSIS}",
+        f"{ELLIPSIS}cccc[hit]dddd{ELLIPSIS}",
+    ]
+    assert snippets[0]["start"] == 46 and snippets[0]["end"] == 65
+
+    assert len(build_snippets(content, spans, context=4, max_snippets=1)) == 1
+    assert build_snippets("short hit", [(6, 9)], context=40) == [
+        {"start": 0, "end": 9, "text": "short <mark>hit</mark>"}
+    ]
+
+
+def test_build_snippets_without_matches_returns_prefix():
+    """測試沒有命中位置時返回內容開頭"""
+    assert build_snippets("abcdefgh", [], context=2) == [
+        {"start": 0, "end": 4, "text": f"abcd{ELLIPSIS}"}
+    ]
@@ -0,0 +1,174 @@
+import json
+
+import pytest
+from starlette.websockets import WebSocketDisconnect
+
+from src.events import decode_message, encode_frame, encode_frame_for
+from src.functions import server
+from src.functions.server import EventManager
+
+
+def conversation_event(id, session_id):
+    return {
+        "id": id,
+        "type": "new_conversation",
+        "data": {
+            "id": id,
+            "role": "user",
+            "extra_metadata": {"session_id": session_id},
+        },
+    }
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    """每個測試使用新的事件管理器"""
+    monkeypatch.setattr(server, "event_manager", EventManager())
+    return server.event_manager
+
+
+def broadcast(ws, event):
+    """在應用程式的事件迴圈中廣播事件"""
+    ws.portal.call(server.event_manager.broadcast, event)
+
+
+def test_encode_frame_for_strips_sse_framing():
+    """測試 SSE 訊息轉為 JSON 文字或 MessagePack，內容相同"""
+    msgpack = pytest.importorskip("msgpack")
+    event = conversation_event(7, "s1")
+    frame = encode_frame(event, 7)
+    assert json.loads(encode_frame_for(frame, "json"))["id"] == 7
+    assert msgpack.unpackb(encode_frame_for(frame, "msgpack")) == json.loads(
+        encode_frame_for(frame, "json")
+    )
+
+
+def test_decode_message_rejects_non_objects():
+    """測試控制訊息必須是物件"""
+    assert decode_message('{"op": "ping"}') == {"op": "ping"}
+    with pytest.raises(ValueError):
+        decode_message("[1, 2]")
+    with pytest.raises(ValueError):
+        decode_message("not json")
+
+
+def test_decode_message_accepts_msgpack():
+    """測試二進位控制訊息以 MessagePack 解碼"""
+    msgpack = pytest.importorskip("msgpack")
+    assert decode_message(msgpack.packb({"op": "ack", "id": 3})) == {
+        "op": "ack",
+        "id": 3,
+    }
+
+
+def test_websocket_receives_filtered_events_and_resubscribes(client, manager):
+    """測試連線中以 subscribe 更換篩選條件，不必重新連線"""
+    with client.websocket_connect("/api/events/ws?session_id=s1") as ws:
+        assert ws.receive_json() == {"type": "connected"}
+        broadcast(ws, conversation_event(1, "s2"))
+        broadcast(ws, conversation_event(2, "s1"))
+        assert ws.receive_json()["id"] == 2
+
+        ws.send_json({"op": "subscribe", "session_id": "s2"})
+        assert ws.receive_json() == {
+            "type": "subscribed",
+            "filters": {"metadata.session_id": "s2"},
+        }
+        broadcast(ws, conversation_event(3, "s1"))
+        broadcast(ws, conversation_event(4, "s2"))
+        assert ws.receive_json()["id"] == 4
+
+        ws.send_json({"op": "unsubscribe"})
+        assert ws.receive_json() == {"type": "unsubscribed"}
+        assert len(manager.clients) == 0
+        broadcast(ws, conversation_event(5, "s2"))
+
+        ws.send_json({"op": "subscribe", "session_id": "s2"})
+        assert ws.receive_json()["type"] == "subscribed"
+        broadcast(ws, conversation_event(6, "s2"))
+        assert ws.receive_json()["id"] == 6
+
+
+def test_websocket_subscribe_replays_from_last_event_id(client, manager):
+    """測試 subscribe 帶 last_event_id 時補送緩衝區中符合新條件的事件"""
+    with client.websocket_connect("/api/events/ws?session_id=none") as ws:
+        assert ws.receive_json() == {"type": "connected"}
+        for i in range(1, 5):
+            broadcast(ws, conversation_event(i, f"s{i % 2}"))
+        ws.send_json({"op": "subscribe", "session_id": "s1", "last_event_id": 1})
+        assert ws.receive_json()["type"] == "subscribed"
+        assert ws.receive_json()["id"] == 3
+
+
+def test_websocket_msgpack_encoding(client, manager):
+    """測試 encoding=msgpack 時以二進位訊息送出，控制訊息也可用 MessagePack"""
+    msgpack = pytest.importorskip("msgpack")
+    with client.websocket_connect("/api/events/ws?encoding=msgpack") as ws:
+        assert msgpack.unpackb(ws.receive_bytes()) == {"type": "connected"}
+        broadcast(ws, conversation_event(1, "s1"))
+        assert msgpack.unpackb(ws.receive_bytes())["id"] == 1
+        ws.send_bytes(msgpack.packb({"op": "ping"}))
+        assert msgpack.unpackb(ws.receive_bytes()) == {"type": "pong"}
+
+
+def test_websocket_window_pauses_until_ack(client, manager):
+    """測試未確認的事件達到 window 時暫停送出，ack 後繼續"""
+    with client.websocket_connect("/api/events/ws?window=2") as ws:
+        assert ws.receive_json() == {"type": "connected"}
+        for i in range(1, 6):
+            broadcast(ws, conversation_event(i, "s1"))
+        assert [ws.receive_json()["id"] for _ in range(2)] == [1, 2]
+        # 暫停期間其餘事件留在訂閱者緩衝區
+        ws.send_json({"op": "ping"})
+        assert ws.receive_json() == {"type": "pong"}
+        assert manager.clients[0].depth == 3
+
+        ws.send_json({"op": "ack", "id": 2})
+        assert [ws.receive_json()["id"] for _ in range(2)] == [3, 4]
+        ws.send_json({"op": "ack", "id": "x"})
+        assert ws.receive_json()["type"] == "error"
+
+
+def test_websocket_batches_events(client, manager):
+    """測試 batch_ms 時連續的對話事件合併成一則 new_conversations 訊息"""
+    with client.websocket_connect("/api/events/ws?batch_ms=50") as ws:
+        assert ws.receive_json() == {"type": "connected"}
+        ws.portal.call(
+            _broadcast_many, [conversation_event(i, "s1") for i in range(1, 4)]
+        )
+        message = ws.receive_json()
+        assert message["type"] == "new_conversations"
+        assert [event["id"] for event in message["events"]] == [1, 2, 3]
+
+
+async def _broadcast_many(events):
+    for event in events:
+        await server.event_manager.broadcast(event)
+
+
+@pytest.mark.parametrize(
+    "query",
+    ["encoding=xml", "overflow=unknown", "window=-1", "batch_ms=0", "metadata=bad"],
+)
+def test_websocket_rejects_invalid_parameters(client, manager, query):
+    """測試參數錯誤時以 1008 關閉連線"""
+    with pytest.raises(WebSocketDisconnect) as excinfo:
+        with client.websocket_connect(f"/api/events/ws?{query}") as ws:
+            ws.receive_json()
+    assert excinfo.value.code == 1008
+
+
+def test_websocket_unsubscribed_connection_counts_toward_limit(client, monkeypatch):
+    """測試 unsubscribe 後連線仍計入上限，關閉後才釋放"""
+    manager = EventManager(max_connections=1)
+    monkeypatch.setattr(server, "event_manager", manager)
+    with client.websocket_connect("/api/events/ws") as ws:
+        assert ws.receive_json() == {"type": "connected"}
+        ws.send_json({"op": "unsubscribe"})
+        assert ws.receive_json() == {"type": "unsubscribed"}
+        assert manager.connections == 1 and manager.stats()["paused_clients"] == 1
+
+        with pytest.raises(WebSocketDisconnect) as excinfo:
+            with client.websocket_connect("/api/events/ws") as other:
+                other.receive_json()
+        assert excinfo.value.code == 1013